@@ -1,12 +1,25 @@
 import os
+import json
 import time
+import uuid
 import traceback
 from dotenv import load_dotenv
-from flask import Flask, render_template, request, jsonify
+from flask import Blueprint, Flask, Response, current_app, render_template, request, jsonify, g, stream_with_context
 from werkzeug.utils import secure_filename
 
-from reg.loader import load_file_to_vectorstore
-from reg.chain import build_qa_chain
+from reg.index_store import get_index_store
+from reg.registry import get_registry, valid_collection_id
+from reg.jobs import get_job_queue
+from reg.chain import answer_within_budget, route_query, stream_answer
+from reg.answer_cache import get_answer_cache
+from reg.batch import answer_batch, batch_max_questions
+from reg.clients import connection_stats
+from reg.federated import federated_enabled, federated_search, get_federated
+from reg.hybrid import hybrid_search, retriever_mode, vector_search_ids
+from reg.loader import describe_index, search_params
+from reg.latency import StageTimer
+from reg.lazy import import_report
+from reg.metrics import REQUEST_SECONDS, get_metrics
 
 load_dotenv()
 
@@ -14,18 +27,111 @@ if os.getenv("OPENROUTER_API_KEY") and not os.getenv("OPENAI_API_KEY"):
     os.environ["OPENAI_API_KEY"] = os.environ.get("OPENROUTER_API_KEY")
     os.environ["OPENAI_API_BASE"] = os.environ.get("OPENAI_API_BASE", "https://openrouter.ai/api/v1")
 
-app = Flask(__name__, static_url_path="/", static_folder=".")
+bp = Blueprint("querify", __name__)
 
-vectorstore = None
-qa_chain = None
+registry = get_registry()
+jobs = get_job_queue()
 
-@app.route("/")
+SESSION_COOKIE = "querify_session"
+
+
+def create_app() -> Flask:
+    """Application factory.
+
+    `flask run` and `python app.py` use it for development; production runs
+    it under gunicorn with `gunicorn -c gunicorn.conf.py`. Each worker
+    process builds its own app and registry, and they share collections
+    through the versioned on-disk store.
+    """
+    app = Flask(__name__, static_url_path="/", static_folder=".")
+    app.register_blueprint(bp)
+
+    # Optionally page recently used cached indexes into memory before serving
+    if os.getenv("INDEX_CACHE_WARM", "").lower() in ("1", "true", "yes"):
+        try:
+            get_index_store().warm()
+        except Exception as e:
+            app.logger.warning("Index cache warm-up failed: %s", e)
+    return app
+
+def _session_id() -> str:
+    sid = request.cookies.get(SESSION_COOKIE)
+    if not valid_collection_id(sid):
+        sid = uuid.uuid4().hex
+        g.new_session_id = sid
+    return sid
+
+
+def _collection_id(payload=None):
+    """Resolve the target collection: explicit id if given, else the caller's session."""
+    cid = (
+        request.args.get("collection")
+        or request.form.get("collection")
+        or request.headers.get("X-Collection-Id")
+        or (payload.get("collection") if isinstance(payload, dict) else None)
+    )
+    return cid or "session-" + _session_id()
+
+
+def _profiling() -> bool:
+    """Per-request profiling: ?profile=1, an X-Profile: 1 header, or PROFILE_REQUESTS=1."""
+    flag = request.args.get("profile") or request.headers.get("X-Profile") or os.getenv("PROFILE_REQUESTS", "")
+    return flag.lower() in ("1", "true", "yes")
+
+
+@bp.before_app_request
+def _start_request_timer():
+    # spans opened while handling the request record into this timer
+    g.timer = StageTimer()
+    g.timer_scope = g.timer.activate()
+    g.timer_scope.__enter__()
+
+
+@bp.after_app_request
+def _record_request(response):
+    timer = g.get("timer")
+    if timer is None:
+        return response
+    REQUEST_SECONDS.observe(
+        time.perf_counter() - timer.started,
+        endpoint=request.endpoint or "unmatched",
+        method=request.method,
+        status=str(response.status_code),
+    )
+    # streamed bodies are produced after this hook, so there is nothing to report yet
+    if _profiling() and not response.is_streamed:
+        response.headers["Server-Timing"] = timer.server_timing()
+        body = response.get_json(silent=True) if response.is_json else None
+        if isinstance(body, dict):
+            body["profile"] = timer.as_dict()
+            response.set_data(current_app.json.dumps(body))
+    return response
+
+
+@bp.teardown_app_request
+def _stop_request_timer(exc):
+    scope = g.pop("timer_scope", None)
+    if scope is not None:
+        scope.__exit__(None, None, None)
+
+
+@bp.after_app_request
+def _set_session_cookie(response):
+    sid = g.pop("new_session_id", None)
+    if sid:
+        response.set_cookie(SESSION_COOKIE, sid, httponly=True, samesite="Lax")
+    return response
+
+
+@bp.route("/")
 def index():
     return render_template("index.html")
 
-@app.route("/upload", methods=["POST"])
+@bp.route("/upload", methods=["POST"])
 def upload_file():
-    global vectorstore, qa_chain
+    collection_id = _collection_id()
+    if not valid_collection_id(collection_id):
+        return jsonify({"error": "Invalid collection id."}), 400
 
     if "file" not in request.files:
         return jsonify({"error": "No file part in request"}), 400
@@ -34,30 +140,71 @@ def upload_file():
     if file.filename == "":
         return jsonify({"error": "No selected file"}), 400
 
-    os.makedirs(os.path.join("data", "pdfs"), exist_ok=True)
+    upload_dir = os.path.join("data", "pdfs", collection_id)
+    os.makedirs(upload_dir, exist_ok=True)
     filename = secure_filename(file.filename)
-    path = os.path.join("data/pdfs", filename)
+    path = os.path.join(upload_dir, filename)
     file.save(path)
 
-    vectorstore = load_file_to_vectorstore(path)
-    qa_chain = build_qa_chain(vectorstore)
-    
-    welcome_message = f"✓ Welcome! '{filename}' has been loaded successfully. You can now ask questions about it."
-
-    return jsonify({"status": "file processed successfully", "initial_reply": welcome_message, "filename": filename})
-
-@app.route("/chat", methods=["POST"])
+    def ingest(job):
+        collection, changes = registry.add_file(collection_id, path, progress=job.update)
+        welcome_message = f"✓ Welcome! '{filename}' has been loaded successfully. You can now ask questions about it."
+        return {
+            "status": "file processed successfully",
+            "initial_reply": welcome_message,
+            "filename": filename,
+            # chunks embedded, deleted and left untouched by this upload
+            "changes": changes,
+            **collection.to_dict(),
+        }
+
+    job = jobs.submit(ingest, description=filename)
+    return jsonify({
+        "status": "queued",
+        "job_id": job.id,
+        "filename": filename,
+        "collection": collection_id,
+    }), 202
+
+
+@bp.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    """Report stage, chunk count and elapsed time of an ingestion job."""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job id."}), 404
+    return jsonify(job.to_dict())
+
+def _cached_answer(collection, query):
+    """Look up an answer for this collection version; returns (answer, vector)."""
+    cache = get_answer_cache()
+    if cache is None:
+        return None, None
+    embedding_function = collection.vectorstore.embedding_function
+    embed = getattr(embedding_function, "embed_query", embedding_function)
+    return cache.lookup(collection.id, collection.version, query, embed)
+
+
+def _store_answer(collection, query, answer, vector):
+    cache = get_answer_cache()
+    if cache is not None:
+        cache.put(collection.id, collection.version, query, answer, vector)
+
+
+@bp.route("/chat", methods=["POST"])
 def chat():
-    global qa_chain
-    if qa_chain is None:
-        return jsonify({"error": "No file processed. POST /upload with a file first."}), 400
-
     # accept either `message` or `query` from the client
     try:
         payload = request.get_json(force=True)
     except Exception:
         payload = request.json if request.json else {}
 
+    collection_id = _collection_id(payload)
+    collection = registry.snapshot(collection_id) if valid_collection_id(collection_id) else None
+    if collection is None:
+        return jsonify({"error": "No file processed. POST /upload with a file first."}), 400
+    qa_chain = collection.qa_chain
+
     query = None
     if isinstance(payload, dict):
         query = payload.get("message") or payload.get("query")
@@ -65,49 +212,164 @@ def chat():
     if not query:
         return jsonify({"error": "Missing `message` in request body."}), 400
 
+    timer = g.timer
+    # greetings and the like: no embedding, retrieval or LLM call
+    with timer.stage("route"):
+        routed = route_query(qa_chain, query)
+    if routed is not None:
+        text, info = routed
+        return _timed_json({"response": text, **info}, timer)
+
+    with timer.stage("answer_cache"):
+        cached, query_vector = _cached_answer(collection, query)
+    if cached is not None:
+        return _timed_json({"response": cached, "cached": True}, timer)
+
     try:
-        # run the QA chain with server-side retries to avoid transient failures
-        import time, traceback
-
-        last_exc = None
-        last_tb = None
-        for attempt in range(1, 4):
-            try:
-                result = qa_chain.run(query)
-                # If retrieval chains sometimes return dicts, try to pick useful fields
-                if isinstance(result, dict):
-                    text = result.get("answer") or result.get("result") or str(result)
-                else:
-                     text = str(result)
-
-                # treat empty/placeholder responses as transient
-                if text and text.strip() and text.strip().lower() not in ("none", "n/a", "not found", ""):
-                    return jsonify({"response": text})
-
-                last_exc = Exception("Empty response from QA chain")
-                last_tb = traceback.format_exc()
-                time.sleep(0.25 * attempt)
-                continue
-
-            except Exception as e:
-                last_exc = e
-                last_tb = traceback.format_exc()
-                app.logger.warning("qa_chain.run attempt %s failed: %s", attempt, e)
-                time.sleep(0.25 * attempt)
-                continue
-
-        # all retries failed
-        app.logger.error("/chat: all retries failed. last error: %s", last_exc)
-        return jsonify({"error": "Server error while processing the query.", "detail": str(last_exc), "trace": last_tb}), 500
+        text, info = answer_within_budget(qa_chain, query, timer=timer)
     except Exception as e:
-        # include traceback to help debugging (safe in local dev)
-        import traceback
         tb = traceback.format_exc()
-        app.logger.error("Error in /chat: %s", tb)
+        current_app.logger.error("Error in /chat: %s", tb)
         return jsonify({"error": "Server error while processing the query.", "detail": str(e), "trace": tb}), 500
 
+    # degraded answers are not cached, so the next request tries the LLM again
+    if not info.get("degraded"):
+        _store_answer(collection, query, text, query_vector)
+    current_app.logger.info("/chat %s %s", " ".join(f"{k}={v}s" for k, v in timer.as_dict().items()), info)
+    return _timed_json({"response": text, **info}, timer)
+
+
+def _timed_json(body: dict, timer: StageTimer) -> Response:
+    """JSON response carrying per-stage timings in the body and a Server-Timing header."""
+    response = jsonify({**body, "timings": timer.as_dict()})
+    response.headers["Server-Timing"] = timer.server_timing()
+    return response
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 
-@app.route("/profile", methods=["GET", "POST"])
+@bp.route("/chat/stream", methods=["POST"])
+def chat_stream():
+    """Stream retrieval results and answer tokens as Server-Sent Events.
+
+    Events: `retrieval` (chunk count and sources), `token` (answer text),
+    `fallback` (the LLM failed and the extractive answer follows), `done`
+    (timings, including time to first token) and `error`.
+    """
+    started = time.perf_counter()
+    try:
+        payload = request.get_json(force=True)
+    except Exception:
+        payload = {}
+
+    collection_id = _collection_id(payload)
+    collection = registry.snapshot(collection_id) if valid_collection_id(collection_id) else None
+    if collection is None:
+        return jsonify({"error": "No file processed. POST /upload with a file first."}), 400
+
+    query = payload.get("message") or payload.get("query") if isinstance(payload, dict) else None
+    if not query:
+        return jsonify({"error": "Missing `message` in request body."}), 400
+
+    qa_chain = collection.qa_chain
+
+    def generate():
+        ttft = None
+        routed = route_query(qa_chain, query)
+        if routed is not None:
+            total = time.perf_counter() - started
+            yield _sse("token", routed[0])
+            yield _sse("done", {"ttft": round(total, 4), "total": round(total, 4), "intent": routed[1]["intent"]})
+            return
+        cached, query_vector = _cached_answer(collection, query)
+        if cached is not None:
+            total = time.perf_counter() - started
+            yield _sse("token", cached)
+            yield _sse("done", {"ttft": round(total, 4), "total": round(total, 4), "cached": True})
+            return
+
+        answer = []
+        fell_back = False
+        try:
+            for event, data in stream_answer(qa_chain, query):
+                if event == "token":
+                    if ttft is None:
+                        ttft = time.perf_counter() - started
+                    answer.append(data)
+                elif event == "fallback":
+                    fell_back = True
+                yield _sse(event, data)
+        except Exception as e:
+            current_app.logger.error("Error in /chat/stream: %s", traceback.format_exc())
+            yield _sse("error", {"error": "Server error while processing the query.", "detail": str(e)})
+            return
+        if answer and not fell_back:
+            _store_answer(collection, query, "".join(answer), query_vector)
+        total = time.perf_counter() - started
+        current_app.logger.info("/chat/stream ttft=%.3fs total=%.3fs", ttft or total, total)
+        yield _sse("done", {"ttft": round(ttft or total, 4), "total": round(total, 4)})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@bp.route("/chat/batch", methods=["POST"])
+def chat_batch():
+    """Answer a list of questions, streaming one JSON line per answer as it completes.
+
+    Body: {"questions": [...], "concurrency": n}. Each line carries the
+    question's `index` in the list; a last `{"done": true, ...}` line
+    reports the count and total time.
+    """
+    started = time.perf_counter()
+    try:
+        payload = request.get_json(force=True)
+    except Exception:
+        payload = {}
+
+    collection_id = _collection_id(payload)
+    collection = registry.snapshot(collection_id) if valid_collection_id(collection_id) else None
+    if collection is None:
+        return jsonify({"error": "No file processed. POST /upload with a file first."}), 400
+
+    questions = payload.get("questions") if isinstance(payload, dict) else None
+    if not isinstance(questions, list) or not questions or not all(isinstance(q, str) and q.strip() for q in questions):
+        return jsonify({"error": "`questions` must be a non-empty list of strings."}), 400
+    if len(questions) > batch_max_questions():
+        return jsonify({"error": f"At most {batch_max_questions()} questions per batch."}), 400
+    try:
+        concurrency = int(payload.get("concurrency") or 0) or None
+    except (TypeError, ValueError):
+        return jsonify({"error": "`concurrency` must be an integer."}), 400
+
+    def generate():
+        answered = failed = 0
+        try:
+            for result in answer_batch(collection, questions, concurrency):
+                answered += 1
+                failed += "error" in result
+                yield json.dumps(result) + "\n"
+        except Exception as e:
+            current_app.logger.error("Error in /chat/batch: %s", traceback.format_exc())
+            yield json.dumps({"error": "Server error while processing the batch.", "detail": str(e)}) + "\n"
+            return
+        total = time.perf_counter() - started
+        current_app.logger.info("/chat/batch questions=%d failed=%d total=%.3fs", answered, failed, total)
+        yield json.dumps({"done": True, "answered": answered, "failed": failed, "total": round(total, 4)}) + "\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@bp.route("/profile", methods=["GET", "POST"])
 def profile():
     """Handle user profile operations"""
     if request.method == "POST":
@@ -129,15 +391,20 @@ def profile():
         return jsonify({"status": "success", "message": "Profile endpoint ready"}), 200
 
 
-@app.route("/debug_retrieval", methods=["GET"])
+@bp.route("/debug_retrieval", methods=["GET"])
 def debug_retrieval():
     """Debug endpoint: returns top-k retrieved chunks for a query.
 
-    Usage: GET /debug_retrieval?query=...&k=5
+    Usage: GET /debug_retrieval?query=...&k=5[&collection=...][&mode=vector|hybrid]
+    [&nprobe=N][&ef_search=N] to override the ANN search breadth for this query.
+    [&federated=1] searches the per-source shards (default: FEDERATED_SEARCH);
+    [&source=a.pdf,b.txt] (or repeated) only searches those sources' shards.
     """
-    global vectorstore
-    if vectorstore is None:
+    collection_id = _collection_id()
+    collection = registry.snapshot(collection_id) if valid_collection_id(collection_id) else None
+    if collection is None:
         return jsonify({"error": "No vectorstore ready. Upload a document first."}), 400
+    vectorstore = collection.vectorstore
 
     q = request.args.get("query")
     if not q:
@@ -148,7 +415,39 @@ def debug_retrieval():
     except Exception:
         k = 5
 
+    mode = retriever_mode(request.args.get("mode"))
+    nprobe = request.args.get("nprobe", type=int)
+    ef_search = request.args.get("ef_search", type=int)
+    sources = [name for value in request.args.getlist("source") for name in value.split(",") if name] or None
+    federated = request.args.get("federated")
+    federated = federated_enabled() if federated is None else federated.lower() in ("1", "true", "yes")
+    params = search_params(vectorstore.index, nprobe=nprobe, ef_search=ef_search)
+    index = describe_index(vectorstore.index)
+
     try:
+        if federated or sources is not None:
+            shards = get_federated(vectorstore)
+            items = [
+                {"score": float(score), "source": (doc.metadata or {}).get("source"), "text": doc.page_content}
+                for doc, score in federated_search(vectorstore, q, k, sources, mode, nprobe, ef_search)
+            ]
+            searched = [shard.source for shard in shards.select(sources)]
+            return jsonify({"query": q, "mode": mode, "index": shards.describe(), "sources": searched, "results": items})
+
+        if mode == "hybrid":
+            items = [
+                {"score": float(score), "text": getattr(doc, 'page_content', str(doc))}
+                for doc, score in hybrid_search(vectorstore, q, k, params=params)
+            ]
+            return jsonify({"query": q, "mode": mode, "index": index, "results": items})
+
+        if params is not None:
+            items = [
+                {"score": score, "text": vectorstore.docstore.search(doc_id).page_content}
+                for doc_id, score in vector_search_ids(vectorstore, q, k, params)
+            ]
+            return jsonify({"query": q, "mode": mode, "index": index, "results": items})
+
         # try similarity_search_with_score if available
         try:
             docs_with_scores = vectorstore.similarity_search_with_score(q, k=k)
@@ -159,12 +458,36 @@ def debug_retrieval():
             docs = vectorstore.as_retriever().get_relevant_documents(q)
             items = [{"score": None, "text": getattr(d, 'page_content', str(d))} for d in docs[:k]]
 
-        return jsonify({"query": q, "results": items})
+        return jsonify({"query": q, "mode": mode, "index": index, "results": items})
     except Exception as e:
         import traceback
         tb = traceback.format_exc()
-        app.logger.error("Error in /debug_retrieval: %s", tb)
+        current_app.logger.error("Error in /debug_retrieval: %s", tb)
         return jsonify({"error": "Retrieval failed.", "detail": str(e), "trace": tb}), 500
 
+@bp.route("/debug_answer_cache", methods=["GET"])
+def debug_answer_cache():
+    """Debug endpoint: answer cache hit/miss counters."""
+    cache = get_answer_cache()
+    if cache is None:
+        return jsonify({"enabled": False})
+    return jsonify(dict(cache.stats(), enabled=True))
+
+@bp.route("/metrics", methods=["GET"])
+def metrics():
+    """Prometheus scrape endpoint: span and request latency histograms, fallback counters."""
+    return Response(get_metrics().render(), mimetype="text/plain; version=0.0.4")
+
+@bp.route("/debug_imports", methods=["GET"])
+def debug_imports():
+    """Heavy dependencies this worker has loaded, and the import times reg.lazy recorded."""
+    return jsonify(import_report())
+
+
+@bp.route("/debug_connections", methods=["GET"])
+def debug_connections():
+    """Debug endpoint: connection reuse of the shared LLM/embeddings HTTP client."""
+    return jsonify(connection_stats())
+
 if __name__ == "__main__":
-    app.run(debug=True)
+    create_app().run(debug=os.getenv("FLASK_DEBUG", "1").lower() in ("1", "true", "yes"), threaded=True)
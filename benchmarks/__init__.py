@@ -0,0 +1 @@
+# empty file
\ No newline at end of file
@@ -0,0 +1,113 @@
+"""Build time, memory, latency and recall of the ANN index types vs flat.
+
+Vectors are drawn from a Gaussian mixture in a low-dimensional latent space
+and projected up to `--dim`, which gives them the clustered, low intrinsic
+dimension structure of real embeddings; isotropic noise in 384 dimensions
+would make every neighbour roughly equidistant. Each index type from
+`reg.loader.build_index` is built over the corpus, then searched one query
+at a time at several nprobe/efSearch settings; recall@k is measured
+against the exact flat index.
+
+    python benchmarks/bench_ann_index.py --vectors 200000 --dim 384 --queries 500
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import faiss
+
+from reg.loader import build_index, describe_index, search_params
+
+SWEEP = {
+    "flat": [None],
+    "ivf_flat": [4, 16, 64],
+    "ivf_pq": [4, 16, 64],
+    "hnsw": [32, 64, 128],
+}
+
+
+def make_vectors(n, dim, clusters, latent, rng):
+    # fixed seeds so corpus and queries share the same clusters and projection
+    projection = np.random.default_rng(1).standard_normal((latent, dim)).astype(np.float32)
+    centers = np.random.default_rng(2).standard_normal((clusters, latent)).astype(np.float32)
+    z = centers[rng.integers(0, clusters, n)] + 0.5 * rng.standard_normal((n, latent)).astype(np.float32)
+    x = z @ projection + 0.05 * np.sqrt(latent) * rng.standard_normal((n, dim)).astype(np.float32)
+    x /= np.linalg.norm(x, axis=1, keepdims=True)
+    return x
+
+
+def timed_search(index, queries, k, params):
+    latencies = []
+    found = np.empty((len(queries), k), dtype=np.int64)
+    for i, q in enumerate(queries):
+        started = time.perf_counter()
+        if params is not None:
+            _, ids = index.search(q[None, :], k, params=params)
+        else:
+            _, ids = index.search(q[None, :], k)
+        latencies.append(time.perf_counter() - started)
+        found[i] = ids[0]
+    return found, np.asarray(latencies) * 1000
+
+
+def recall(found, truth):
+    return float(np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--vectors", type=int, default=200000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=256)
+    parser.add_argument("--latent", type=int, default=48, help="intrinsic dimension of the vectors")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--types", default="flat,ivf_flat,ivf_pq,hnsw")
+    parser.add_argument("--threads", type=int, default=1, help="FAISS OpenMP threads for search")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    corpus = make_vectors(args.vectors, args.dim, args.clusters, args.latent, rng)
+    queries = make_vectors(args.queries, args.dim, args.clusters, args.latent, rng)
+
+    truth = None
+    rows = []
+    for index_type in args.types.split(","):
+        faiss.omp_set_num_threads(os.cpu_count() or 1)
+        started = time.perf_counter()
+        index = build_index(corpus, index_type)
+        index.add(corpus)
+        build_seconds = time.perf_counter() - started
+        memory_mb = faiss.serialize_index(index).nbytes / 1e6
+
+        faiss.omp_set_num_threads(args.threads)
+        for breadth in SWEEP.get(index_type, [None]):
+            params = search_params(index, nprobe=breadth, ef_search=breadth)
+            found, latencies = timed_search(index, queries, args.k, params)
+            if truth is None:
+                if index_type != "flat":
+                    exact = faiss.IndexFlatL2(args.dim)
+                    exact.add(corpus)
+                    truth, _ = timed_search(exact, queries, args.k, None)
+                else:
+                    truth = found
+            rows.append({
+                "index": describe_index(index),
+                "breadth": breadth,
+                "build_seconds": round(build_seconds, 2),
+                "memory_mb": round(memory_mb, 1),
+                "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+                "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+                f"recall@{args.k}": round(recall(found, truth), 4),
+            })
+            print(json.dumps(rows[-1]), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""Throughput of the offline BasicEmbeddings on synthetic chunks.
+
+    python benchmarks/bench_basic_embeddings.py --chunks 100000 --dim 384
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reg.embeddings import BasicEmbeddings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=100000)
+    parser.add_argument("--words", type=int, default=200, help="words per chunk (~1200 chars)")
+    parser.add_argument("--dim", type=int, default=384)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    vocab = ["".join(rng.choice("abcdefghijklmnop") for _ in range(rng.randint(2, 9))) for _ in range(30000)]
+    texts = [" ".join(rng.choice(vocab) for _ in range(args.words)) for _ in range(args.chunks)]
+
+    embeddings = BasicEmbeddings(dim=args.dim)
+    started = time.perf_counter()
+    matrix = embeddings.embed_matrix(texts)
+    elapsed = time.perf_counter() - started
+
+    print(json.dumps({
+        "chunks": args.chunks,
+        "dim": args.dim,
+        "seconds": round(elapsed, 3),
+        "chunks_per_second": round(args.chunks / elapsed, 1),
+        "matrix_mb": round(matrix.nbytes / 1e6, 1),
+    }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Connections opened and latency: a new LLM client per chain vs the shared pool.
+
+Runs against the local mock OpenAI server (benchmarks/mock_openai.py). The
+"per-chain" mode builds a fresh ChatOpenAI for every call, the way
+build_qa_chain used to on each upload; "shared" uses reg.clients. The
+mock speaks plain HTTP, so the gap here is only TCP setup; against a
+real TLS endpoint each new connection also pays the handshake.
+
+    python benchmarks/bench_connection_reuse.py --calls 200
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.mock_openai import start_mock_server
+
+
+def run(mode, calls, stats):
+    from langchain_openai import ChatOpenAI
+    from reg.clients import get_chat_model
+
+    before = dict(stats)
+    latencies = []
+    for i in range(calls):
+        if mode == "shared":
+            llm = get_chat_model(max_retries=0)
+        else:
+            llm = ChatOpenAI(api_key=os.environ["OPENAI_API_KEY"], base_url=os.environ["OPENAI_API_BASE"], max_retries=0)
+        started = time.perf_counter()
+        llm.invoke(f"question {i}")
+        latencies.append(time.perf_counter() - started)
+    latencies = np.asarray(latencies) * 1000
+    return {
+        "mode": mode,
+        "calls": calls,
+        "connections": stats["connections"] - before["connections"],
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.0, help="mock server latency per request")
+    args = parser.parse_args()
+
+    server, url = start_mock_server(latency=args.latency, token_latency=0.0, answer_tokens=5)
+    os.environ["OPENAI_API_KEY"] = "mock"
+    os.environ["OPENAI_API_BASE"] = url
+    stats = server.RequestHandlerClass.config.counts
+
+    for mode in ("per-chain", "shared"):
+        print(json.dumps(run(mode, args.calls, stats)), flush=True)
+
+    from reg.clients import connection_stats
+    print(json.dumps({"shared_client": connection_stats()}))
+
+
+if __name__ == "__main__":
+    main()
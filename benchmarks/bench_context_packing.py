@@ -0,0 +1,119 @@
+"""Prompt tokens and LLM latency: plain "stuff" (k=5) vs the context builder.
+
+A synthetic document of filler paragraphs with planted facts ("The access
+code for project P17 is X-4821.") is chunked with the ingest splitter and
+indexed with BasicEmbeddings. Each question asks for one fact. The
+baseline stuffs the top 5 chunks into the QA prompt as build_qa_chain used
+to; the builder retrieves --fetch-k candidates, dedupes and reranks them
+and keeps up to --max-chunks within the token budget. For both, the benchmark reports
+prompt tokens, how often the fact-bearing chunk made it into the prompt,
+and LLM latency against the mock server with a per-prompt-token prefill
+cost (--prompt-token-latency).
+
+    python benchmarks/bench_context_packing.py --questions 50 --budget 1000
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.documents import Document
+from langchain_community.vectorstores import FAISS
+
+from benchmarks.mock_openai import start_mock_server
+from reg.chain import qa_prompt
+from reg.context import build_context, count_tokens
+from reg.embeddings import BasicEmbeddings
+from reg.loader import _iter_chunk_batches
+
+WORDS = (
+    "contract supplier delivery schedule invoice payment terms warranty service level report "
+    "quarterly budget review audit compliance policy vendor shipment inventory forecast risk "
+    "approval committee meeting minutes appendix section clause revision owner deadline"
+).split()
+
+
+def sentence(rng):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 20))).capitalize() + "."
+
+
+def make_document(facts, paragraphs, rng):
+    body = []
+    for i in range(paragraphs):
+        body.append(" ".join(sentence(rng) for _ in range(rng.randint(5, 25))))
+        if i in facts:
+            project, code = facts[i]
+            body[-1] += f" The access code for project {project} is {code}."
+    return "\n\n".join(body)
+
+
+def prompt_for(query, docs):
+    return qa_prompt().format(context="\n\n".join(d.page_content for d in docs), question=query)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--paragraphs", type=int, default=400)
+    parser.add_argument("--questions", type=int, default=50)
+    parser.add_argument("--budget", type=int, default=1000, help="context token budget")
+    parser.add_argument("--fetch-k", type=int, default=8)
+    parser.add_argument("--max-chunks", type=int, default=4)
+    parser.add_argument("--prompt-token-latency", type=float, default=0.0005,
+                        help="mock prefill seconds per prompt token")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    planted = rng.sample(range(args.paragraphs), args.questions)
+    facts = {i: (f"P{i}", f"X-{rng.randint(1000, 9999)}") for i in planted}
+    text = make_document(facts, args.paragraphs, rng)
+    chunks = [c for batch in _iter_chunk_batches(iter([Document(page_content=text, metadata={"source": "bench.txt"})]), 512) for c in batch]
+    vectorstore = FAISS.from_documents(chunks, BasicEmbeddings())
+
+    server, url = start_mock_server(latency=0.0, token_latency=0.0, answer_tokens=20,
+                                    prompt_token_latency=args.prompt_token_latency)
+    os.environ["OPENAI_API_KEY"] = "mock"
+    os.environ["OPENAI_API_BASE"] = url
+    from reg.clients import get_chat_model
+    llm = get_chat_model(max_retries=0)
+
+    results = {"stuff_k5": [], "builder": []}
+    for i in planted:
+        project, code = facts[i]
+        query = f"What is the access code for project {project}?"
+        baseline = vectorstore.similarity_search(query, k=5)
+        candidates = vectorstore.similarity_search(query, k=args.fetch_k)
+        packed, _ = build_context(query, candidates, budget=args.budget, max_chunks=args.max_chunks)
+        for name, docs in (("stuff_k5", baseline), ("builder", packed)):
+            prompt = prompt_for(query, docs)
+            started = time.perf_counter()
+            llm.invoke(prompt)
+            results[name].append({
+                "tokens": count_tokens(prompt),
+                "context_tokens": count_tokens("\n\n".join(d.page_content for d in docs)),
+                "hit": any(code in d.page_content for d in docs),
+                "latency": time.perf_counter() - started,
+            })
+
+    base_tokens = np.mean([r["tokens"] for r in results["stuff_k5"]])
+    for name, rows in results.items():
+        tokens = np.asarray([r["tokens"] for r in rows])
+        latency = np.asarray([r["latency"] for r in rows]) * 1000
+        print(json.dumps({
+            "mode": name,
+            "prompt_tokens_mean": round(float(tokens.mean()), 1),
+            "context_tokens_mean": round(float(np.mean([r["context_tokens"] for r in rows])), 1),
+            "tokens_saved": f"{100 * (1 - tokens.mean() / base_tokens):.1f}%",
+            "fact_in_context": round(float(np.mean([r["hit"] for r in rows])), 3),
+            "llm_p50_ms": round(float(np.percentile(latency, 50)), 2),
+            "llm_p95_ms": round(float(np.percentile(latency, 95)), 2),
+        }))
+
+
+if __name__ == "__main__":
+    main()
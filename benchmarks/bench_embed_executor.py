@@ -0,0 +1,71 @@
+"""Throughput of the batched embedding executor against the mock server.
+
+Runs the same chunk set at several concurrency levels with injected 429s
+and 503s and reports chunks/s and retries for each.
+
+    python benchmarks/bench_embed_executor.py --chunks 2000 --rate-limit 0.05
+"""
+import os
+import sys
+import json
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from openai import OpenAI
+
+from benchmarks.mock_openai import start_mock_server
+from reg.embed_executor import EmbeddingExecutor
+
+
+class StubEmbeddings:
+    """Calls the embeddings endpoint with the OpenAI SDK and no tokenizer.
+
+    OpenAIEmbeddings needs tiktoken's vocab download, which an offline
+    benchmark cannot rely on; the HTTP path and error types are the same.
+    """
+
+    model = "text-embedding-3-large"
+
+    def __init__(self, base_url):
+        self.client = OpenAI(api_key="mock", base_url=base_url, max_retries=0)
+
+    def embed_documents(self, texts):
+        response = self.client.embeddings.create(input=texts, model=self.model)
+        return [item.embedding for item in response.data]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--rate-limit", type=float, default=0.05)
+    parser.add_argument("--errors", type=float, default=0.02)
+    args = parser.parse_args()
+
+    server, base_url = start_mock_server(
+        latency=args.latency, rate_limit=args.rate_limit, errors=args.errors, retry_after=0.1,
+    )
+    embeddings = StubEmbeddings(base_url)
+    texts = [f"chunk {i} " + "lorem ipsum " * 50 for i in range(args.chunks)]
+
+    results = []
+    for concurrency in args.concurrency:
+        executor = EmbeddingExecutor(
+            embeddings, batch_size=args.batch_size, max_concurrency=concurrency, base_delay=0.05,
+        )
+        vectors = executor.embed(texts)
+        assert len(vectors) == len(texts)
+        results.append(dict(executor.stats, concurrency=concurrency))
+        print(json.dumps(results[-1]))
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""Latency and recall of per-source shards (reg.federated) vs one merged index.
+
+The corpus is --sources files of --chunks vectors each, from
+bench_ann_index's clustered generator. The merged indexes are what a
+collection holds today, `reg.loader.build_index` over every vector, once
+per --merged-types entry ("auto" goes IVF past INDEX_FLAT_MAX; "flat" is
+the exact baseline to compare flat shards against). The federated one
+builds an index per source the same way (flat while a file stays small)
+and searches them on the shard pool with --workers threads, merging the
+per-shard top-k. Shards only search in parallel with as many free cores.
+
+Queries run one at a time, as a request issues them, over all sources and
+restricted to --filter randomly chosen sources. The merged index filters
+with an IDSelector, so both sides skip other sources' vectors rather than
+post-filtering. FAISS's own OpenMP threads are set by --threads (a single
+query does not use them on these index types). recall@k is measured
+against exact search over the same sources.
+
+    python benchmarks/bench_federated.py --sources 40 --chunks 5000 --dim 384 --workers 1,4,8
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import faiss
+
+import reg.federated as federated
+from benchmarks.bench_ann_index import make_vectors, recall
+from reg.federated import FederatedIndex, Shard
+from reg.loader import build_index, describe_index, search_params
+
+
+def exact_top_k(corpus, queries, allowed, k):
+    """Row numbers of each query's k nearest neighbours among `allowed` rows."""
+    found = np.empty((len(queries), k), dtype=np.int64)
+    for i, (q, rows) in enumerate(zip(queries, allowed)):
+        distances = ((corpus[rows] - q) ** 2).sum(axis=1)
+        found[i] = rows[np.argsort(distances)[:k]]
+    return found
+
+
+def search_merged(index, queries, allowed, k):
+    latencies = []
+    found = np.empty((len(queries), k), dtype=np.int64)
+    for i, (q, rows) in enumerate(zip(queries, allowed)):
+        started = time.perf_counter()
+        params = search_params(index)
+        if rows is not None:
+            selector = faiss.IDSelectorBatch(rows)
+            if faiss.try_extract_index_ivf(index) is not None:
+                params = faiss.SearchParametersIVF(sel=selector, nprobe=faiss.extract_index_ivf(index).nprobe)
+            else:
+                params = faiss.SearchParameters(sel=selector)
+        if params is not None:
+            _, ids = index.search(q[None, :], k, params=params)
+        else:
+            _, ids = index.search(q[None, :], k)
+        latencies.append(time.perf_counter() - started)
+        found[i] = ids[0]
+    return found, np.asarray(latencies) * 1000
+
+
+def search_federated(index, queries, selections, k):
+    latencies = []
+    found = np.empty((len(queries), k), dtype=np.int64)
+    for i, (q, sources) in enumerate(zip(queries, selections)):
+        started = time.perf_counter()
+        hits = index.search_vector(q, k, sources)
+        latencies.append(time.perf_counter() - started)
+        found[i] = [doc_id for doc_id, _ in hits] + [-1] * (k - len(hits))
+    return found, np.asarray(latencies) * 1000
+
+
+def row(name, found, truth, latencies, **extra):
+    """One JSON result line: latency percentiles and recall@k."""
+    return dict(
+        {"index": name},
+        **extra,
+        p50_ms=round(float(np.percentile(latencies, 50)), 3),
+        p99_ms=round(float(np.percentile(latencies, 99)), 3),
+        recall=round(recall(found, truth), 4),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sources", type=int, default=40)
+    parser.add_argument("--chunks", type=int, default=5000, help="vectors per source")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=256)
+    parser.add_argument("--latent", type=int, default=48, help="intrinsic dimension of the vectors")
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--filter", default="1,4", help="numbers of sources filtered queries are restricted to")
+    parser.add_argument("--merged-types", default="auto,flat", help="INDEX_TYPE values for the merged index")
+    parser.add_argument("--workers", default="1,4,8", help="shard pool sizes (FEDERATED_WORKERS)")
+    parser.add_argument("--threads", type=int, default=1, help="FAISS OpenMP threads for search")
+    args = parser.parse_args()
+    faiss.omp_set_num_threads(args.threads)
+
+    rng = np.random.default_rng(0)
+    n = args.sources * args.chunks
+    corpus = make_vectors(n, args.dim, args.clusters, args.latent, rng)
+    queries = make_vectors(args.queries, args.dim, args.clusters, args.latent, rng)
+    names = [f"file{s:03d}" for s in range(args.sources)]
+    rows_of = {name: np.arange(s * args.chunks, (s + 1) * args.chunks) for s, name in enumerate(names)}
+
+    merged = {}
+    for index_type in args.merged_types.split(","):
+        started = time.perf_counter()
+        index = build_index(corpus, index_type)
+        index.add(corpus)
+        merged[index_type] = index
+        print(json.dumps({
+            "vectors": n, "merged": describe_index(index), "build_s": round(time.perf_counter() - started, 2),
+        }), flush=True)
+
+    started = time.perf_counter()
+    shards = {}
+    for name, rows in rows_of.items():
+        index = build_index(corpus[rows])
+        index.add(corpus[rows])
+        shards[name] = Shard(name, index, [int(r) for r in rows])
+    sharded = FederatedIndex(shards, None, None)
+    sharded_build = time.perf_counter() - started
+    print(json.dumps({
+        "vectors": n, "sources": args.sources, "federated": sharded.describe(), "build_s": round(sharded_build, 2),
+    }), flush=True)
+
+    selections = {"all": [None] * args.queries}
+    for count in (int(c) for c in args.filter.split(",")):
+        selections[f"{count} sources"] = [list(rng.choice(names, count, replace=False)) for _ in range(args.queries)]
+
+    for label, chosen in selections.items():
+        allowed = [None if s is None else np.concatenate([rows_of[name] for name in s]) for s in chosen]
+        truth = exact_top_k(corpus, queries, [np.arange(n) if a is None else a for a in allowed], args.k)
+        for index in merged.values():
+            found, latencies = search_merged(index, queries, allowed, args.k)
+            print(json.dumps(row(describe_index(index), found, truth, latencies, query=label)), flush=True)
+        for workers in (int(w) for w in args.workers.split(",")):
+            # a fresh pool of this size for the shard searches
+            os.environ["FEDERATED_WORKERS"] = str(workers)
+            if federated._search_pool is not None:
+                federated._search_pool.shutdown()
+                federated._search_pool = None
+            found, latencies = search_federated(sharded, queries, chosen, args.k)
+            print(json.dumps(row(sharded.describe(), found, truth, latencies, query=label, workers=workers)), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Recall@k and latency of vector, BM25 and hybrid (RRF) retrieval.
+
+Builds a synthetic corpus where every chunk mentions one unique part or
+clause identifier amid shared filler vocabulary, then asks questions that
+hinge on the identifier, which is the case pure vector search tends to miss.
+
+    python benchmarks/bench_hybrid.py --chunks 5000 --queries 300 --k 5
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_community.vectorstores import FAISS
+
+from reg.embeddings import BasicEmbeddings
+from reg.hybrid import build_bm25, get_bm25, hybrid_search_ids, vector_search_ids
+
+TOPICS = ["pump", "valve", "bearing", "gasket", "rotor", "seal", "housing", "sensor"]
+
+
+def _identifier(rng, i):
+    if i % 2:
+        return f"PN-{rng.randint(10000, 99999)}-{rng.choice('ABCDEFGH')}"
+    return f"clause {rng.randint(1, 30)}.{rng.randint(1, 20)}.{i}"
+
+
+def build_corpus(n, words, rng):
+    vocab = ["".join(rng.choice("abcdefghijklmnop") for _ in range(rng.randint(3, 8))) for _ in range(3000)]
+    texts, idents = [], []
+    for i in range(n):
+        ident = _identifier(rng, i)
+        topic = rng.choice(TOPICS)
+        filler = [rng.choice(vocab) for _ in range(words)]
+        pos = rng.randrange(len(filler))
+        filler[pos:pos] = ["The", topic, "listed", "as", ident, "must", "be", "inspected"]
+        texts.append(" ".join(filler))
+        idents.append((ident, topic))
+    return texts, idents
+
+
+def measure(name, search, queries, k):
+    hits = 0
+    latencies = []
+    for query, expected in queries:
+        started = time.perf_counter()
+        ids = search(query, k)
+        latencies.append(time.perf_counter() - started)
+        hits += expected in ids[:k]
+    latencies.sort()
+    return {
+        "mode": name,
+        f"recall@{k}": round(hits / len(queries), 4),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 3),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95)] * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=5000)
+    parser.add_argument("--words", type=int, default=150)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    texts, idents = build_corpus(args.chunks, args.words, rng)
+    embeddings = BasicEmbeddings()
+    vectorstore = FAISS.from_embeddings(list(zip(texts, embeddings.embed_documents(texts))), embeddings)
+
+    started = time.perf_counter()
+    vectorstore._bm25 = build_bm25(vectorstore)
+    bm25_build = time.perf_counter() - started
+
+    row_to_id = vectorstore.index_to_docstore_id
+    queries = []
+    for row in rng.sample(range(args.chunks), min(args.queries, args.chunks)):
+        ident, topic = idents[row]
+        queries.append((f"What are the inspection rules for the {topic} {ident}?", row_to_id[row]))
+
+    results = [
+        measure("vector", lambda q, k: [i for i, _ in vector_search_ids(vectorstore, q, k)], queries, args.k),
+        measure("bm25", lambda q, k: [i for i, _ in get_bm25(vectorstore).search(q, k)], queries, args.k),
+        measure("hybrid", lambda q, k: [i for i, _ in hybrid_search_ids(vectorstore, q, k)], queries, args.k),
+    ]
+    print(json.dumps({
+        "chunks": args.chunks,
+        "queries": len(queries),
+        "bm25_build_seconds": round(bm25_build, 3),
+        "results": results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""Memory per chunk, search latency and recall of compressed vector storage.
+
+Builds the index `reg.loader.build_index` makes for each combination of
+INDEX_QUANT (none/fp16/int8), INDEX_DIM (0 = all dimensions) and
+INDEX_RESCORE (0 = no float32 re-scoring), writes it to disk and loads it
+back the way `reg.index_store.load_vectorstore` does, then searches one
+query at a time. Reported per configuration:
+
+- search_bytes_per_chunk: what the index searches in memory;
+- rescore_bytes_per_chunk: the float32 copy kept for re-scoring, which
+  loaded indexes leave memory-mapped (read from the page cache);
+- heap_mb / mapped_mb: anonymous and page-cache memory the loaded index
+  holds after the queries (Linux), measured with the latency in a fresh
+  interpreter so earlier configurations do not skew it. Re-scoring indexes
+  map their flat codes, so their whole footprint shows up as mapped_mb:
+  shared between workers and reclaimable, but the codes scanned on every
+  query stay hot;
+- p50/p99 latency, and recall@k against exact float32 search.
+
+Synthetic vectors come from bench_ann_index's clustered generator; with
+--decay > 0 dimension j is scaled by (1 + j) ** -decay before normalizing,
+so the leading dimensions carry most of the signal as in Matryoshka-trained
+models, which is what makes truncation viable. Use --npy to measure real
+embeddings instead (an (n, dim) float32 array; the last --queries rows are
+held out as queries).
+
+    python benchmarks/bench_quantization.py --vectors 50000 --dim 3072 --dims 0,1024,256
+"""
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import itertools
+import subprocess
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import faiss
+
+from benchmarks.bench_ann_index import make_vectors, recall, timed_search
+from reg.loader import build_index, describe_index, has_rescoring
+
+
+def rss_mb():
+    """(anonymous, file-backed) resident memory of this process in MB, or Nones off Linux."""
+    found = {}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(("RssAnon:", "RssFile:")):
+                    found[line.split(":")[0]] = int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return found.get("RssAnon"), found.get("RssFile")
+
+
+def load_like_the_app(path, rescoring):
+    if rescoring:
+        return faiss.read_index(path, faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY)
+    return faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+
+
+def storage_bytes(index):
+    """(bytes searched in memory, bytes kept for re-scoring), from serialized sizes."""
+    total = faiss.serialize_index(index).nbytes
+    if not has_rescoring(index):
+        return total, 0
+    base = faiss.serialize_index(faiss.downcast_index(index).base_index).nbytes
+    return base, total - base
+
+
+def measure(tmp, rescoring, k, threads):
+    """Load the index in tmp like the app does, search every query; print a JSON row."""
+    queries = np.load(os.path.join(tmp, "queries.npy"))
+    truth = np.load(os.path.join(tmp, "truth.npy"))
+    before = rss_mb()
+    index = load_like_the_app(os.path.join(tmp, "index.faiss"), rescoring)
+    faiss.omp_set_num_threads(threads)
+    found, latencies = timed_search(index, queries, k, None)
+    after = rss_mb()
+    print(json.dumps({
+        "heap_mb": round(after[0] - before[0], 1) if before[0] is not None else None,
+        "mapped_mb": round(after[1] - before[1], 1) if before[1] is not None else None,
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+        f"recall@{k}": round(recall(found, truth), 4),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--vectors", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--clusters", type=int, default=256)
+    parser.add_argument("--latent", type=int, default=48, help="intrinsic dimension of the vectors")
+    parser.add_argument("--decay", type=float, default=0.5, help="per-dimension energy decay (see above)")
+    parser.add_argument("--npy", help="real embeddings to use instead of synthetic ones")
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--type", default="flat", help="INDEX_TYPE for every configuration")
+    parser.add_argument("--quants", default="none,fp16,int8")
+    parser.add_argument("--dims", default="0,256", help="INDEX_DIM values; 0 keeps every dimension")
+    parser.add_argument("--rescore", default="0,4", help="INDEX_RESCORE values")
+    parser.add_argument("--threads", type=int, default=1, help="FAISS OpenMP threads for search")
+    parser.add_argument("--measure", help=argparse.SUPPRESS)
+    parser.add_argument("--rescoring", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.measure, args.rescoring, args.k, args.threads)
+        return
+
+    if args.npy:
+        data = np.load(args.npy, mmap_mode="r").astype(np.float32)
+        corpus, queries = data[:-args.queries], data[-args.queries:]
+    else:
+        rng = np.random.default_rng(0)
+        corpus = make_vectors(args.vectors, args.dim, args.clusters, args.latent, rng)
+        queries = make_vectors(args.queries, args.dim, args.clusters, args.latent, rng)
+        if args.decay:
+            weights = (1 + np.arange(args.dim, dtype=np.float32)) ** -args.decay
+            for x in (corpus, queries):
+                x *= weights
+                x /= np.linalg.norm(x, axis=1, keepdims=True)
+    corpus = np.ascontiguousarray(corpus)
+    n, dim = corpus.shape
+
+    tmp = tempfile.mkdtemp(prefix="querify-quant-")
+    exact = faiss.IndexFlatL2(dim)
+    exact.add(corpus)
+    np.save(os.path.join(tmp, "queries.npy"), np.ascontiguousarray(queries))
+    np.save(os.path.join(tmp, "truth.npy"), timed_search(exact, queries, args.k, None)[0])
+    del exact
+
+    try:
+        for quant, keep_dim, rescore in itertools.product(
+            args.quants.split(","), [int(d) for d in args.dims.split(",")], [int(r) for r in args.rescore.split(",")]
+        ):
+            if rescore and quant == "none" and not keep_dim:
+                continue  # nothing compressed, so nothing to re-score
+            os.environ.update(INDEX_TYPE=args.type, INDEX_QUANT=quant, INDEX_DIM=str(keep_dim), INDEX_RESCORE=str(rescore))
+            index = build_index(corpus)
+            index.add(corpus)
+            search_bytes, rescore_bytes = storage_bytes(index)
+            row = {
+                "index": describe_index(index),
+                "search_bytes_per_chunk": round(search_bytes / n, 1),
+                "rescore_bytes_per_chunk": round(rescore_bytes / n, 1),
+            }
+            command = [sys.executable, os.path.abspath(__file__), "--measure", tmp,
+                       "--k", str(args.k), "--threads", str(args.threads)]
+            if has_rescoring(index):
+                command.append("--rescoring")
+            faiss.write_index(index, os.path.join(tmp, "index.faiss"))
+            del index
+            out = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+            row.update(json.loads(out.strip().splitlines()[-1]))
+            print(json.dumps(row), flush=True)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""/chat latency and embedding API calls with and without query micro-batching.
+
+Runs the /chat load generator (benchmarks/load_chat.py) against the app
+in-process, with embeddings served by the mock OpenAI server so every
+query embedding is a real HTTP round trip of --latency seconds (through
+bench_embed_executor's StubEmbeddings, as OpenAIEmbeddings needs
+tiktoken's vocab download). Each configuration runs in a fresh interpreter,
+since the query embedders read their settings once per process:
+
+- off: QUERY_EMBED_WINDOW_MS=0 and QUERY_EMBED_CACHE_SIZE=0, one call
+  per query embedding, as before;
+- lru: the recent-query cache only;
+- batched: the cache plus coalescing (the defaults).
+
+The answer cache is on, as in production, so each /chat embeds its
+question for the cache lookup and again for retrieval; every question
+is made unique so no answer is served from that cache. Reported per
+concurrency level: p50/p99 latency, throughput, and the embedding
+requests and texts the mock received during the load (ingestion excluded).
+
+    python benchmarks/bench_query_embed.py --corpus data/bench-corpus --concurrency 1,16,32 --requests 300
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CONFIGS = {
+    "off": {"QUERY_EMBED_WINDOW_MS": "0", "QUERY_EMBED_CACHE_SIZE": "0"},
+    "lru": {"QUERY_EMBED_WINDOW_MS": "0"},
+    "batched": {},
+}
+
+
+def child(args):
+    """Measure one configuration in this interpreter; prints a JSON row per concurrency level."""
+    import reg.embeddings
+    from benchmarks.bench_embed_executor import StubEmbeddings
+    from benchmarks.load_chat import run_load, start_app, upload_corpus
+
+    os.environ["EMBEDDINGS_PROVIDER"] = "auto"
+    url = start_app(args.latency, answer_cache=True)
+    embeddings = StubEmbeddings(os.environ["OPENAI_API_BASE"])
+    reg.embeddings.get_openai_embeddings = lambda: embeddings
+    stats_url = os.environ["OPENAI_API_BASE"] + "/stats"
+    with httpx.Client(timeout=600) as client:
+        _, manifest = upload_corpus(client, url, args.corpus, "bench-query-embed")
+        questions = [q["question"] for q in manifest["questions"]]
+        for level in (int(c) for c in args.concurrency.split(",")):
+            before = client.get(stats_url).json()
+            unique = [f"{questions[i % len(questions)]} (request {level}-{i})" for i in range(args.requests)]
+            row = run_load(url, "bench-query-embed", unique, level, args.requests)
+            after = client.get(stats_url).json()
+            print(json.dumps({
+                "config": args.child,
+                "concurrency": level,
+                "p50_ms": row["p50_ms"],
+                "p99_ms": row["p99_ms"],
+                "throughput_rps": row["throughput_rps"],
+                "errors": row["errors"],
+                "embedding_requests": after["embedding_requests"] - before["embedding_requests"],
+                "embedded_texts": after["embedded"] - before["embedded"],
+            }), flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", required=True, help="directory written by benchmarks/corpus.py")
+    parser.add_argument("--concurrency", default="1,16,32", help="comma-separated levels")
+    parser.add_argument("--requests", type=int, default=300, help="requests per concurrency level")
+    parser.add_argument("--latency", type=float, default=0.05, help="mock API latency per request (embeddings and LLM)")
+    parser.add_argument("--configs", default=",".join(CONFIGS))
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.corpus = os.path.abspath(args.corpus)
+
+    if args.child:
+        child(args)
+        return
+
+    for name in args.configs.split(","):
+        command = [sys.executable, os.path.abspath(__file__), "--child", name, "--corpus", args.corpus,
+                   "--concurrency", args.concurrency, "--requests", str(args.requests), "--latency", str(args.latency)]
+        out = subprocess.run(command, env=dict(os.environ, **CONFIGS[name]), capture_output=True, text=True, check=True).stdout
+        for line in out.strip().splitlines():
+            if line.startswith("{"):
+                print(line, flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Per-query latency of SimpleQAChain.run, before vs after a change.
+
+Builds a FAISS index of synthetic chunks with BasicEmbeddings, then times
+the current chain and the chain from an earlier git revision (by default
+the repository's first commit) on the same mixed query set.
+
+    python benchmarks/bench_simple_qa.py --chunks 10000 --before <rev>
+"""
+import os
+import sys
+import json
+import time
+import types
+import random
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from langchain_community.vectorstores import FAISS
+
+from reg.embeddings import BasicEmbeddings
+from reg.hybrid import build_bm25
+from reg.chain import SimpleQAChain
+
+QUERIES = [
+    "what does clause 12 say about warranty",
+    "summarize the maintenance section in five lines",
+    "give me a 10 line summary",
+    "what is my friend's name",
+    "who am i",
+    "explain part number AB-1234",
+    "overview of the safety rules",
+    "hello",
+]
+
+
+def build_corpus(n_chunks, seed=0):
+    rng = random.Random(seed)
+    words = "pump valve clause warranty safety manual part section turbine rotor seal bearing".split()
+    texts = []
+    for i in range(n_chunks):
+        body = " ".join(rng.choice(words) for _ in range(150))
+        if i % 997 == 0:
+            body = "My friend name is Sudip. " + body
+        texts.append(f"Section {i}. {body}")
+    metadatas = [{"source": f"doc{i % 20}.pdf"} for i in range(n_chunks)]
+    vectorstore = FAISS.from_texts(texts, BasicEmbeddings(), metadatas=metadatas)
+    # ingestion builds the keyword index along with FAISS (reg.loader)
+    vectorstore._bm25 = build_bm25(vectorstore)
+    return vectorstore
+
+
+def load_chain_at(rev):
+    """Import reg/chain.py as it was at `rev` into a throwaway module."""
+    source = subprocess.check_output(["git", "show", f"{rev}:reg/chain.py"], cwd=ROOT, text=True)
+    module = types.ModuleType(f"chain_at_{rev}")
+    exec(compile(source, f"{rev}:reg/chain.py", "exec"), module.__dict__)
+    return module.SimpleQAChain
+
+
+def time_chain(chain, queries, repeats):
+    latencies = []
+    for _ in range(repeats):
+        for q in queries:
+            t0 = time.perf_counter()
+            chain.run(q)
+            latencies.append((time.perf_counter() - t0) * 1000)
+    latencies.sort()
+    return {
+        "queries": len(latencies),
+        "mean_ms": round(statistics.mean(latencies), 3),
+        "p50_ms": round(latencies[len(latencies) // 2], 3),
+        "p99_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))], 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=10000)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--before", default=None, help="git revision to compare against (default: first commit)")
+    args = parser.parse_args()
+
+    before = args.before or subprocess.check_output(
+        ["git", "rev-list", "--max-parents=0", "HEAD"], cwd=ROOT, text=True
+    ).split()[0]
+
+    vectorstore = build_corpus(args.chunks)
+    results = {
+        "chunks": args.chunks,
+        "before": dict(time_chain(load_chain_at(before)(vectorstore), QUERIES, args.repeats), rev=before),
+        "after": time_chain(SimpleQAChain(vectorstore), QUERIES, args.repeats),
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
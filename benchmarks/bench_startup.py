@@ -0,0 +1,175 @@
+"""Worker startup cost: importing the app, first requests, and preloading.
+
+Each measurement runs in a fresh interpreter (or a fork of one), repeated
+--repeat times; medians are reported.
+
+- cold: `import app` and `create_app()`, then GET / and the first upload
+  and /chat (against the mock LLM), as a worker without preloading sees them;
+- preloaded: the parent runs reg.lazy.preload() and gc.freeze() and forks,
+  as the gunicorn master does with PRELOAD_IMPORTS, and the child does the
+  same steps.
+
+It also lists the slowest modules under `import app` (python -X importtime)
+and the incremental import time of each heavy dependency. With --before REV
+the cold measurements are repeated on that revision (checked out with git
+archive) for comparison.
+
+    python benchmarks/bench_startup.py --repeat 5 --before HEAD~1
+"""
+import gc
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _rss_mb():
+    scale = 1 if sys.platform == "darwin" else 1024
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2**20, 1)
+
+
+def worker_steps(mock_url, started):
+    """What a worker does on boot and for its first requests; returns timings."""
+    os.environ.update(OPENAI_API_KEY="mock", OPENAI_API_BASE=mock_url, EMBEDDINGS_PROVIDER="basic", ANSWER_CACHE="0")
+    row = {}
+    t = time.perf_counter()
+    import app
+    row["import_app_ms"] = 1000 * (time.perf_counter() - t)
+    t = time.perf_counter()
+    client = app.create_app().test_client()
+    row["create_app_ms"] = 1000 * (time.perf_counter() - t)
+    row["ready_ms"] = 1000 * (time.perf_counter() - started)
+    row["ready_rss_mb"] = _rss_mb()
+
+    t = time.perf_counter()
+    client.get("/")
+    row["first_index_ms"] = 1000 * (time.perf_counter() - t)
+
+    with open("doc.txt", "w", encoding="utf8") as f:
+        f.write("The access code for project P7 is X-4821.\n" + "Filler sentence about the contract. " * 400)
+    t = time.perf_counter()
+    with open("doc.txt", "rb") as f:
+        r = client.post("/upload", data={"file": (f, "doc.txt")})
+    job_id = (r.get_json() or {}).get("job_id")
+    while job_id and not client.get(f"/jobs/{job_id}").get_json().get("done"):
+        time.sleep(0.005)
+    row["first_upload_ms"] = 1000 * (time.perf_counter() - t)
+    t = time.perf_counter()
+    client.post("/chat", json={"message": "What is the access code for project P7?"})
+    row["first_chat_ms"] = 1000 * (time.perf_counter() - t)
+    row["peak_rss_mb"] = _rss_mb()
+    return row
+
+
+def child(mode, mock_url, tree):
+    """Run one measurement in this fresh interpreter and print it as JSON."""
+    started = time.perf_counter()
+    sys.path.insert(0, tree)
+    os.chdir(tempfile.mkdtemp(prefix="querify-startup-"))
+    if mode == "cold":
+        print(json.dumps(worker_steps(mock_url, started)))
+        return
+
+    from reg.lazy import preload
+
+    t = time.perf_counter()
+    preload()
+    gc.freeze()
+    master_ms = 1000 * (time.perf_counter() - t)
+    read_fd, write_fd = os.pipe()
+    forked = time.perf_counter()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        try:
+            row = worker_steps(mock_url, forked)
+        except BaseException as e:
+            row = {"error": repr(e)}
+        os.write(write_fd, json.dumps(row).encode())
+        os._exit(0)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as f:
+        row = json.loads(f.read())
+    os.waitpid(pid, 0)
+    print(json.dumps(dict(row, master_preload_ms=master_ms)))
+
+
+def run(mode, mock_url, tree, repeat):
+    rows = []
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", mode, "--mock-url", mock_url, "--tree", tree],
+            capture_output=True, text=True, check=True, cwd=tree,
+        ).stdout
+        rows.append(json.loads(out.strip().splitlines()[-1]))
+    keys = [k for k in rows[0] if isinstance(rows[0][k], (int, float))]
+    return {k: round(statistics.median(r[k] for r in rows), 1) for k in keys}
+
+
+def slowest_imports(tree, top):
+    """Cumulative time of the slowest modules under `import app`, from -X importtime."""
+    err = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"],
+                         capture_output=True, text=True, cwd=tree).stderr
+    rows = []
+    for line in err.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        rows.append((int(cumulative) / 1000, name))
+    return [{"module": name, "ms": round(ms, 1)} for ms, name in sorted(rows, reverse=True)[:top]]
+
+
+def heavy_imports(tree):
+    """Incremental import time of each heavy dependency, in reg.lazy's preload order."""
+    code = "import json, reg.lazy as lazy; print(json.dumps(lazy.preload()))"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=tree, check=True).stdout
+    return {name: round(1000 * s, 1) for name, s in json.loads(out.strip().splitlines()[-1]).items()}
+
+
+def checkout(rev):
+    tree = tempfile.mkdtemp(prefix="querify-rev-")
+    archive = subprocess.run(["git", "archive", rev], cwd=ROOT, capture_output=True, check=True).stdout
+    subprocess.run(["tar", "-x", "-C", tree], input=archive, check=True)
+    return tree
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="slowest imports to list")
+    parser.add_argument("--before", help="git revision to compare cold startup against")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--mock-url", help=argparse.SUPPRESS)
+    parser.add_argument("--tree", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.mock_url, args.tree)
+        return
+
+    sys.path.insert(0, ROOT)
+    from benchmarks.mock_openai import start_mock_server
+
+    _, mock_url = start_mock_server(latency=0.0, token_latency=0.0, answer_tokens=5)
+    print(json.dumps({"slowest_imports": slowest_imports(ROOT, args.top)}), flush=True)
+    print(json.dumps({"heavy_imports_ms": heavy_imports(ROOT)}), flush=True)
+    for mode in ("cold", "preloaded"):
+        print(json.dumps({"tree": "current", "mode": mode, **run(mode, mock_url, ROOT, args.repeat)}), flush=True)
+    if args.before:
+        tree = checkout(args.before)
+        try:
+            print(json.dumps({"tree": args.before, "mode": "cold", **run("cold", mock_url, tree, args.repeat)}), flush=True)
+        finally:
+            shutil.rmtree(tree, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
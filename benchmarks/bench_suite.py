@@ -0,0 +1,310 @@
+"""End-to-end benchmark suite: ingestion, queries and /chat load, fully offline.
+
+Generates a seeded PDF/TXT/DOCX corpus (benchmarks/corpus.py), then
+
+- ingests each file in a fresh interpreter with BasicEmbeddings and no
+  index cache, recording seconds, chunks/s, MB/s, peak RSS and the size of
+  the saved index;
+- times every manifest question against its file's index, through the
+  extractive SimpleQAChain and through the LLM chain against the mock
+  server, and scores whether the planted fact reached the context or the
+  answer;
+- runs the /chat load generator (benchmarks/load_chat.py) at each
+  `--concurrency` level.
+
+Everything is written to one JSON file (meta, settings, git revision and
+every measurement), so two runs can be compared:
+
+    python benchmarks/bench_suite.py --pages 100 --files 2 --chunk-size 800
+    python benchmarks/bench_suite.py --compare data/bench/before.json data/bench/after.json
+
+Settings read from the environment (CONTEXT_FETCH_K, RETRIEVER_MODE,
+INDEX_TYPE, ...) apply as usual and are recorded in the results.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.corpus import FORMATS, make_corpus
+
+# recorded with every run, so results say what they were measured with
+SETTINGS_ENV = (
+    "CONTEXT_FETCH_K", "CONTEXT_MAX_CHUNKS", "CONTEXT_TOKEN_BUDGET", "RETRIEVER_MODE", "INDEX_TYPE",
+    "INGEST_BATCH_CHUNKS", "BASIC_EMBEDDINGS_DIM", "CHAT_BUDGET_SECONDS", "LLM_HEDGE_AFTER",
+)
+
+
+def _peak_rss_mb():
+    """Peak RSS of this process and its finished children (ru_maxrss is KiB on Linux, bytes on macOS)."""
+    scale = 1 if sys.platform == "darwin" else 1024
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return round(peak * scale / 2**20, 1)
+
+
+def _dir_bytes(path):
+    return sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(path) for f in files)
+
+
+def ingest_one(path, out_dir, chunk_size=None, chunk_overlap=None):
+    """Ingest one file in this process and save its index to `out_dir`; returns measurements."""
+    from reg import loader
+    from reg.index_store import save_vectorstore
+
+    if chunk_size:
+        loader.CHUNK_SIZE = chunk_size
+    if chunk_overlap is not None:
+        loader.CHUNK_OVERLAP = chunk_overlap
+    baseline = _peak_rss_mb()
+    started = time.perf_counter()
+    vectorstore = loader.load_file_to_vectorstore(path, use_cache=False)
+    seconds = time.perf_counter() - started
+    save_vectorstore(out_dir, vectorstore)
+
+    size = os.path.getsize(path)
+    chunks = vectorstore.index.ntotal
+    return {
+        "file": os.path.basename(path),
+        "bytes": size,
+        "chunks": chunks,
+        "seconds": round(seconds, 4),
+        "chunks_per_s": round(chunks / seconds, 1),
+        "mb_per_s": round(size / 2**20 / seconds, 3),
+        "baseline_rss_mb": baseline,
+        "peak_rss_mb": _peak_rss_mb(),
+        "index_bytes": _dir_bytes(out_dir),
+    }
+
+
+def run_ingest(corpus, manifest, index_root, args):
+    """Ingest every file in its own interpreter, so peak RSS is per file."""
+    env = dict(os.environ, EMBEDDINGS_PROVIDER="basic")
+    rows = []
+    for entry in manifest["files"]:
+        cmd = [sys.executable, os.path.abspath(__file__), "--ingest-one", os.path.join(corpus, entry["name"]),
+               "--index-dir", os.path.join(index_root, entry["name"])]
+        if args.chunk_size:
+            cmd += ["--chunk-size", str(args.chunk_size)]
+        if args.chunk_overlap is not None:
+            cmd += ["--chunk-overlap", str(args.chunk_overlap)]
+        out = subprocess.run(cmd, env=env, cwd=index_root, capture_output=True, text=True, check=True).stdout
+        row = dict(json.loads(out.strip().splitlines()[-1]), format=entry["format"], pages=entry["pages"])
+        rows.append(row)
+        print(json.dumps({"ingest": row}), flush=True)
+    return rows
+
+
+def _summarize_ingest(rows):
+    summary = {}
+    for fmt in sorted({r["format"] for r in rows}):
+        group = [r for r in rows if r["format"] == fmt]
+        seconds = sum(r["seconds"] for r in group)
+        summary[fmt] = {
+            "files": len(group),
+            "chunks": sum(r["chunks"] for r in group),
+            "chunks_per_s": round(sum(r["chunks"] for r in group) / seconds, 1),
+            "mb_per_s": round(sum(r["bytes"] for r in group) / 2**20 / seconds, 3),
+            "peak_rss_mb": max(r["peak_rss_mb"] for r in group),
+            "index_bytes": sum(r["index_bytes"] for r in group),
+        }
+    return summary
+
+
+def _latency(seconds):
+    ms = np.asarray(seconds) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "mean_ms": round(float(ms.mean()), 3),
+    }
+
+
+def run_queries(manifest, index_root, rounds=1):
+    """Time every question through both chains against its own file's index.
+
+    The mock LLM answers with canned text, so the LLM chain's hit rate
+    only counts answers that degraded to the extractive fallback.
+    """
+    from reg.chain import SimpleQAChain, answer_within_budget, build_qa_chain
+    from reg.context import build_context, context_fetch_k
+    from reg.embeddings import BasicEmbeddings
+    from reg.hybrid import make_retriever
+    from reg.index_store import load_vectorstore
+
+    stores = {
+        entry["name"]: load_vectorstore(os.path.join(index_root, entry["name"]), BasicEmbeddings())
+        for entry in manifest["files"]
+    }
+    results = {"extractive": {"seconds": [], "hits": []},
+               "retrieval": {"seconds": [], "hits": []},
+               "llm": {"seconds": [], "hits": [], "degraded": []}}
+    for _ in range(rounds):
+        for item in manifest["questions"]:
+            vectorstore, question, answer = stores[item["file"]], item["question"], item["answer"]
+
+            started = time.perf_counter()
+            text = SimpleQAChain(vectorstore).run(question)
+            results["extractive"]["seconds"].append(time.perf_counter() - started)
+            results["extractive"]["hits"].append(answer in text)
+
+            started = time.perf_counter()
+            docs = make_retriever(vectorstore, k=context_fetch_k()).get_relevant_documents(question)
+            docs, _ = build_context(question, docs)
+            results["retrieval"]["seconds"].append(time.perf_counter() - started)
+            results["retrieval"]["hits"].append(any(answer in d.page_content for d in docs))
+
+            chain = build_qa_chain(vectorstore)
+            started = time.perf_counter()
+            text, info = answer_within_budget(chain, question)
+            results["llm"]["seconds"].append(time.perf_counter() - started)
+            results["llm"]["hits"].append(answer in text)
+            results["llm"]["degraded"].append(bool(info.get("degraded")))
+
+    summary = {}
+    for name, rows in results.items():
+        summary[name] = {"queries": len(rows["seconds"]), **_latency(rows["seconds"]),
+                         "hit_rate": round(float(np.mean(rows["hits"])), 3)}
+        if "degraded" in rows:
+            summary[name]["degraded"] = int(sum(rows["degraded"]))
+    return summary
+
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _flatten(value, prefix=""):
+    if isinstance(value, dict):
+        out = {}
+        for k, v in value.items():
+            out.update(_flatten(v, f"{prefix}.{k}" if prefix else str(k)))
+        return out
+    if isinstance(value, list):
+        out = {}
+        for i, v in enumerate(value):
+            key = v.get("concurrency", i) if isinstance(v, dict) else i
+            out.update(_flatten(v, f"{prefix}[{key}]"))
+        return out
+    return {prefix: value} if isinstance(value, (int, float)) and not isinstance(value, bool) else {}
+
+
+def compare(before_path, after_path):
+    """Print every numeric summary metric of two result files side by side."""
+    with open(before_path, encoding="utf8") as f:
+        before = json.load(f)
+    with open(after_path, encoding="utf8") as f:
+        after = json.load(f)
+    print(f"before: {before['meta'].get('revision')} {before['meta'].get('started')}")
+    print(f"after:  {after['meta'].get('revision')} {after['meta'].get('started')}")
+    for section in ("ingest_summary", "queries", "load"):
+        old, new = _flatten(before.get(section, {})), _flatten(after.get(section, {}))
+        for key in sorted(set(old) | set(new)):
+            a, b = old.get(key), new.get(key)
+            change = f"{100 * (b - a) / a:+.1f}%" if a and b is not None else ""
+            print(f"{section}.{key:<40} {a!s:>12} {b!s:>12} {change:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--formats", default=",".join(FORMATS))
+    parser.add_argument("--files", type=int, default=1, help="files per format")
+    parser.add_argument("--pages", type=int, default=50, help="pages per file")
+    parser.add_argument("--fact-every", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunk-size", type=int, default=None, help="override reg.loader.CHUNK_SIZE")
+    parser.add_argument("--chunk-overlap", type=int, default=None, help="override reg.loader.CHUNK_OVERLAP")
+    parser.add_argument("--rounds", type=int, default=1, help="passes over the question set")
+    parser.add_argument("--concurrency", default="1,8", help="/chat load levels ('' to skip)")
+    parser.add_argument("--requests", type=int, default=200, help="/chat requests per level")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="mock LLM seconds per request")
+    parser.add_argument("--output", default=None, help="results file (default data/bench/<time>-<rev>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"))
+    parser.add_argument("--ingest-one", help=argparse.SUPPRESS)
+    parser.add_argument("--index-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    if args.ingest_one:
+        print(json.dumps(ingest_one(args.ingest_one, args.index_dir, args.chunk_size, args.chunk_overlap)))
+        return
+
+    revision = _git_revision()
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    output = os.path.abspath(args.output or os.path.join(ROOT, "data", "bench", f"{stamp}-{revision or 'norev'}.json"))
+    work = tempfile.mkdtemp(prefix="querify-bench-")
+    corpus, index_root = os.path.join(work, "corpus"), os.path.join(work, "indexes")
+    os.makedirs(index_root)
+
+    from reg import loader
+
+    results = {
+        "meta": {
+            "started": stamp,
+            "revision": revision,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": {k: v for k, v in vars(args).items() if k not in ("compare", "ingest_one", "index_dir")},
+            "settings": {
+                "CHUNK_SIZE": args.chunk_size or loader.CHUNK_SIZE,
+                "CHUNK_OVERLAP": loader.CHUNK_OVERLAP if args.chunk_overlap is None else args.chunk_overlap,
+                **{k: os.environ[k] for k in SETTINGS_ENV if k in os.environ},
+            },
+        },
+    }
+    try:
+        manifest = make_corpus(corpus, args.formats.split(","), args.files, args.pages, args.fact_every, args.seed)
+        results["corpus"] = {"files": len(manifest["files"]), "questions": len(manifest["questions"]),
+                             "bytes": sum(f["bytes"] for f in manifest["files"])}
+
+        results["ingest"] = run_ingest(corpus, manifest, index_root, args)
+        results["ingest_summary"] = _summarize_ingest(results["ingest"])
+
+        # the in-process app and mock LLM serve both the query and the load phases
+        from benchmarks.load_chat import run_load, start_app, upload_corpus
+        import httpx
+
+        url = start_app(args.llm_latency)
+        results["queries"] = run_queries(manifest, index_root, args.rounds)
+        print(json.dumps({"queries": results["queries"]}), flush=True)
+
+        results["load"] = []
+        levels = [int(c) for c in args.concurrency.split(",") if c]
+        if levels:
+            with httpx.Client(timeout=600) as client:
+                upload_corpus(client, url, corpus, "bench-load")
+            questions = [q["question"] for q in manifest["questions"]]
+            for level in levels:
+                row = run_load(url, "bench-load", questions, level, args.requests)
+                results["load"].append(row)
+                print(json.dumps({"load": row}), flush=True)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf8") as f:
+        json.dump(results, f, indent=1)
+    print(f"results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""Synthetic PDF/TXT/DOCX corpora with planted facts, for offline benchmarks.
+
+Each file is `--pages` pages of filler sentences; one page in every
+`--fact-every` carries a fact ("The access code for project P3-17 is
+X-4821.") and a matching question goes into manifest.json, so retrieval
+and answer quality can be scored alongside speed. Generation is seeded,
+so the same arguments always produce the same bytes.
+
+    python benchmarks/corpus.py data/bench-corpus --formats txt,pdf,docx --files 2 --pages 50
+"""
+import os
+import sys
+import json
+import random
+import zipfile
+import argparse
+from xml.sax.saxutils import escape
+
+from pypdf import PdfWriter
+from pypdf.generic import DecodedStreamObject, DictionaryObject, NameObject
+
+WORDS = (
+    "contract supplier delivery schedule invoice payment terms warranty service level report "
+    "quarterly budget review audit compliance policy vendor shipment inventory forecast risk "
+    "approval committee meeting minutes appendix section clause revision owner deadline turbine "
+    "valve pressure inspection engine rotor safety manual maintenance interval torque"
+).split()
+FORMATS = ("txt", "pdf", "docx")
+LINES_PER_PAGE = 40
+
+
+def _sentence(rng):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 14))).capitalize() + "."
+
+
+def make_pages(pages, rng, prefix, fact_every=5):
+    """Return (pages, facts): each page a list of lines, facts as (question, answer, page)."""
+    out, facts = [], []
+    for p in range(pages):
+        lines = [_sentence(rng) for _ in range(LINES_PER_PAGE)]
+        if p % fact_every == 0:
+            project, code = f"{prefix}-{p}", f"X-{rng.randint(1000, 9999)}"
+            lines[rng.randrange(LINES_PER_PAGE)] += f" The access code for project {project} is {code}."
+            facts.append((f"What is the access code for project {project}?", code, p))
+        out.append(lines)
+    return out, facts
+
+
+def write_txt(path, pages):
+    with open(path, "w", encoding="utf8") as f:
+        f.write("\n\n".join(" ".join(lines) for lines in pages))
+
+
+def _pdf_string(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path, pages):
+    writer = PdfWriter()
+    font = writer._add_object(DictionaryObject({
+        NameObject("/Type"): NameObject("/Font"),
+        NameObject("/Subtype"): NameObject("/Type1"),
+        NameObject("/BaseFont"): NameObject("/Helvetica"),
+    }))
+    for lines in pages:
+        page = writer.add_blank_page(612, 792)
+        ops = ["BT /F1 8 Tf 30 770 Td 10 TL"]
+        ops += [f"({_pdf_string(line)}) '" for line in lines]
+        ops.append("ET")
+        content = DecodedStreamObject()
+        content.set_data("\n".join(ops).encode("latin-1", "replace"))
+        page[NameObject("/Contents")] = writer._add_object(content)
+        page[NameObject("/Resources")] = DictionaryObject({
+            NameObject("/Font"): DictionaryObject({NameObject("/F1"): font}),
+        })
+    with open(path, "wb") as f:
+        writer.write(f)
+
+
+_DOCX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/word/document.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '</Types>'
+)
+_DOCX_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="word/document.xml"/>'
+    '</Relationships>'
+)
+
+
+def write_docx(path, pages):
+    """A minimal WordprocessingML package: one paragraph per line, a page break per page."""
+    body = []
+    for lines in pages:
+        body += [f"<w:p><w:r><w:t>{escape(line)}</w:t></w:r></w:p>" for line in lines]
+        body.append('<w:p><w:r><w:br w:type="page"/></w:r></w:p>')
+    document = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+        f'<w:body>{"".join(body)}</w:body></w:document>'
+    )
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as z:
+        z.writestr("[Content_Types].xml", _DOCX_CONTENT_TYPES)
+        z.writestr("_rels/.rels", _DOCX_RELS)
+        z.writestr("word/document.xml", document)
+
+
+WRITERS = {"txt": write_txt, "pdf": write_pdf, "docx": write_docx}
+
+
+def make_corpus(root, formats=FORMATS, files=1, pages=20, fact_every=5, seed=0):
+    """Write the corpus under `root` and return its manifest (also saved as manifest.json)."""
+    os.makedirs(root, exist_ok=True)
+    rng = random.Random(seed)
+    manifest = {"formats": list(formats), "files": [], "questions": [],
+                "pages": pages, "fact_every": fact_every, "seed": seed}
+    for fmt in formats:
+        for n in range(files):
+            name = f"{fmt}-{n}.{fmt}"
+            path = os.path.join(root, name)
+            content, facts = make_pages(pages, rng, prefix=f"{fmt.upper()}{n}", fact_every=fact_every)
+            WRITERS[fmt](path, content)
+            manifest["files"].append({"name": name, "format": fmt, "pages": pages, "bytes": os.path.getsize(path)})
+            manifest["questions"] += [
+                {"file": name, "question": q, "answer": a, "page": p} for q, a, p in facts
+            ]
+    with open(os.path.join(root, "manifest.json"), "w", encoding="utf8") as f:
+        json.dump(manifest, f, indent=1)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("root")
+    parser.add_argument("--formats", default=",".join(FORMATS))
+    parser.add_argument("--files", type=int, default=1, help="files per format")
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--fact-every", type=int, default=5, help="plant a fact on every Nth page")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    manifest = make_corpus(args.root, args.formats.split(","), args.files, args.pages, args.fact_every, args.seed)
+    json.dump({"files": len(manifest["files"]), "questions": len(manifest["questions"]),
+               "bytes": sum(f["bytes"] for f in manifest["files"])}, sys.stdout)
+    print()
+
+
+if __name__ == "__main__":
+    main()
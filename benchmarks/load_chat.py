@@ -0,0 +1,152 @@
+"""Concurrent load generator for /chat.
+
+Uploads a corpus (benchmarks/corpus.py) into one collection, then sends
+its questions to /chat from `--concurrency` workers until `--requests`
+have completed, and prints throughput and latency percentiles as JSON.
+Without `--url` it starts the mock LLM server and the app in-process
+(werkzeug, threaded) in a scratch directory; point `--url` at a running
+gunicorn to measure the real deployment. The in-process app runs with
+the answer cache off unless `--answer-cache` is given, so repeated
+questions measure the full path; start an external server with
+ANSWER_CACHE=0 for the same. The `cached` count in the results shows how
+many answers came from the cache.
+
+    python benchmarks/load_chat.py --corpus data/bench-corpus --concurrency 16 --requests 400
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import tempfile
+import threading
+from collections import Counter
+
+import httpx
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def start_app(llm_latency=0.05, token_latency=0.0, answer_cache=False):
+    """Run the mock LLM and the Flask app in this process; returns the app's base URL."""
+    import logging
+    from werkzeug.serving import make_server
+    from benchmarks.mock_openai import start_mock_server
+
+    _, llm_url = start_mock_server(latency=llm_latency, token_latency=token_latency, answer_tokens=20)
+    os.environ["OPENAI_API_KEY"] = "mock"
+    os.environ["OPENAI_API_BASE"] = llm_url
+    os.environ.pop("OPENROUTER_API_KEY", None)
+    os.environ["ANSWER_CACHE"] = "1" if answer_cache else "0"
+    # the mock key is for the LLM; embeddings stay local and offline
+    os.environ.setdefault("EMBEDDINGS_PROVIDER", "basic")
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    # app.py writes data/ relative to the working directory
+    os.chdir(tempfile.mkdtemp(prefix="querify-load-"))
+    import app
+
+    server = make_server("127.0.0.1", 0, app.create_app(), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+def upload_corpus(client, url, corpus, collection):
+    """Upload every corpus file into `collection` and wait for ingestion; returns (seconds, manifest)."""
+    with open(os.path.join(corpus, "manifest.json"), encoding="utf8") as f:
+        manifest = json.load(f)
+    started = time.perf_counter()
+    for entry in manifest["files"]:
+        with open(os.path.join(corpus, entry["name"]), "rb") as f:
+            r = client.post(f"{url}/upload", files={"file": (entry["name"], f)},
+                            headers={"X-Collection-Id": collection})
+        r.raise_for_status()
+        job_id = r.json()["job_id"]
+        while True:
+            job = client.get(f"{url}/jobs/{job_id}").json()
+            if job.get("done"):
+                if job.get("error"):
+                    raise RuntimeError(f"ingesting {entry['name']} failed: {job['error']}")
+                break
+            time.sleep(0.05)
+    return time.perf_counter() - started, manifest
+
+
+def run_load(url, collection, questions, concurrency=8, requests=200, timeout=60.0):
+    """Send `requests` /chat calls from `concurrency` threads; returns a summary dict."""
+    latencies, statuses, flags = [], Counter(), Counter()
+    lock = threading.Lock()
+    issued = iter(range(requests))
+
+    def worker():
+        with httpx.Client(timeout=timeout) as client:
+            while True:
+                with lock:
+                    n = next(issued, None)
+                if n is None:
+                    return
+                question = questions[n % len(questions)]
+                started = time.perf_counter()
+                try:
+                    r = client.post(f"{url}/chat", json={"message": question},
+                                    headers={"X-Collection-Id": collection})
+                    status, body = r.status_code, (r.json() if r.status_code == 200 else {})
+                except httpx.HTTPError as e:
+                    status, body = type(e).__name__, {}
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies.append(elapsed)
+                    statuses[str(status)] += 1
+                    flags["degraded"] += bool(body.get("degraded"))
+                    flags["cached"] += bool(body.get("cached"))
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - started
+
+    ms = np.asarray(latencies) * 1000
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "seconds": round(wall, 3),
+        "throughput_rps": round(len(latencies) / wall, 2),
+        "p50_ms": round(float(np.percentile(ms, 50)), 2),
+        "p90_ms": round(float(np.percentile(ms, 90)), 2),
+        "p99_ms": round(float(np.percentile(ms, 99)), 2),
+        "max_ms": round(float(ms.max()), 2),
+        "errors": sum(v for k, v in statuses.items() if k != "200"),
+        "statuses": dict(statuses),
+        "degraded": flags["degraded"],
+        "cached": flags["cached"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", required=True, help="directory written by benchmarks/corpus.py")
+    parser.add_argument("--url", help="base URL of a running server (default: start one in-process)")
+    parser.add_argument("--concurrency", default="8", help="comma-separated levels, e.g. 1,8,32")
+    parser.add_argument("--requests", type=int, default=200, help="requests per concurrency level")
+    parser.add_argument("--answer-cache", action="store_true", help="leave the in-process app's answer cache on")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="in-process mock LLM latency")
+    args = parser.parse_args()
+
+    corpus = os.path.abspath(args.corpus)
+    url = args.url or start_app(args.llm_latency, answer_cache=args.answer_cache)
+    collection = f"load-{uuid.uuid4().hex[:12]}"
+    with httpx.Client(timeout=600) as client:
+        ingest_seconds, manifest = upload_corpus(client, url, corpus, collection)
+    print(json.dumps({"collection": collection, "ingest_seconds": round(ingest_seconds, 3)}), flush=True)
+
+    questions = [q["question"] for q in manifest["questions"]]
+    for level in (int(c) for c in args.concurrency.split(",")):
+        print(json.dumps(run_load(url, collection, questions, level, args.requests)), flush=True)
+
+
+if __name__ == "__main__":
+    main()
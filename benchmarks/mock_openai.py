@@ -0,0 +1,212 @@
+"""Minimal OpenAI-compatible stub server for offline benchmarks.
+
+Serves POST /v1/embeddings with deterministic vectors and
+POST /v1/chat/completions (plain or streamed) with a canned answer, and
+can inject latency, 429 rate limits and 5xx errors so retry and
+backpressure paths can be exercised without a real API.
+
+    python benchmarks/mock_openai.py --port 8765 --rate-limit 0.1 --errors 0.05
+"""
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockConfig:
+    def __init__(self, dim=256, latency=0.02, rate_limit=0.0, errors=0.0, retry_after=None, seed=0,
+                 answer_tokens=40, token_latency=0.005, prompt_token_latency=0.0):
+        self.dim = dim
+        self.latency = latency
+        self.answer_tokens = answer_tokens
+        self.token_latency = token_latency
+        # prefill cost: seconds per prompt token (about four characters)
+        self.prompt_token_latency = prompt_token_latency
+        self.rate_limit = rate_limit
+        self.errors = errors
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.counts = {"connections": 0, "requests": 0, "embedding_requests": 0, "embedded": 0, "completions": 0,
+                       "rate_limited": 0, "errors": 0}
+        self.lock = threading.Lock()
+
+
+def _vector(text, dim):
+    out = []
+    counter = 0
+    while len(out) < dim:
+        digest = hashlib.sha256(f"{counter}:{text}".encode("utf-8")).digest()
+        out.extend((b / 127.5) - 1.0 for b in digest)
+        counter += 1
+    return out[:dim]
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    # keep-alive, so clients can reuse connections between requests
+    protocol_version = "HTTP/1.1"
+    # headers and body go out in separate writes; with Nagle on, a reused
+    # connection stalls ~40ms on the client's delayed ACK
+    disable_nagle_algorithm = True
+    config = MockConfig()
+
+    def setup(self):
+        super().setup()
+        with self.config.lock:
+            self.config.counts["connections"] += 1
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _send(self, status, body, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _inject_failure(self):
+        cfg = self.config
+        with cfg.lock:
+            cfg.counts["requests"] += 1
+            roll = cfg.random.random()
+            if roll < cfg.rate_limit:
+                cfg.counts["rate_limited"] += 1
+                headers = {"Retry-After": str(cfg.retry_after)} if cfg.retry_after is not None else {}
+                self._send(429, {"error": {"message": "rate limited", "type": "rate_limit"}}, headers)
+                return True
+            if roll < cfg.rate_limit + cfg.errors:
+                cfg.counts["errors"] += 1
+                self._send(503, {"error": {"message": "unavailable", "type": "server_error"}})
+                return True
+        return False
+
+    def do_POST(self):
+        payload = self._read_json()
+        time.sleep(self.config.latency)
+        if self._inject_failure():
+            return
+        if self.path.rstrip("/").endswith("/embeddings"):
+            inputs = payload.get("input") or []
+            if isinstance(inputs, str):
+                inputs = [inputs]
+            with self.config.lock:
+                self.config.counts["embedding_requests"] += 1
+                self.config.counts["embedded"] += len(inputs)
+            data = [
+                {"object": "embedding", "index": i, "embedding": _vector(str(text), self.config.dim)}
+                for i, text in enumerate(inputs)
+            ]
+            self._send(200, {
+                "object": "list",
+                "data": data,
+                "model": payload.get("model", "mock"),
+                "usage": {"prompt_tokens": 0, "total_tokens": 0},
+            })
+            return
+        if self.path.rstrip("/").endswith("/chat/completions"):
+            self._complete(payload)
+            return
+        self._send(404, {"error": {"message": f"unknown path {self.path}"}})
+
+    def _complete(self, payload):
+        cfg = self.config
+        with cfg.lock:
+            cfg.counts["completions"] += 1
+        tokens = [f"word{i} " for i in range(cfg.answer_tokens)]
+        model = payload.get("model", "mock")
+        prompt_chars = sum(len(str(m.get("content", ""))) for m in payload.get("messages") or [])
+        time.sleep(cfg.prompt_token_latency * prompt_chars / 4)
+        if not payload.get("stream"):
+            time.sleep(cfg.token_latency * len(tokens))
+            self._send(200, {
+                "id": "chatcmpl-mock",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(tokens)},
+                    "finish_reason": "stop",
+                }],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(tokens), "total_tokens": len(tokens)},
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        # no Content-Length, so the end of the stream is marked by closing
+        self.send_header("Connection", "close")
+        self.close_connection = True
+        self.end_headers()
+        for token in tokens + [None]:
+            time.sleep(cfg.token_latency)
+            chunk = {
+                "id": "chatcmpl-mock",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "delta": {"content": token} if token is not None else {},
+                    "finish_reason": None if token is not None else "stop",
+                }],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/stats"):
+            with self.config.lock:
+                self._send(200, dict(self.config.counts))
+            return
+        self._send(404, {"error": {"message": f"unknown path {self.path}"}})
+
+
+def start_mock_server(port=0, **config):
+    """Start the stub in a daemon thread; returns (server, base_url)."""
+    handler = type("ConfiguredMockHandler", (MockHandler,), {"config": MockConfig(**config)})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds added to every request")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument("--errors", type=float, default=0.0, help="fraction of requests answered with 503")
+    parser.add_argument("--retry-after", type=float, default=None)
+    parser.add_argument("--answer-tokens", type=int, default=40)
+    parser.add_argument("--token-latency", type=float, default=0.005, help="seconds per generated token")
+    parser.add_argument("--prompt-token-latency", type=float, default=0.0, help="seconds per prompt token")
+    args = parser.parse_args()
+
+    server, url = start_mock_server(
+        args.port, dim=args.dim, latency=args.latency,
+        rate_limit=args.rate_limit, errors=args.errors, retry_after=args.retry_after,
+        answer_tokens=args.answer_tokens, token_latency=args.token_latency,
+        prompt_token_latency=args.prompt_token_latency,
+    )
+    print(f"Mock OpenAI server listening on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+# Production server settings: gunicorn -c gunicorn.conf.py
+import gc
+import os
+import shutil
+import multiprocessing
+
+wsgi_app = "app:create_app()"
+bind = os.getenv("BIND", "0.0.0.0:" + os.getenv("PORT", "5000"))
+
+# Each worker has its own registry and reloads collections when their
+# on-disk VERSION changes, so workers can be added freely. Threads serve
+# concurrent requests within a worker against the same resident indexes.
+workers = int(os.getenv("WEB_WORKERS", min(4, multiprocessing.cpu_count())))
+threads = int(os.getenv("WEB_THREADS", "8"))
+worker_class = "gthread"
+
+# /chat/stream keeps a response open for the whole answer
+timeout = int(os.getenv("WEB_TIMEOUT", "120"))
+graceful_timeout = int(os.getenv("WEB_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("WEB_KEEPALIVE", "5"))
+
+accesslog = os.getenv("WEB_ACCESS_LOG", "-")
+loglevel = os.getenv("WEB_LOG_LEVEL", "info")
+
+# Workers mirror their metrics here so /metrics on any worker reports all of them
+os.environ.setdefault("METRICS_DIR", os.path.join("data", "metrics"))
+
+
+def on_starting(server):
+    # counters restart with the server; drop samples of workers from earlier runs
+    shutil.rmtree(os.environ["METRICS_DIR"], ignore_errors=True)
+
+    # The app imports LangChain, FAISS and the parsers on first use. Importing
+    # them here, in the master before it forks, means every worker (and every
+    # restarted one) starts with them already in memory. Only modules are
+    # loaded; no clients, threads or sockets are created before the fork.
+    if os.getenv("PRELOAD_IMPORTS", "1").lower() not in ("0", "false", "no"):
+        from reg.lazy import preload
+
+        timings = preload()
+        for name, seconds in sorted(timings.items(), key=lambda item: -item[1]):
+            server.log.info("Preloaded %s in %.0f ms", name, 1000 * seconds)
+        server.log.info("Preloaded %d modules in %.0f ms", len(timings), 1000 * sum(timings.values()))
+        # keep the preloaded objects out of the workers' garbage collections,
+        # which would otherwise scan them (and copy their pages) again and again
+        gc.freeze()
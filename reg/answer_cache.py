@@ -0,0 +1,128 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_TTL_SECONDS = 3600
+DEFAULT_SIMILARITY = 0.95
+
+
+def normalize_query(query: str) -> str:
+    """Lower-case, drop trailing punctuation and collapse whitespace."""
+    return " ".join(query.lower().strip().rstrip("?!. ").split())
+
+
+class AnswerCache:
+    """LRU + TTL cache of chat answers scoped to a collection version.
+
+    An exact hit matches the normalized question text. Otherwise, if an
+    embedding function is given, the question vector is compared with the
+    cached questions of the same collection version, and the closest one at
+    or above `threshold` cosine similarity is served. Entries of older
+    versions can never match, and `invalidate` drops them eagerly.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, ttl: Optional[float] = None, threshold: Optional[float] = None):
+        self.max_entries = max_entries or int(os.getenv("ANSWER_CACHE_SIZE", DEFAULT_MAX_ENTRIES))
+        self.ttl = ttl if ttl is not None else float(os.getenv("ANSWER_CACHE_TTL", DEFAULT_TTL_SECONDS))
+        if threshold is None:
+            threshold = float(os.getenv("ANSWER_CACHE_SIMILARITY", DEFAULT_SIMILARITY))
+        self.threshold = threshold
+        # (collection id, version, normalized query) -> (unit vector or None, answer, created)
+        self._entries: "OrderedDict[Tuple[str, int, str], Tuple[Any, str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.counts = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def _expired(self, created: float) -> bool:
+        return self.ttl > 0 and time.time() - created > self.ttl
+
+    def lookup(self, collection_id: str, version: int, query: str, embed: Optional[Callable[[str], List[float]]] = None):
+        """Return (answer or None, query vector or None).
+
+        The vector is handed back so a following `put` does not have to
+        embed the question a second time.
+        """
+        key = (collection_id, version, normalize_query(query))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not self._expired(entry[2]):
+                self._entries.move_to_end(key)
+                self.counts["exact_hits"] += 1
+                return entry[1], entry[0]
+
+        vector = None
+        if embed is not None and self.threshold <= 1.0:
+            try:
+                vector = np.asarray(embed(query), dtype=np.float32)
+                vector /= np.linalg.norm(vector) or 1.0
+            except Exception as e:
+                logger.warning("Answer cache could not embed query: %s", e)
+                vector = None
+
+        with self._lock:
+            if vector is not None:
+                candidates = [
+                    (k, v) for k, v in self._entries.items()
+                    if k[0] == collection_id and k[1] == version and v[0] is not None
+                    and v[0].shape == vector.shape and not self._expired(v[2])
+                ]
+                if candidates:
+                    sims = np.stack([v[0] for _, v in candidates]) @ vector
+                    best = int(np.argmax(sims))
+                    if sims[best] >= self.threshold:
+                        best_key, best_entry = candidates[best]
+                        self._entries.move_to_end(best_key)
+                        self.counts["semantic_hits"] += 1
+                        return best_entry[1], vector
+            self.counts["misses"] += 1
+        return None, vector
+
+    def put(self, collection_id: str, version: int, query: str, answer: str, vector: Any = None) -> None:
+        key = (collection_id, version, normalize_query(query))
+        with self._lock:
+            self._entries[key] = (vector, answer, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.counts["evictions"] += 1
+
+    def invalidate(self, collection_id: str) -> int:
+        """Drop every cached answer for a collection after its corpus changes."""
+        with self._lock:
+            stale = [k for k in self._entries if k[0] == collection_id]
+            for k in stale:
+                del self._entries[k]
+            self.counts["invalidations"] += len(stale)
+        return len(stale)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self.counts["exact_hits"] + self.counts["semantic_hits"]
+            total = hits + self.counts["misses"]
+            return dict(
+                self.counts,
+                entries=len(self._entries),
+                hit_rate=round(hits / total, 4) if total else 0.0,
+            )
+
+
+_answer_cache = None
+_answer_cache_lock = threading.Lock()
+
+
+def get_answer_cache() -> Optional[AnswerCache]:
+    """Return the process-wide answer cache, or None when ANSWER_CACHE=0."""
+    global _answer_cache
+    if os.getenv("ANSWER_CACHE", "1").lower() in ("0", "false", "no"):
+        return None
+    with _answer_cache_lock:
+        if _answer_cache is None:
+            _answer_cache = AnswerCache()
+        return _answer_cache
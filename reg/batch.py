@@ -0,0 +1,207 @@
+"""Answer many questions against one collection.
+
+    python -m reg.batch questions.txt --collection <id>
+    python -m reg.batch questions.jsonl --file report.pdf --concurrency 16 > answers.jsonl
+
+Questions are read one per line (plain text, or JSON objects with a
+`question` field) from a file or stdin; answers are written as JSON lines
+in the order they complete.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, Iterator, List, Optional
+
+from reg.answer_cache import get_answer_cache
+from reg.chain import route_query
+from reg.context import context_fetch_k
+from reg.hybrid import batch_search_ids
+from reg.latency import StageTimer, span
+
+logger = logging.getLogger(__name__)
+
+# LLM calls in flight per batch; the hedging pool (LLM_MAX_CONCURRENCY) caps the process
+DEFAULT_BATCH_CONCURRENCY = 8
+DEFAULT_BATCH_MAX_QUESTIONS = 1000
+
+
+def batch_concurrency() -> int:
+    return int(os.getenv("BATCH_CONCURRENCY", DEFAULT_BATCH_CONCURRENCY))
+
+
+def batch_max_questions() -> int:
+    return int(os.getenv("BATCH_MAX_QUESTIONS", DEFAULT_BATCH_MAX_QUESTIONS))
+
+
+def embed_queries(vectorstore: Any, questions: List[str]) -> List[List[float]]:
+    """Embed every question with one call to the collection's embedding model.
+
+    Questions are queries, so with the chunk cache wrapper they go through
+    its in-memory query embedder and never into the persistent chunk cache.
+    """
+    embedding_function = vectorstore.embedding_function
+    embed_queries = getattr(embedding_function, "embed_queries", None)
+    if embed_queries is not None:
+        return embed_queries(questions)
+    embed_documents = getattr(embedding_function, "embed_documents", None)
+    if embed_documents is not None:
+        return embed_documents(questions)
+    embed = getattr(embedding_function, "embed_query", embedding_function)
+    return [embed(q) for q in questions]
+
+
+def answer_batch(
+    state: Any, questions: List[str], concurrency: Optional[int] = None, budget: Optional[float] = None
+) -> Iterator[Dict[str, Any]]:
+    """Yield one result per question, as each completes.
+
+    Messages the intent router answers (greetings and the like) come first.
+    The rest are embedded in one call and retrieved with one FAISS
+    search over all their vectors; answers already in the answer cache are
+    yielded first, and the rest go to the LLM `concurrency` at a time.
+    Each LLM call gets its own `budget` (CHAT_BUDGET_SECONDS) from when it
+    starts, not from when the batch was submitted. Every result carries
+    the question's `index` in the input.
+    """
+    concurrency = max(1, concurrency or batch_concurrency())
+    vectorstore, chain = state.vectorstore, state.qa_chain
+    cache = get_answer_cache()
+
+    asked = []
+    for i, question in enumerate(questions):
+        routed = route_query(chain, question)
+        if routed is not None:
+            yield {"index": i, "question": question, "response": routed[0], **routed[1]}
+        else:
+            asked.append(i)
+    if not asked:
+        return
+
+    with span("batch.embed"):
+        vectors = dict(zip(asked, embed_queries(vectorstore, [questions[i] for i in asked])))
+
+    pending = []
+    # normalized by the cache on lookup, and handed back to it on put
+    cache_vectors: Dict[int, Any] = {}
+    for i in asked:
+        question, vector = questions[i], vectors[i]
+        if cache is not None:
+            cached, cache_vectors[i] = cache.lookup(state.id, state.version, question, lambda _q, v=vector: v)
+            if cached is not None:
+                yield {"index": i, "question": question, "response": cached, "cached": True}
+                continue
+        pending.append(i)
+    if not pending:
+        return
+
+    answer_from_docs = getattr(chain, "answer_from_docs", None)
+    retrieved: Dict[int, List[Any]] = {}
+    if answer_from_docs is not None:
+        with span("batch.retrieval"):
+            hits = batch_search_ids(
+                vectorstore,
+                [questions[i] for i in pending],
+                [vectors[i] for i in pending],
+                k=context_fetch_k(),
+                mode=getattr(chain, "mode", None),
+            )
+        for i, ids in zip(pending, hits):
+            retrieved[i] = [vectorstore.docstore.search(doc_id) for doc_id in ids]
+
+    def work(i: int) -> Dict[str, Any]:
+        question = questions[i]
+        timer = StageTimer()
+        with timer.activate():
+            if answer_from_docs is not None:
+                text, info = answer_from_docs(question, retrieved[i], budget=budget, timer=timer)
+            else:
+                text, info = chain.run(question), {"degraded": False}
+        if cache is not None and not info.get("degraded"):
+            cache.put(state.id, state.version, question, text, cache_vectors.get(i))
+        return {"index": i, "question": question, "response": text, **info, "timings": timer.as_dict()}
+
+    pool = ThreadPoolExecutor(max_workers=min(concurrency, len(pending)), thread_name_prefix="batch")
+    try:
+        futures = {pool.submit(work, i): i for i in pending}
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                yield future.result()
+            except Exception as e:
+                logger.warning("Batch question %d failed: %s", i, e)
+                yield {"index": i, "question": questions[i], "error": str(e)}
+    finally:
+        # a client that hangs up mid-stream should not keep the LLM busy
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def read_questions(lines) -> List[str]:
+    """Questions from text lines or JSON lines with a `question` (or `message`) field."""
+    questions = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("{"):
+            item = json.loads(line)
+            line = item.get("question") or item.get("message") or item.get("query") or ""
+        if line:
+            questions.append(line)
+    return questions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Answer a file of questions against a collection, as JSON lines.")
+    parser.add_argument("questions", nargs="?", default="-", help="question file, one per line ('-' for stdin)")
+    parser.add_argument("--collection", help="collection id (default: a new one when --file is given)")
+    parser.add_argument("--file", help="index this file into the collection first")
+    parser.add_argument("--concurrency", type=int, default=None, help="LLM calls in flight (BATCH_CONCURRENCY)")
+    parser.add_argument("--output", default="-", help="output file ('-' for stdout)")
+    args = parser.parse_args(argv)
+
+    from dotenv import load_dotenv
+    from reg.registry import get_registry, valid_collection_id
+    import uuid
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    registry = get_registry()
+
+    collection_id = args.collection or (uuid.uuid4().hex if args.file else None)
+    if not collection_id or not valid_collection_id(collection_id):
+        parser.error("--collection (a valid id) or --file is required")
+    if args.file:
+        _, changes = registry.add_file(collection_id, args.file)
+        logger.info("Indexed %s into %s: %s", args.file, collection_id, changes)
+    state = registry.snapshot(collection_id)
+    if state is None:
+        parser.error(f"unknown collection {collection_id}")
+
+    if args.questions == "-":
+        questions = read_questions(sys.stdin)
+    else:
+        with open(args.questions, encoding="utf8") as f:
+            questions = read_questions(f)
+
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf8")
+    started = time.perf_counter()
+    failed = 0
+    try:
+        for result in answer_batch(state, questions, args.concurrency):
+            failed += "error" in result
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    logger.info("Answered %d questions in %.2fs (%d failed), collection %s",
+                len(questions), time.perf_counter() - started, failed, collection_id)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,25 +1,25 @@
 import os
+import re
+import time
 import logging
-from typing import Any
+import functools
+from typing import Any, Dict, FrozenSet, Iterator, List, Optional, Tuple
 
-try:
-    from langchain_openai import ChatOpenAI
-except Exception:
-    ChatOpenAI = None
-
-try:
-    from langchain.chains import RetrievalQA
-except Exception:
-    RetrievalQA = None
-
-from langchain.prompts import PromptTemplate
+from reg.clients import get_chat_model
+from reg.context import build_context, context_fetch_k
+from reg.federated import federated_enabled, federated_search
+from reg.hybrid import get_bm25, hybrid_search, make_retriever, retriever_mode
+from reg.latency import StageTimer, get_llm_latency, hedged_call, span, timed
+from reg.lazy import optional_module
+from reg.metrics import FALLBACKS, INTENT_ROUTES, LLM_CALLS_AVOIDED
 
 logger = logging.getLogger(__name__)
 
+langchain_openai = optional_module("langchain_openai")
+
 # ---------------- PROMPT (STRICT, NO AUTO-SUMMARY) ----------------
 
-QA_PROMPT = PromptTemplate(
-    template="""
+QA_TEMPLATE = """
 You are a precise question-answering assistant.
 
 Rules:
@@ -43,55 +43,248 @@ Question:
 {question}
 
 Answer:
-""",
-    input_variables=["context", "question"],
-)
+"""
+
+
+@functools.lru_cache(maxsize=None)
+def qa_prompt():
+    """The QA PromptTemplate, built on first use so LangChain is imported lazily."""
+    from langchain.prompts import PromptTemplate
+
+    return PromptTemplate(template=QA_TEMPLATE, input_variables=["context", "question"])
+
 
 # ---------------- FALLBACK CHAIN ----------------
 
+# Line-count requests: "5 line", "10 lines", "5 lien" (typo), "3 paragraph"
+_NUMERIC_LINE_PATTERNS = [
+    re.compile(r'(\d+)\s*line'),
+    re.compile(r'(\d+)\s*lien'),
+    re.compile(r'(\d+)\s*paragraph'),
+]
+
+# Spelled-out counts, checked in this order: "five line", "ten lines", ...
+_WORD_LINE_PATTERNS = [
+    (re.compile(rf'{word}\s*(line|lien|paragraph)'), num)
+    for word, num in [
+        ('one', 1), ('two', 2), ('three', 3), ('four', 4), ('five', 5),
+        ('six', 6), ('seven', 7), ('eight', 8), ('nine', 9), ('ten', 10),
+        ('eleven', 11), ('twelve', 12), ('fifteen', 15), ('twenty', 20),
+    ]
+]
+
+_MY_NAME_PATTERNS = [
+    re.compile(r"my name is\s*[:\-]?\s*([A-Za-z][A-Za-z0-9 _-]+)", re.IGNORECASE),
+]
+_FRIEND_PATTERNS = [
+    re.compile(r"my friend(?:'s)? name is\s*[:\-]?\s*([A-Za-z][A-Za-z0-9 _-]+)", re.IGNORECASE),
+    re.compile(r"friend name is\s*[:\-]?\s*([A-Za-z][A-Za-z0-9 _-]+)", re.IGNORECASE),
+    re.compile(r"my friend is\s*[:\-]?\s*([A-Za-z][A-Za-z0-9 _-]+)", re.IGNORECASE),
+]
+
+
+def extract_personal_answer(query: str, docs: list) -> str:
+    """Try to extract short personal answers (like names) from retrieved docs.
+
+    This function is context-aware: if the user asked "my name" it prefers
+    matches for "my name is ..."; if the user asked about a friend it
+    prefers friend-related patterns. Returns a polite full-sentence reply
+    or empty string when nothing found.
+    """
+    q = (query or "").lower()
+    want_my_name = "my name" in q or "who am i" in q
+    want_friend = "friend" in q
+
+    # A question about a friend tries the friend patterns first
+    if want_friend and not want_my_name:
+        patterns_order = _FRIEND_PATTERNS + _MY_NAME_PATTERNS
+    else:
+        patterns_order = _MY_NAME_PATTERNS + _FRIEND_PATTERNS
+
+    for doc in docs:
+        text = getattr(doc, 'page_content', '') or str(doc)
+        for pat in patterns_order:
+            m = pat.search(text)
+            if m:
+                name = m.group(1).strip()
+                # Normalize capitalization
+                name = " ".join([w.capitalize() for w in name.split()])
+                if want_friend or (not want_my_name and "friend" in pat.pattern):
+                    return f"Your friend's name is {name}."
+                else:
+                    return f"Your name is {name}."
+
+    return ""
+
+
+# ---------------- INTENT ROUTER ----------------
+
+# Every keyword intent in one alternation, so a message is scanned once;
+# each match reports its intent through the name of the group it hit. The
+# lookahead skips word starts no keyword begins with before trying them all.
+_INTENT_RE = re.compile(
+    r"\b(?=[bfhkmosyw])(?:"
+    r"(?P<summarize>summar(?:y|i[sz]\w*)|brief\w*|overview)"
+    r"|(?P<user>my name|who am i)"
+    r"|(?P<assistant>your name|who are you)"
+    r"|(?P<friend>friend(?:'s)?)"
+    r"|(?P<owner>krish)"
+    r"|(?P<how_are_you>how are you)"
+    r")\b"
+)
+# Whole-message identity questions ("what's my name?", "who are you"); a
+# question that only mentions one ("how do I change my name on the
+# account?") goes to the chain like any other
+_IDENTITY_RE = re.compile(
+    r"(?:(?:what(?:'s|s| is)|tell me|do you know) )?(?:my|your|my friend(?:'s|s)?) name(?: is)?"
+    r"|who am i|who are you|who is my friend|(?:who is )?krish"
+)
+# Whole-message greetings and thanks, and the reply each kind gets
+_CASUAL_RE = re.compile(r"(?:hi|hello|hey|thanks|thank you|bye|goodbye)!?")
+_GREETING_RE = re.compile(r"\b(?:hi|hello|hey|how are you|good (?:morning|afternoon|evening))\b")
+_THANKS_RE = re.compile(r"\bthank")
+
+GREETING_REPLY = "I'm doing well, thank you for asking! I'm here to help you find information in your PDF. Feel free to ask me any questions about the document you uploaded."
+THANKS_REPLY = "You're welcome! Is there anything else you'd like to know about your document?"
+CHAT_REPLY = "I'm specifically designed to answer questions about your uploaded PDF document. Please ask me something related to the document, or feel free to chat!"
+ASSISTANT_REPLY = "I'm an AI assistant here to help you find information in your PDF documents."
+OWNER_REPLY = "Your name is Krish."
+PERSONAL_REPLY = "I'm here to help with your uploaded document and answer your questions."
+
+
+class IntentRouter:
+    """Recognizes messages that need neither retrieval nor the LLM.
+
+    Only messages that are nothing but a greeting, thanks or identity
+    question are routed. Greetings, thanks and questions about who the
+    assistant is get a fixed reply. Questions about the user's (or a
+    friend's) name are answered from "my name is ..." sentences in the
+    collection, found through the BM25 index built at ingestion rather
+    than FAISS, so no embedding call is made; "what is my name" otherwise
+    gets the owner's name. Anything else goes to the chain.
+    """
+
+    PERSONAL_K = 15
+
+    def intents(self, query: str) -> FrozenSet[str]:
+        """Keyword intents, plus "casual" or "identity" for a bare greeting or identity question."""
+        text = query.lower().strip()
+        found = {m.lastgroup for m in _INTENT_RE.finditer(text)}
+        if _CASUAL_RE.fullmatch(text) or ("how_are_you" in found and len(text) < 30):
+            found.add("casual")
+        if _IDENTITY_RE.fullmatch(text.rstrip("?!. ")):
+            found.add("identity")
+        return frozenset(found)
+
+    def casual_reply(self, query: str) -> str:
+        text = query.lower()
+        if _GREETING_RE.search(text):
+            return GREETING_REPLY
+        if _THANKS_RE.search(text):
+            return THANKS_REPLY
+        return CHAT_REPLY
+
+    def answer(
+        self, query: str, vectorstore: Any = None, intents: Optional[FrozenSet[str]] = None
+    ) -> Optional[Tuple[str, str]]:
+        """(intent, reply) for a trivial message, or None when a chain should answer it."""
+        intents = self.intents(query) if intents is None else intents
+        if "casual" in intents:
+            return "casual", self.casual_reply(query)
+        if "identity" not in intents:
+            return None
+        if "assistant" in intents and "user" not in intents:
+            return "assistant", ASSISTANT_REPLY
+        if "user" in intents or "friend" in intents:
+            if vectorstore is not None:
+                extracted = extract_personal_answer(query, self._keyword_hits(vectorstore, query))
+                if extracted:
+                    return "personal", extracted
+            if "user" in intents:
+                return "personal", OWNER_REPLY
+        return None
+
+    def _keyword_hits(self, vectorstore: Any, query: str) -> List[Any]:
+        try:
+            hits = get_bm25(vectorstore).search(query, self.PERSONAL_K)
+        except Exception as e:
+            logger.debug("Keyword lookup for a personal question failed: %s", e)
+            return []
+        return [vectorstore.docstore.search(doc_id) for doc_id, _ in hits]
+
+
+INTENT_ROUTER = IntentRouter()
+
+
+def intent_routing_enabled() -> bool:
+    return os.getenv("INTENT_ROUTER", "1").lower() not in ("0", "false", "no")
+
+
+def route_query(chain: Any, query: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """Answer a trivial message before `chain` runs; (text, info) or None.
+
+    Routed messages are counted per intent, and so are the LLM calls they
+    saved when `chain` would have called one.
+    """
+    if not intent_routing_enabled():
+        return None
+    routed = INTENT_ROUTER.answer(query, getattr(chain, "vectorstore", None))
+    if routed is None:
+        return None
+    intent, text = routed
+    INTENT_ROUTES.inc(intent=intent)
+    if getattr(chain, "llm", None) is not None:
+        LLM_CALLS_AVOIDED.inc(intent=intent)
+    return text, {"degraded": False, "intent": intent}
+
+
 class SimpleQAChain:
     """Fallback QA chain that checks relevance before returning excerpts."""
 
-    def __init__(self, vectorstore: Any, k: int = 100):
-        # Retrieve more documents for better context (increased from 5 to 10)
-        self.retriever = vectorstore.as_retriever(search_kwargs={"k": k})
-        self.vectorstore = vectorstore
+    # How many chunks each answer path actually reads
+    ANSWER_K = 3
+    SUMMARY_K = 10
 
-    def run(self, query: str) -> str:
-        # First check if it's a pure casual/greeting question
-        if self._is_casual_question(query):
-            return self._generic_response(query)
-        
-        # Check if it's a personal/meta question about the user (Krish)
-        if self._is_personal_question(query):
-            # try to answer from document content first (e.g., "my friend name is sudip")
+    def __init__(self, vectorstore: Any, mode: Optional[str] = None, federated: bool = False):
+        self.vectorstore = vectorstore
+        self.mode = retriever_mode(mode)
+        self.federated = federated
+
+    def _retrieve(self, query: str, k: int) -> List[Any]:
+        """Run the single retrieval for a query, sized by the answer path."""
+        with span("retrieval"):
+            if self.federated:
+                return [doc for doc, _ in federated_search(self.vectorstore, query, k, mode=self.mode)]
+            if self.mode == "hybrid":
+                return [doc for doc, _ in hybrid_search(self.vectorstore, query, k)]
             try:
-                try:
-                    docs_with_scores = self.vectorstore.similarity_search_with_score(query, k=15)
-                    docs = [doc for doc, score in docs_with_scores if doc is not None]
-                except Exception:
-                    docs = self.retriever.get_relevant_documents(query)
-
-                extracted = self._extract_personal_answer(query, docs)
-                if extracted:
-                    return extracted
+                docs_with_scores = self.vectorstore.similarity_search_with_score(query, k=k)
+                return [doc for doc, score in docs_with_scores if doc is not None]
             except Exception:
-                pass
-
-            return self._answer_personal_question(query)
+                return self.vectorstore.similarity_search(query, k=k)
+
+    @timed("qa.extractive")
+    def run(self, query: str, retrieved: Optional[List[Any]] = None) -> str:
+        """Answer with excerpts; `retrieved` chunks, when given, are used instead of a search."""
+        # Greetings, identity questions and names found in the documents
+        intents = INTENT_ROUTER.intents(query)
+        routed = INTENT_ROUTER.answer(query, self.vectorstore, intents)
+        if routed is not None:
+            return routed[1]
+
+        # Identity questions the documents do not answer (a friend not named
+        # in them, "krish"); the router has already searched them
+        if "identity" in intents:
+            return PERSONAL_REPLY
         
         # Check if it's a summarize request
-        is_summarize = self._is_summarize_request(query)
+        is_summarize = "summarize" in intents
         requested_lines = self._extract_requested_lines(query) if is_summarize else 3
         source_files = set()  # Track which files are used
         
         try:
-            try:
-                docs_with_scores = self.vectorstore.similarity_search_with_score(query, k=15)
-                docs = [doc for doc, score in docs_with_scores if doc is not None]
-            except:
-                # Fallback to regular retrieval
-                docs = self.retriever.get_relevant_documents(query)
+            k = self.SUMMARY_K if is_summarize else self.ANSWER_K
+            docs = self._retrieve(query, k) if retrieved is None else retrieved[:k]
             
             if not docs or len(docs) == 0:
                 return "Not found in the document."
@@ -104,7 +297,7 @@ class SimpleQAChain:
             if is_summarize:
                 # For summarize requests, combine multiple excerpts to get more content
                 all_lines = []
-                for doc in docs[:10]:  # Get up to 10 relevant sections
+                for doc in docs[:self.SUMMARY_K]:  # Get up to 10 relevant sections
                     content = doc.page_content.strip()
                     lines = [line.strip() for line in content.split('\n') if line.strip()]
                     all_lines.extend(lines)
@@ -117,7 +310,7 @@ class SimpleQAChain:
             else:
                 # Get the most relevant excerpts and find best match
                 all_content = []
-                for doc in docs[:3]:  # Check first 3 documents
+                for doc in docs[:self.ANSWER_K]:  # Check first 3 documents
                     all_content.append(doc.page_content.strip())
                 
                 # Use the most relevant one
@@ -153,200 +346,219 @@ class SimpleQAChain:
             logger.error("Error retrieving documents: %s", e)
             return "Unable to retrieve information from the document. Please try again."
     
-    def _is_summarize_request(self, query: str) -> bool:
-        """Check if user is asking for a summary."""
-        keywords = ["summarize", "summary", "give me summary", "brief", "overview"]
-        query_lower = query.lower()
-        return any(keyword in query_lower for keyword in keywords)
-    
     def _extract_requested_lines(self, query: str) -> int:
         """Extract the number of lines requested from the query."""
-        import re
-        
-        # Map spelled-out numbers to digits
-        word_to_num = {
-            'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5,
-            'six': 6, 'seven': 7, 'eight': 8, 'nine': 9, 'ten': 10,
-            'eleven': 11, 'twelve': 12, 'fifteen': 15, 'twenty': 20
-        }
-        
         query_lower = query.lower()
         
         # Look for numeric patterns: "5 line", "10 lines", "5 lien" (typo), etc.
-        numeric_patterns = [
-            r'(\d+)\s*line',  # "5 line", "10 lines"
-            r'(\d+)\s*lien',  # "5 lien" (typo for line)
-            r'(\d+)\s*paragraph',  # "3 paragraph"
-        ]
-        
-        for pattern in numeric_patterns:
-            match = re.search(pattern, query_lower)
+        for pattern in _NUMERIC_LINE_PATTERNS:
+            match = pattern.search(query_lower)
             if match:
                 return int(match.group(1))
         
         # Look for spelled-out numbers: "five line", "ten lines", etc.
-        for word, num in word_to_num.items():
-            if re.search(rf'{word}\s*(line|lien|paragraph)', query_lower):
+        for pattern, num in _WORD_LINE_PATTERNS:
+            if pattern.search(query_lower):
                 return num
         
         # Default to 5 lines for summary if no specific number given
         return 5
     
-    def _is_personal_question(self, query: str) -> bool:
-        """Check if question is about the user (Krish)."""
-        personal_keywords = ["my name", "who am i", "your name", "krish", "my friend", "friend", "my friend's"]
-        query_lower = query.lower()
-        return any(keyword in query_lower for keyword in personal_keywords)
-    
-    def _answer_personal_question(self, query: str) -> str:
-        """Answer personal questions about the user."""
-        query_lower = query.lower()
-        if any(word in query_lower for word in ["my name", "who am i"]):
-            return "Your name is Krish."
-        elif any(word in query_lower for word in ["who are you", "your name"]):
-            return "I'm an AI assistant here to help you find information in your PDF documents."
-        return "I'm here to help with your uploaded document and answer your questions."
-
-    def _extract_personal_answer(self, query: str, docs: list) -> str:
-        """Try to extract short personal answers (like names) from retrieved docs.
-
-        This function is context-aware: if the user asked "my name" it prefers
-        matches for "my name is ..."; if the user asked about a friend it
-        prefers friend-related patterns. Returns a polite full-sentence reply
-        or empty string when nothing found.
-        """
-        import re
-
-        q = (query or "").lower()
-        want_my_name = "my name" in q or "who am i" in q
-        want_friend = "friend" in q
-
-        # Patterns grouped by intent priority
-        my_name_patterns = [r"my name is\s*[:\-]?\s*([A-Za-z][A-Za-z0-9 _-]+)"]
-        friend_patterns = [
-            r"my friend(?:'s)? name is\s*[:\-]?\s*([A-Za-z][A-Za-z0-9 _-]+)",
-            r"friend name is\s*[:\-]?\s*([A-Za-z][A-Za-z0-9 _-]+)",
-            r"my friend is\s*[:\-]?\s*([A-Za-z][A-Za-z0-9 _-]+)",
-        ]
-
-        # If query explicitly asks about my name, try my_name_patterns first
-        patterns_order = []
-        if want_my_name:
-            patterns_order = my_name_patterns + friend_patterns
-        elif want_friend:
-            patterns_order = friend_patterns + my_name_patterns
-        else:
-            # default: try both but prefer exact 'my name' then friend
-            patterns_order = my_name_patterns + friend_patterns
-
-        for doc in docs:
-            text = getattr(doc, 'page_content', '') or str(doc)
-            for pat in patterns_order:
-                m = re.search(pat, text, flags=re.IGNORECASE)
-                if m:
-                    name = m.group(1).strip()
-                    # Normalize capitalization
-                    name = " ".join([w.capitalize() for w in name.split()])
-                    if want_friend or (not want_my_name and "friend" in pat):
-                        return f"Your friend's name is {name}."
-                    else:
-                        return f"Your name is {name}."
-
+# ---------------- LLM CHAIN WITH SOURCES ----------------
+
+def _format_sources(docs) -> str:
+    """Return the "[Source: ...]" footer for the given documents, or ""."""
+    source_files = set()
+    for doc in docs:
+        if hasattr(doc, 'metadata') and doc.metadata and 'source' in doc.metadata:
+            source_files.add(doc.metadata['source'])
+    if not source_files:
         return ""
-    
-    def _is_casual_question(self, query: str) -> bool:
-        """Check if query is a casual greeting/farewell ONLY."""
-        # Very strict - only pure greetings and thanks
-        exact_casual = ["hi", "hello", "hey", "thanks", "thank you", "bye", "goodbye"]
-        query_lower = query.lower().strip()
-        
-        # Check if the entire query (or very close to it) matches a casual phrase
-        for word in exact_casual:
-            if query_lower == word or query_lower == word + "!":
-                return True
-        
-        # Check for "how are you" variations
-        if "how are you" in query_lower and len(query_lower) < 30:
-            return True
-        
-        return False
-    
-    def _generic_response(self, query: str) -> str:
-        """Generate a generic response for non-document questions."""
-        # For general chat questions
-        if any(word in query.lower() for word in ["hi", "hello", "how are you", "hey", "good morning", "good afternoon", "good evening"]):
-            return "I'm doing well, thank you for asking! I'm here to help you find information in your PDF. Feel free to ask me any questions about the document you uploaded."
-        elif any(word in query.lower() for word in ["thank", "thanks"]):
-            return "You're welcome! Is there anything else you'd like to know about your document?"
-        else:
-            return "I'm specifically designed to answer questions about your uploaded PDF document. Please ask me something related to the document, or feel free to chat!"
+    return "\n\n[Source: " + ", ".join(sorted(source_files)) + "]"
+
+
+# Answers treated as failures, so a hedged attempt or the fallback is used
+_UNUSABLE_ANSWERS = ("", "none", "n/a", "not found")
+
+DEFAULT_CHAT_BUDGET = 20.0
 
 
-# ---------------- SAFE WRAPPER ----------------
+def chat_budget() -> float:
+    """Per-request latency budget in seconds (CHAT_BUDGET_SECONDS)."""
+    return float(os.getenv("CHAT_BUDGET_SECONDS", DEFAULT_CHAT_BUDGET))
 
-class SafeQAChain:
-    """Uses RetrievalQA, falls back to SimpleQAChain on any runtime failure."""
 
-    def __init__(self, retrieval_qa, fallback):
-        self.retrieval_qa = retrieval_qa
+def _usable(answer: Any) -> bool:
+    text = getattr(answer, "content", answer)
+    return isinstance(text, str) and text.strip().lower() not in _UNUSABLE_ANSWERS
+
+
+class QAWithSources:
+    """Answers from retrieved chunks with the LLM and appends the source files used."""
+
+    def __init__(self, llm, retriever, fallback=None, mode: Optional[str] = None, vectorstore: Any = None):
+        self.llm = llm
+        self.retriever = retriever
         self.fallback = fallback
+        self.mode = retriever_mode(mode)
+        # what the intent router looks names up in (reg.chain.route_query)
+        self.vectorstore = vectorstore
 
     def run(self, query: str) -> str:
+        return self.answer(query)[0]
+
+    @timed("qa.answer")
+    def answer(
+        self, query: str, budget: Optional[float] = None, timer: Optional[StageTimer] = None
+    ) -> Tuple[str, Dict[str, Any]]:
+        """Answer within `budget` seconds; return (text, info).
+
+        Retrieval runs once; the retrieved chunks are deduplicated, reranked
+        and packed into CONTEXT_TOKEN_BUDGET tokens (reg.context), and the
+        resulting prompt is reused by every LLM attempt.
+        If the first call has not answered by the observed p95 latency
+        (LLM_HEDGE_AFTER overrides it), a second identical call is sent and
+        whichever answers first wins. When the budget runs out, or both
+        calls fail, the extractive SimpleQAChain answer is built from the
+        chunks already retrieved and returned instead.
+        """
+        timer = timer or StageTimer()
+        deadline = time.monotonic() + (chat_budget() if budget is None else budget)
+        with timer.stage("retrieval"):
+            docs = self.retriever.get_relevant_documents(query)
+        return self.answer_from_docs(query, docs, budget=deadline - time.monotonic(), timer=timer)
+
+    def answer_from_docs(
+        self, query: str, docs: List[Any], budget: Optional[float] = None, timer: Optional[StageTimer] = None
+    ) -> Tuple[str, Dict[str, Any]]:
+        """`answer` for chunks retrieved elsewhere (reg.batch searches for many queries at once)."""
+        timer = timer or StageTimer()
+        budget = chat_budget() if budget is None else budget
+        deadline = time.monotonic() + budget
+
+        retrieved = docs
+        with timer.stage("context"):
+            docs, context = build_context(query, docs)
+        with timer.stage("prompt"):
+            prompt = qa_prompt().format(
+                context="\n\n".join(d.page_content for d in docs),
+                question=query,
+            )
+
+        tracker = get_llm_latency()
+        info: Dict[str, Any] = {"degraded": False, "context": context}
+        try:
+            with timer.stage("llm"):
+                result, attempts = hedged_call(
+                    lambda: self.llm.invoke(prompt),
+                    timeout=deadline - time.monotonic(),
+                    hedge_after=tracker.hedge_after(),
+                    attempts=int(os.getenv("LLM_HEDGE_ATTEMPTS", "2")),
+                    accept=_usable,
+                    tracker=tracker,
+                )
+            info.update(attempts)
+            text = getattr(result, "content", result)
+            return text + _format_sources(docs), info
+        except Exception as e:
+            if self.fallback is None:
+                raise
+            logger.warning("LLM answer unavailable (%s), degrading to extractive answer", e)
+            FALLBACKS.inc(kind="simple_qa")
+            info.update(degraded=True, reason=str(e))
+            with timer.stage("fallback"):
+                # from the chunks already retrieved; the budget has no room for another search
+                return self.fallback.run(query, retrieved), info
+
+    def stream(self, query: str) -> Iterator[Tuple[str, Any]]:
+        """Yield ("retrieval", info), then ("token", text) events as the LLM writes.
+
+        Falls back to the extractive SimpleQAChain answer, from the same
+        chunks, if the LLM fails before producing its first token.
+        """
+        with span("retrieval"):
+            retrieved = self.retriever.get_relevant_documents(query)
+        with span("context"):
+            docs, context = build_context(query, retrieved)
+        yield "retrieval", {
+            "chunks": len(docs),
+            "tokens": context["tokens"],
+            "sources": sorted({(d.metadata or {}).get("source", "") for d in docs} - {""}),
+        }
+
+        prompt = qa_prompt().format(
+            context="\n\n".join(d.page_content for d in docs),
+            question=query,
+        )
+        produced = False
         try:
-            return self.retrieval_qa.run(query)
+            for chunk in self.llm.stream(prompt):
+                text = getattr(chunk, "content", chunk)
+                if text:
+                    produced = True
+                    yield "token", text
         except Exception as e:
-            logger.warning("RetrievalQA failed, falling back: %s", e)
-            return self.fallback.run(query)
+            if produced or self.fallback is None:
+                raise
+            logger.warning("LLM stream failed, falling back: %s", e)
+            FALLBACKS.inc(kind="simple_qa")
+            yield "fallback", {"reason": str(e)}
+            yield "token", self.fallback.run(query, retrieved)
+            return
+
+        footer = _format_sources(docs)
+        if produced and footer:
+            yield "token", footer
+
+
+def answer_within_budget(chain: Any, query: str, budget: Optional[float] = None, timer: Optional[StageTimer] = None) -> Tuple[str, Dict[str, Any]]:
+    """Answer with any chain; ones without `answer` run once, unbounded.
+
+    Spans opened while answering, including inside the fallback, are
+    recorded in `timer`.
+    """
+    timer = timer or StageTimer()
+    with timer.activate():
+        answer = getattr(chain, "answer", None)
+        if answer is not None:
+            return answer(query, budget=budget, timer=timer)
+        return chain.run(query), {"degraded": False}
+
+
+def stream_answer(chain: Any, query: str) -> Iterator[Tuple[str, Any]]:
+    """Stream events from any chain; ones without `stream` yield a single token."""
+    stream = getattr(chain, "stream", None)
+    if stream is not None:
+        yield from stream(query)
+    else:
+        yield "token", chain.run(query)
 
 
 # ---------------- BUILDER ----------------
 
-def build_qa_chain(vectorstore: Any):
+def build_qa_chain(vectorstore: Any, mode: Optional[str] = None, federated: Optional[bool] = None):
+    """Build the QA chain; `mode` picks "vector" or "hybrid" retrieval (RETRIEVER_MODE).
+
+    `federated` searches one index per source file in parallel instead of
+    the collection's merged index (FEDERATED_SEARCH).
+    """
     api_key = os.getenv("OPENROUTER_API_KEY") or os.getenv("OPENAI_API_KEY")
-    retriever = vectorstore.as_retriever(search_kwargs={"k": 5})
-    fallback_chain = SimpleQAChain(vectorstore)
+    if federated is None:
+        federated = federated_enabled()
+    # more candidates than fit; build_context keeps what the token budget allows
+    retriever = make_retriever(vectorstore, k=context_fetch_k(), mode=mode, federated=federated)
+    fallback_chain = SimpleQAChain(vectorstore, mode=mode, federated=federated)
 
-    if api_key and ChatOpenAI and RetrievalQA:
+    if api_key and langchain_openai is not None:
         try:
-            llm = ChatOpenAI(
-                model="meta-llama/llama-3-70b-instruct",
-                api_key=api_key,
-                base_url="https://openrouter.ai/api/v1",
+            # shared per process, with its pooled connections (reg.clients)
+            llm = get_chat_model(
                 temperature=0.0,
+                # QAWithSources.answer hedges instead of retrying in the client
+                max_retries=0,
+                timeout=chat_budget(),
             )
-
-            retrieval_qa = RetrievalQA.from_chain_type(
-                llm=llm,
-                retriever=retriever,
-                chain_type="stuff",
-                chain_type_kwargs={"prompt": QA_PROMPT},
-                return_source_documents=True,
-            )
-
-            # Wrap to extract and append source information
-            class QAWithSources:
-                def __init__(self, qa_chain):
-                    self.qa_chain = qa_chain
-                
-                def run(self, query: str) -> str:
-                    result = self.qa_chain({"query": query})
-                    answer = result.get("result", "")
-                    
-                    # Extract source files from documents
-                    source_files = set()
-                    if "source_documents" in result:
-                        for doc in result["source_documents"]:
-                            if hasattr(doc, 'metadata') and doc.metadata and 'source' in doc.metadata:
-                                source_files.add(doc.metadata['source'])
-                    
-                    # Append source information
-                    if source_files and answer:
-                        source_text = ", ".join(sorted(source_files))
-                        answer = answer + "\n\n[Source: " + source_text + "]"
-                    
-                    return answer
-            
-            return QAWithSources(retrieval_qa)
+            return QAWithSources(llm, retriever, fallback_chain, mode=mode, vectorstore=vectorstore)
 
         except Exception as e:
             logger.warning("LLM init failed, using fallback: %s", e)
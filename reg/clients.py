@@ -0,0 +1,165 @@
+import os
+import logging
+import functools
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from reg.lazy import optional_module
+
+logger = logging.getLogger(__name__)
+
+# imported with the first model client, not with the app
+langchain_openai = optional_module("langchain_openai")
+httpx = optional_module("httpx")
+# httpx uses HTTP/2 when h2 is installed
+HTTP2_AVAILABLE = optional_module("h2") is not None
+
+DEFAULT_API_BASE = "https://openrouter.ai/api/v1"
+DEFAULT_CHAT_MODEL = "meta-llama/llama-3-70b-instruct"
+DEFAULT_EMBEDDING_MODEL = "text-embedding-3-large"
+
+
+class ConnectionStats:
+    """Counts requests and newly opened connections on the shared client."""
+
+    def __init__(self):
+        self.requests = 0
+        self.connections = 0
+        self._lock = threading.Lock()
+
+    def request(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    def connection(self) -> None:
+        with self._lock:
+            self.connections += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            requests, connections = self.requests, self.connections
+        reused = max(0, requests - connections)
+        return {
+            "requests": requests,
+            "new_connections": connections,
+            "reused": reused,
+            "reuse_ratio": round(reused / requests, 4) if requests else 0.0,
+        }
+
+
+@functools.lru_cache(maxsize=None)
+def _counting_transport() -> type:
+    """The transport class of the shared client, defined when httpx is first needed."""
+
+    class CountingTransport(httpx.HTTPTransport):
+        """HTTPTransport that records whether each request opened a connection."""
+
+        def __init__(self, stats: ConnectionStats, **kwargs):
+            super().__init__(**kwargs)
+            self.stats = stats
+
+        def _trace(self, event: str, info: Dict[str, Any]) -> None:
+            if event == "connection.connect_tcp.complete":
+                self.stats.connection()
+
+        def handle_request(self, request):
+            self.stats.request()
+            request.extensions["trace"] = self._trace
+            return super().handle_request(request)
+
+    return CountingTransport
+
+
+_stats = ConnectionStats()
+_http_client = None
+_chat_models: Dict[Tuple, Any] = {}
+_embedders: Dict[Tuple, Any] = {}
+_clients_lock = threading.Lock()
+
+
+def _http2_enabled() -> bool:
+    wanted = os.getenv("HTTP2", "1").lower() not in ("0", "false", "no")
+    return wanted and HTTP2_AVAILABLE
+
+
+def get_http_client():
+    """Return the process-wide pooled HTTP client, or None without httpx.
+
+    Connections are kept alive between calls, so every chain and embedder
+    in the process reuses the same TLS sessions instead of opening new
+    ones per upload. Pool size and timeouts come from HTTP_MAX_CONNECTIONS,
+    HTTP_MAX_KEEPALIVE, HTTP_KEEPALIVE_EXPIRY, HTTP_TIMEOUT and
+    HTTP_CONNECT_TIMEOUT; HTTP/2 is used when the h2 package is installed
+    (HTTP2=0 turns it off).
+    """
+    global _http_client
+    if httpx is None:
+        return None
+    with _clients_lock:
+        if _http_client is None:
+            limits = httpx.Limits(
+                max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", "100")),
+                max_keepalive_connections=int(os.getenv("HTTP_MAX_KEEPALIVE", "20")),
+                keepalive_expiry=float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30")),
+            )
+            timeout = httpx.Timeout(
+                float(os.getenv("HTTP_TIMEOUT", "60")),
+                connect=float(os.getenv("HTTP_CONNECT_TIMEOUT", "5")),
+            )
+            http2 = _http2_enabled()
+            _http_client = httpx.Client(
+                transport=_counting_transport()(_stats, http2=http2, limits=limits),
+                timeout=timeout,
+            )
+            logger.info("Created shared HTTP client (http2=%s, %s)", http2, limits)
+        return _http_client
+
+
+def connection_stats() -> Dict[str, Any]:
+    """Requests, new connections and the reuse ratio of the shared client."""
+    return {**_stats.to_dict(), "http2": _http2_enabled()}
+
+
+def _api_settings() -> Tuple[Optional[str], str]:
+    key = os.getenv("OPENROUTER_API_KEY") or os.getenv("OPENAI_API_KEY")
+    return key, os.getenv("OPENAI_API_BASE", DEFAULT_API_BASE)
+
+
+def get_chat_model(**options):
+    """Return the shared ChatOpenAI for these options, or None without an API key.
+
+    Models are cached per (key, base URL, options), so every chain built
+    in the process uses the same client and connection pool.
+    """
+    key, base = _api_settings()
+    if not key or langchain_openai is None:
+        return None
+    options.setdefault("model", DEFAULT_CHAT_MODEL)
+    cache_key = (key, base, tuple(sorted(options.items())))
+    with _clients_lock:
+        model = _chat_models.get(cache_key)
+    if model is None:
+        model = langchain_openai.ChatOpenAI(api_key=key, base_url=base, http_client=get_http_client(), **options)
+        with _clients_lock:
+            model = _chat_models.setdefault(cache_key, model)
+    return model
+
+
+def get_openai_embeddings(model: str = DEFAULT_EMBEDDING_MODEL):
+    """Return the shared OpenAIEmbeddings client, or None without an API key."""
+    key, base = _api_settings()
+    if not key or langchain_openai is None:
+        return None
+    cache_key = (key, base, model)
+    with _clients_lock:
+        embedder = _embedders.get(cache_key)
+    if embedder is None:
+        embedder = langchain_openai.OpenAIEmbeddings(
+            openai_api_key=key,
+            openai_api_base=base,
+            model=model,
+            http_client=get_http_client(),
+        )
+        with _clients_lock:
+            embedder = _embedders.setdefault(cache_key, embedder)
+    return embedder
@@ -0,0 +1,218 @@
+import os
+import math
+import logging
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from reg.hybrid import reciprocal_rank_fusion, tokenize
+
+logger = logging.getLogger(__name__)
+
+# Tokens of retrieved text sent with each question (0 = no limit); room for
+# the five full chunks (CHUNK_SIZE 1200 characters, ~300 tokens) sent before
+DEFAULT_TOKEN_BUDGET = 1600
+# Candidates retrieved for the builder to choose from, and how many it keeps
+DEFAULT_FETCH_K = 8
+DEFAULT_MAX_CHUNKS = 5
+# Seconds a request waits for tiktoken's vocabulary, downloaded on first use
+DEFAULT_TIKTOKEN_TIMEOUT = 2.0
+# Shortest shared run of text treated as splitter overlap rather than chance
+MIN_OVERLAP_CHARS = 32
+# Overlap is searched for in this many trailing characters of a chunk
+MAX_OVERLAP_CHARS = 400
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+
+def token_budget() -> int:
+    return int(os.getenv("CONTEXT_TOKEN_BUDGET", DEFAULT_TOKEN_BUDGET))
+
+
+def context_fetch_k() -> int:
+    return int(os.getenv("CONTEXT_FETCH_K", DEFAULT_FETCH_K))
+
+
+def context_max_chunks() -> int:
+    return int(os.getenv("CONTEXT_MAX_CHUNKS", DEFAULT_MAX_CHUNKS))
+
+
+_encoding = None
+_encoding_started = False
+_encoding_given_up = False
+_encoding_ready = threading.Event()
+_encoding_lock = threading.Lock()
+
+
+def _load_encoding() -> None:
+    global _encoding
+    try:
+        import tiktoken
+        _encoding = tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # the vocabulary is downloaded on first use, which fails offline
+        logger.info("tiktoken unavailable (%s); estimating tokens from length", e)
+    finally:
+        _encoding_ready.set()
+
+
+def _get_encoding():
+    """Return cl100k_base, or None to estimate tokens from length.
+
+    The encoding is loaded once, in a background thread, since an offline
+    host can block on the vocabulary download. Callers wait for it at most
+    TIKTOKEN_TIMEOUT seconds, outside any lock; after one timeout nobody
+    waits again, and the encoding is used if it still arrives.
+    """
+    global _encoding_started, _encoding_given_up
+    with _encoding_lock:
+        if not _encoding_started:
+            _encoding_started = True
+            threading.Thread(target=_load_encoding, name="tiktoken-load", daemon=True).start()
+    timeout = float(os.getenv("TIKTOKEN_TIMEOUT", DEFAULT_TIKTOKEN_TIMEOUT))
+    if not _encoding_given_up and not _encoding_ready.wait(timeout):
+        _encoding_given_up = True
+        logger.info("tiktoken vocabulary still loading; estimating tokens from length")
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    """Tokens in `text` with cl100k_base, or about four characters per token without it."""
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def _overlap(first: str, second: str) -> int:
+    """Length of the longest suffix of `first` that starts `second`."""
+    probe = second[:MIN_OVERLAP_CHARS]
+    if len(probe) < MIN_OVERLAP_CHARS:
+        return 0
+    position = first.find(probe, max(0, len(first) - MAX_OVERLAP_CHARS))
+    while position != -1:
+        if second.startswith(first[position:]):
+            return len(first) - position
+        position = first.find(probe, position + 1)
+    return 0
+
+
+def dedupe_chunks(docs: List[Any]) -> List[Any]:
+    """Drop repeated chunks and trim text that neighbouring chunks already carry.
+
+    The splitter repeats up to CHUNK_OVERLAP characters between consecutive
+    chunks of a source, so when both are retrieved the shared run would be
+    sent twice. Chunks whose text is contained in one already kept (the
+    same file uploaded under two names, say) are dropped.
+    """
+    from langchain_core.documents import Document
+
+    kept: List[Any] = []
+    for doc in docs:
+        text = (doc.page_content or "").strip()
+        if not text or any(text in k.page_content for k in kept):
+            continue
+        source = (doc.metadata or {}).get("source")
+        for other in kept:
+            if (other.metadata or {}).get("source") != source:
+                continue
+            text = text[_overlap(other.page_content, text):]
+            cut = _overlap(text, other.page_content)
+            if cut:
+                text = text[:len(text) - cut]
+        if len(text.strip()) < MIN_OVERLAP_CHARS:
+            continue
+        kept.append(Document(page_content=text.strip(), metadata=dict(doc.metadata or {})))
+    return kept
+
+
+def rerank(query: str, docs: List[Any]) -> List[Any]:
+    """Reorder candidates by BM25 over the candidate set, fused with retrieval order.
+
+    Term statistics come from the candidates themselves, so a term every
+    candidate shares counts for little and the query's rarer terms decide.
+    Reciprocal rank fusion with the retriever's order keeps semantic
+    matches that share no words with the query.
+    """
+    terms = set(tokenize(query))
+    if not terms or len(docs) < 2:
+        return list(docs)
+    counts = [Counter(tokenize(doc.page_content)) for doc in docs]
+    lengths = [sum(c.values()) for c in counts]
+    avg_len = sum(lengths) / len(lengths) or 1.0
+    n = len(docs)
+
+    scores = []
+    for tf, length in zip(counts, lengths):
+        score = 0.0
+        for term in terms:
+            freq = tf.get(term, 0)
+            if not freq:
+                continue
+            df = sum(1 for c in counts if term in c)
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            score += idf * freq * (BM25_K1 + 1) / (freq + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_len))
+        scores.append(score)
+
+    retrieval_order = [str(i) for i in range(n)]
+    lexical_order = [str(i) for i in sorted(range(n), key=lambda i: -scores[i]) if scores[i] > 0]
+    fused = reciprocal_rank_fusion([retrieval_order, lexical_order])
+    return [docs[int(i)] for i, _ in fused]
+
+
+def _truncate(text: str, tokens: int, budget: int) -> str:
+    """Cut `text` to about `budget` tokens, ending at a sentence or word break."""
+    cut = text[:max(1, len(text) * budget // tokens)]
+    for boundary in (". ", "\n", " "):
+        end = cut.rfind(boundary)
+        if end > len(cut) // 2:
+            return cut[:end + 1].strip()
+    return cut
+
+
+def pack(docs: List[Any], budget: int, max_chunks: int = 0) -> Tuple[List[Any], int]:
+    """Take up to `max_chunks` chunks in order while they fit in `budget` tokens.
+
+    Returns (chunks, tokens). A chunk that does not fit is skipped in
+    favour of smaller ones after it. If not even the first fits, it is
+    truncated so the answer always has some context. 0 disables either
+    limit.
+    """
+    from langchain_core.documents import Document
+
+    packed: List[Any] = []
+    used = 0
+    for doc in docs:
+        if max_chunks and len(packed) >= max_chunks:
+            break
+        tokens = count_tokens(doc.page_content)
+        if budget <= 0 or used + tokens <= budget:
+            packed.append(doc)
+            used += tokens
+        elif not packed:
+            text = _truncate(doc.page_content, tokens, budget)
+            packed.append(Document(page_content=text, metadata=doc.metadata))
+            used += count_tokens(text)
+    return packed, used
+
+
+def build_context(
+    query: str, docs: List[Any], budget: Optional[int] = None, max_chunks: Optional[int] = None
+) -> Tuple[List[Any], Dict[str, int]]:
+    """Dedupe, rerank and pack retrieved chunks for the prompt; return (chunks, stats).
+
+    The budget (CONTEXT_TOKEN_BUDGET) and chunk limit (CONTEXT_MAX_CHUNKS)
+    are caps, so the reranker picks the best of the CONTEXT_FETCH_K
+    candidates rather than padding the prompt with the rest.
+    """
+    budget = token_budget() if budget is None else budget
+    max_chunks = context_max_chunks() if max_chunks is None else max_chunks
+    candidates = rerank(query, dedupe_chunks(docs))
+    packed, tokens = pack(candidates, budget, max_chunks)
+    return packed, {
+        "candidates": len(docs),
+        "chunks": len(packed),
+        "tokens": tokens,
+        "tokens_retrieved": sum(count_tokens(d.page_content) for d in docs),
+    }
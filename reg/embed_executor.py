@@ -0,0 +1,194 @@
+import os
+import time
+import random
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import CancelledError, ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, List, Optional
+
+from reg.index_store import embeddings_fingerprint
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 64
+DEFAULT_CONCURRENCY = 4
+DEFAULT_MAX_RETRIES = 5
+
+# Partially embedded inputs, so a failed ingestion resumes where it stopped
+_MAX_CHECKPOINTS = 16
+_checkpoints: "OrderedDict[str, Dict[int, List[List[float]]]]" = OrderedDict()
+_checkpoints_lock = threading.Lock()
+
+
+class EmbeddingError(Exception):
+    """Raised when a batch still fails after all retries.
+
+    The batches that did succeed are kept, and embedding the same texts
+    again with the same model only sends the remaining ones.
+    """
+
+    def __init__(self, message: str, completed: int, total: int):
+        super().__init__(message)
+        self.completed = completed
+        self.total = total
+
+
+def _status_code(exc: Exception) -> Optional[int]:
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_retryable(exc: Exception) -> bool:
+    """Rate limits, server errors and dropped connections are worth retrying."""
+    status = _status_code(exc)
+    if status is not None:
+        return status == 429 or status >= 500
+    if isinstance(exc, (ConnectionError, TimeoutError)):
+        return True
+    return type(exc).__name__ in ("APIConnectionError", "APITimeoutError", "ConnectTimeout", "ReadTimeout")
+
+
+def _retry_after(exc: Exception) -> Optional[float]:
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _checkpoint_key(texts: List[str], fingerprint: str) -> str:
+    h = hashlib.sha256(fingerprint.encode("utf-8"))
+    for t in texts:
+        h.update(hashlib.sha256(t.encode("utf-8")).digest())
+    return h.hexdigest()
+
+
+class EmbeddingExecutor:
+    """Embeds texts in fixed-size batches on a bounded thread pool.
+
+    Each batch is retried with jittered exponential backoff on 429 and 5xx
+    responses. A 429 also pauses every worker until the server's
+    Retry-After (or the backoff delay) has passed, so the pool backs off as
+    a whole instead of each thread hammering the API independently.
+    """
+
+    def __init__(
+        self,
+        embeddings: Any,
+        batch_size: Optional[int] = None,
+        max_concurrency: Optional[int] = None,
+        max_retries: Optional[int] = None,
+        base_delay: float = 0.5,
+        max_delay: float = 30.0,
+    ):
+        self.embeddings = embeddings
+        self.batch_size = batch_size or int(os.getenv("EMBED_BATCH_SIZE", DEFAULT_BATCH_SIZE))
+        self.max_concurrency = max_concurrency or int(os.getenv("EMBED_CONCURRENCY", DEFAULT_CONCURRENCY))
+        if max_retries is None:
+            max_retries = int(os.getenv("EMBED_MAX_RETRIES", DEFAULT_MAX_RETRIES))
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.stats: Dict[str, float] = {}
+        self._retries = 0
+        self._pause_until = 0.0
+        self._lock = threading.Lock()
+
+    def _pause(self, seconds: float) -> None:
+        with self._lock:
+            self._pause_until = max(self._pause_until, time.monotonic() + seconds)
+
+    def _wait_for_pause(self) -> None:
+        while True:
+            with self._lock:
+                remaining = self._pause_until - time.monotonic()
+            if remaining <= 0:
+                return
+            time.sleep(remaining)
+
+    def _embed_batch(self, batch: List[str]) -> List[List[float]]:
+        for attempt in range(self.max_retries + 1):
+            self._wait_for_pause()
+            try:
+                return self.embeddings.embed_documents(batch)
+            except Exception as e:
+                if attempt == self.max_retries or not is_retryable(e):
+                    raise
+                delay = _retry_after(e)
+                if delay is None:
+                    delay = min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+                if _status_code(e) == 429:
+                    self._pause(delay)
+                with self._lock:
+                    self._retries += 1
+                logger.warning("Embedding batch failed (%s), retry %s in %.2fs", e, attempt + 1, delay)
+                time.sleep(delay)
+
+    def embed(self, texts: List[str], progress: Optional[Callable] = None) -> List[List[float]]:
+        """Embed `texts`, returning vectors in input order."""
+        key = _checkpoint_key(texts, embeddings_fingerprint(self.embeddings))
+        with _checkpoints_lock:
+            done = _checkpoints.pop(key, {})
+        if done:
+            logger.info("Resuming embedding from checkpoint: %s batches already done", len(done))
+
+        batches = {
+            i: texts[start:start + self.batch_size]
+            for i, start in enumerate(range(0, len(texts), self.batch_size))
+            if i not in done
+        }
+        started = time.perf_counter()
+        embedded = sum(len(v) for v in done.values())
+        self._retries = 0
+        error = None
+
+        pool = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="embed")
+        try:
+            futures = {pool.submit(self._embed_batch, batch): i for i, batch in batches.items()}
+            for future in as_completed(futures):
+                try:
+                    done[futures[future]] = future.result()
+                except CancelledError:
+                    continue
+                except Exception as e:
+                    error = error or e
+                    # stop queued batches; the ones in flight still finish
+                    for f in futures:
+                        f.cancel()
+                    continue
+                embedded += len(batches[futures[future]])
+                if progress:
+                    progress("embedding", embedded)
+        finally:
+            pool.shutdown(wait=True)
+
+        elapsed = time.perf_counter() - started
+        fresh = sum(len(batches[i]) for i in batches if i in done)
+        self.stats = {
+            "chunks": fresh,
+            "seconds": round(elapsed, 3),
+            "chunks_per_second": round(fresh / elapsed, 1) if elapsed > 0 else 0.0,
+            "batches": len(batches),
+            "retries": self._retries,
+        }
+
+        if error is not None:
+            with _checkpoints_lock:
+                _checkpoints[key] = done
+                while len(_checkpoints) > _MAX_CHECKPOINTS:
+                    _checkpoints.popitem(last=False)
+            raise EmbeddingError(
+                f"Embedding stopped after {embedded}/{len(texts)} chunks: {error}",
+                completed=embedded,
+                total=len(texts),
+            ) from error
+
+        logger.info(
+            "Embedded %s chunks in %.2fs (%.1f chunks/s, %s retries)",
+            fresh, elapsed, self.stats["chunks_per_second"], self._retries,
+        )
+        return [vector for i in sorted(done) for vector in done[i]]
@@ -0,0 +1,337 @@
+import os
+import time
+import hashlib
+import functools
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from reg.lazy import optional_module
+from reg.metrics import QUERY_EMBED_BATCH_SIZE, QUERY_EMBEDDINGS
+
+logger = logging.getLogger(__name__)
+
+langchain_embeddings = optional_module("langchain_core.embeddings")
+
+DEFAULT_CACHE_PATH = os.path.join("data", "embedding_cache.sqlite3")
+# Query embeddings: how long the first miss of a batch waits for others,
+# the most queries sent in one call, and how many recent vectors are kept
+DEFAULT_QUERY_WINDOW_MS = 3
+DEFAULT_QUERY_MAX_BATCH = 64
+DEFAULT_QUERY_CACHE_SIZE = 1024
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so re-flowed copies of a chunk share one entry."""
+    return " ".join(text.split())
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Persistent chunk-level vector cache in SQLite.
+
+    Rows are keyed by (model, dim, normalized text hash) and stored as raw
+    float32 bytes. Each thread gets its own connection; WAL mode lets
+    several workers read while one writes.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.getenv("EMBED_CACHE_PATH", DEFAULT_CACHE_PATH)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL, dim INTEGER NOT NULL, text_hash TEXT NOT NULL,"
+            " vector BLOB NOT NULL, PRIMARY KEY (model, dim, text_hash))"
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, model: str, dim: int, hashes: List[str]) -> Dict[str, List[float]]:
+        found: Dict[str, List[float]] = {}
+        conn = self._connect()
+        unique = list(dict.fromkeys(hashes))
+        # stay under SQLite's bound-parameter limit
+        for start in range(0, len(unique), 500):
+            part = unique[start:start + 500]
+            rows = conn.execute(
+                "SELECT text_hash, vector FROM embeddings WHERE model = ? AND dim = ?"
+                f" AND text_hash IN ({','.join('?' * len(part))})",
+                [model, dim, *part],
+            ).fetchall()
+            for h, blob in rows:
+                found[h] = np.frombuffer(blob, dtype=np.float32).tolist()
+        with self._lock:
+            hit = sum(1 for h in hashes if h in found)
+            self.hits += hit
+            self.misses += len(hashes) - hit
+        return found
+
+    def put_many(self, model: str, dim: int, items: Dict[str, List[float]]) -> None:
+        if not items:
+            return
+        self._connect().executemany(
+            "INSERT OR IGNORE INTO embeddings (model, dim, text_hash, vector) VALUES (?, ?, ?, ?)",
+            [(model, dim, h, np.asarray(v, dtype=np.float32).tobytes()) for h, v in items.items()],
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+class QueryEmbedder:
+    """Embeds search queries for one model, coalescing concurrent misses.
+
+    Recent query vectors are kept in an in-memory LRU, so a question
+    embedded for the answer cache is not embedded again for retrieval.
+    A miss joins the batch being collected; the thread that opened the
+    batch sends it as one `embed_documents` call, and later queries start
+    the next batch. While another call is in flight (i.e. under load) it
+    first waits up to `window` seconds, or until `max_batch` queries are
+    queued, so a lone query is never held back. Identical queries in
+    flight share one slot. Models computed in-process (`local = True`)
+    never wait, as there is no round trip to save.
+    """
+
+    def __init__(self, embeddings: Any, window: Optional[float] = None, max_batch: Optional[int] = None, cache_size: Optional[int] = None):
+        self.embeddings = embeddings
+        if window is None:
+            window = float(os.getenv("QUERY_EMBED_WINDOW_MS", DEFAULT_QUERY_WINDOW_MS)) / 1000
+        self.window = 0.0 if getattr(embeddings, "local", False) else window
+        self.max_batch = max(1, max_batch or int(os.getenv("QUERY_EMBED_MAX_BATCH", DEFAULT_QUERY_MAX_BATCH)))
+        if cache_size is None:
+            cache_size = int(os.getenv("QUERY_EMBED_CACHE_SIZE", DEFAULT_QUERY_CACHE_SIZE))
+        self.cache_size = cache_size
+        # normalized query -> float32 vector
+        self._cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._pending: Dict[str, Future] = {}
+        self._collecting: Optional[List[Tuple[str, str, Future]]] = None
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._filled = threading.Condition(self._lock)
+
+    def embed(self, text: str) -> List[float]:
+        key = normalize_text(text)
+        leader = False
+        with self._lock:
+            vector = self._cache.get(key)
+            if vector is not None:
+                self._cache.move_to_end(key)
+                QUERY_EMBEDDINGS.inc(result="hit")
+                return vector.tolist()
+            future = self._pending.get(key)
+            if future is not None:
+                QUERY_EMBEDDINGS.inc(result="shared")
+            else:
+                QUERY_EMBEDDINGS.inc(result="embedded")
+                future = self._pending[key] = Future()
+                batch = self._collecting
+                if batch is None or len(batch) >= self.max_batch:
+                    batch = self._collecting = []
+                    leader = True
+                batch.append((key, text, future))
+                if len(batch) >= self.max_batch:
+                    self._filled.notify_all()
+        if leader:
+            self._send(batch)
+        return future.result().tolist()
+
+    def _send(self, batch: List[Tuple[str, str, Future]]) -> None:
+        """Collect `batch` (for the window, if a call is in flight), embed it and resolve its futures."""
+        with self._filled:
+            if self._in_flight:
+                deadline = time.monotonic() + self.window
+                while len(batch) < self.max_batch and time.monotonic() < deadline:
+                    self._filled.wait(deadline - time.monotonic())
+            if self._collecting is batch:
+                self._collecting = None
+            self._in_flight += 1
+        try:
+            vectors = np.asarray(self.embeddings.embed_documents([text for _, text, _ in batch]), dtype=np.float32)
+        except BaseException as e:
+            with self._lock:
+                self._in_flight -= 1
+                for key, _, _ in batch:
+                    self._pending.pop(key, None)
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+        QUERY_EMBED_BATCH_SIZE.observe(len(batch))
+        with self._lock:
+            self._in_flight -= 1
+            for key, _, _ in batch:
+                self._pending.pop(key, None)
+            self._remember([key for key, _, _ in batch], vectors)
+        for (_, _, future), vector in zip(batch, vectors):
+            future.set_result(vector)
+
+    def _remember(self, keys: List[str], vectors: np.ndarray) -> None:
+        """Add vectors to the LRU, evicting the oldest; needs the lock."""
+        if self.cache_size <= 0:
+            return
+        for key, vector in zip(keys, vectors):
+            self._cache[key] = vector
+            self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def embed_many(self, texts: List[str]) -> List[List[float]]:
+        """Embed a list of queries (reg.batch): one call for those not in the LRU."""
+        keys = [normalize_text(t) for t in texts]
+        found: Dict[str, np.ndarray] = {}
+        with self._lock:
+            for key in keys:
+                vector = self._cache.get(key)
+                if vector is not None:
+                    self._cache.move_to_end(key)
+                    found[key] = vector
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+        hits = sum(1 for key in keys if key in found)
+        QUERY_EMBEDDINGS.inc(hits, result="hit")
+        QUERY_EMBEDDINGS.inc(len(missing), result="embedded")
+        QUERY_EMBEDDINGS.inc(len(keys) - hits - len(missing), result="shared")
+        if missing:
+            vectors = np.asarray(self.embeddings.embed_documents(list(missing.values())), dtype=np.float32)
+            QUERY_EMBED_BATCH_SIZE.observe(len(missing))
+            with self._lock:
+                self._remember(list(missing), vectors)
+            found.update(zip(missing, vectors))
+        return [found[key].tolist() for key in keys]
+
+
+_query_embedders: Dict[Tuple[str, str, int, str], QueryEmbedder] = {}
+_query_embedders_lock = threading.Lock()
+
+# where (and as whom) a remote model is called; see reg.clients
+ENDPOINT_ATTRS = ("openai_api_base", "azure_endpoint", "deployment", "openai_organization", "openai_api_key")
+
+
+def _endpoint(embeddings: Any) -> str:
+    """Digest of the endpoint and credentials of `embeddings`; '' for in-process models."""
+    parts = []
+    for name in ENDPOINT_ATTRS:
+        value = getattr(embeddings, name, None)
+        if hasattr(value, "get_secret_value"):
+            value = value.get_secret_value()
+        parts.append(str(value or ""))
+    if not any(parts):
+        return ""
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+def get_query_embedder(embeddings: Any, model: str, dim: int) -> QueryEmbedder:
+    """Return the process-wide query embedder of a model, shared by every collection using it.
+
+    Clients of the same model behind another base URL or API key get
+    their own, so a query is never sent with someone else's credentials.
+    """
+    key = (type(embeddings).__name__, model, dim, _endpoint(embeddings))
+    with _query_embedders_lock:
+        embedder = _query_embedders.get(key)
+        if embedder is None:
+            embedder = _query_embedders[key] = QueryEmbedder(embeddings)
+        return embedder
+
+
+class CachedEmbeddings:
+    """Wraps an embeddings object so only texts missing from the cache are sent.
+
+    Queries go through the model's shared `QueryEmbedder` instead; with
+    no chunk cache (EMBED_CACHE=0) documents are always embedded.
+    """
+
+    def __init__(self, inner: Any, cache: Optional[EmbeddingCache]):
+        self.inner = inner
+        self.cache = cache
+        self.model = getattr(inner, "model", None) or type(inner).__name__
+        self.dim = int(getattr(inner, "dim", None) or getattr(inner, "dimensions", None) or 0)
+        self.queries = get_query_embedder(inner, self.model, self.dim)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.cache is None:
+            return self.inner.embed_documents(texts)
+        hashes = [text_hash(t) for t in texts]
+        found = self.cache.get_many(self.model, self.dim, hashes)
+        missing = [i for i, h in enumerate(hashes) if h not in found]
+        if missing:
+            vectors = self.inner.embed_documents([texts[i] for i in missing])
+            fresh = {hashes[i]: v for i, v in zip(missing, vectors)}
+            self.cache.put_many(self.model, self.dim, fresh)
+            found.update(fresh)
+        return [found[h] for h in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        # kept in memory only; one-off queries would dilute the chunk cache
+        return self.queries.embed(text)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embed many queries at once, through the query embedder as well."""
+        return self.queries.embed_many(texts)
+
+    def __call__(self, text: str) -> List[float]:
+        return self.embed_query(text)
+
+
+_embedding_cache = None
+_embedding_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """Return the process-wide cache, or None when EMBED_CACHE=0."""
+    global _embedding_cache
+    if os.getenv("EMBED_CACHE", "1").lower() in ("0", "false", "no"):
+        return None
+    with _embedding_cache_lock:
+        if _embedding_cache is None:
+            try:
+                _embedding_cache = EmbeddingCache()
+            except Exception as e:
+                logger.warning("Embedding cache unavailable: %s", e)
+                return None
+        return _embedding_cache
+
+
+@functools.lru_cache(maxsize=None)
+def _register_embeddings_type() -> None:
+    """Make CachedEmbeddings pass LangChain's isinstance(..., Embeddings) checks.
+
+    It is registered as a virtual subclass on first use instead of
+    inheriting, so importing this module does not import langchain_core.
+    """
+    if langchain_embeddings is not None:
+        langchain_embeddings.Embeddings.register(CachedEmbeddings)
+
+
+def with_cache(embeddings: Any) -> Any:
+    """Wrap `embeddings` with the shared chunk cache (when enabled) and query embedder."""
+    _register_embeddings_type()
+    if isinstance(embeddings, CachedEmbeddings):
+        return embeddings
+    return CachedEmbeddings(embeddings, get_embedding_cache())
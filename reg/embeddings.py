@@ -1,41 +1,114 @@
 import os
 import logging
-from typing import List
+from typing import List, Optional
 
-try:
-    from langchain_openai import OpenAIEmbeddings
-except Exception:
-    OpenAIEmbeddings = None
+import numpy as np
+
+from reg.clients import get_openai_embeddings
+from reg.embedding_cache import with_cache
+from reg.lazy import optional_module
+from reg.metrics import FALLBACKS
 
 logger = logging.getLogger(__name__)
 
+langchain_openai = optional_module("langchain_openai")
+
+
+DEFAULT_BASIC_DIM = 384
+
+# Bytes that belong to a token: ASCII letters, digits, "_" and every byte of
+# a multi-byte UTF-8 character
+_WORD_BYTES = np.zeros(256, dtype=bool)
+for _chars in (b"0123456789", b"abcdefghijklmnopqrstuvwxyz", b"_"):
+    _WORD_BYTES[np.frombuffer(_chars, dtype=np.uint8)] = True
+_WORD_BYTES[128:] = True
+
+# Polynomial hash weights per byte position inside a token (uint64 wraps)
+_MAX_TOKEN_BYTES = 64
+_POWERS = np.concatenate(([1], np.cumprod(np.full(_MAX_TOKEN_BYTES - 1, 1099511628211, dtype=np.uint64)))).astype(np.uint64)
+
+# Texts hashed per numpy pass, which bounds temporary memory
+_HASH_BATCH = 2048
+
+
+def _mix(h: np.ndarray) -> np.ndarray:
+    """64-bit finalizer so every output bit depends on every input bit."""
+    h = h ^ (h >> np.uint64(33))
+    h = h * np.uint64(0xFF51AFD7ED558CCD)
+    return h ^ (h >> np.uint64(33))
+
 
 class BasicEmbeddings:
-    """A very small deterministic fallback embeddings implementation.
+    """Deterministic local embeddings from hashed word uni- and bigrams.
 
     This avoids calling remote APIs so the app can index PDFs offline
-    for testing or when no API key is configured.
+    (air-gapped installs, tests, no API key). Each text becomes a signed
+    feature-hashed bag of words and word bigrams with sublinear term
+    frequency, L2-normalized so inner product and L2 distance rank the
+    same. Tokenizing and hashing run as numpy array operations over the
+    UTF-8 bytes of a whole batch, with no per-token Python work.
     """
 
-    def __init__(self, dim: int = 32):
-        self.dim = dim
+    # Part of the embeddings fingerprint; bump when the features change so
+    # cached vectors from an older scheme are never mixed in
+    model = "hashed-ngrams-v1"
+    # computed in-process, so queries are not held back to be batched
+    local = True
 
-    def _text_to_vector(self, text: str) -> List[float]:
-        import hashlib
+    def __init__(self, dim: Optional[int] = None):
+        self.dim = dim or int(os.getenv("BASIC_EMBEDDINGS_DIM", DEFAULT_BASIC_DIM))
 
-        h = hashlib.sha256(text.encode("utf-8")).digest()
-        vec = []
-        for i in range(self.dim):
-            b = h[i % len(h)]
-            # map byte 0-255 to float -1.0..1.0
-            vec.append((b / 127.5) - 1.0)
-        return vec
+    def _features(self, texts: List[str]):
+        """Return (feature hashes, row of each feature) for a batch of texts."""
+        parts = [t.lower().encode("utf-8") for t in texts]
+        lengths = np.fromiter((len(p) + 1 for p in parts), dtype=np.int64, count=len(parts))
+        text_starts = np.cumsum(lengths) - lengths
+        # NUL is not a word byte, so tokens never run across texts
+        buf = np.frombuffer(b"\0".join(parts), dtype=np.uint8)
+
+        is_word = _WORD_BYTES[buf]
+        is_start = is_word.copy()
+        is_start[1:] &= ~is_word[:-1]
+        token_starts = np.flatnonzero(is_start)
+        if token_starts.size == 0:
+            return np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.int64)
+
+        word_pos = np.flatnonzero(is_word)
+        token_of_byte = np.cumsum(is_start[word_pos]) - 1
+        offset = np.minimum(word_pos - token_starts[token_of_byte], _MAX_TOKEN_BYTES - 1)
+        weighted = (buf[word_pos].astype(np.uint64) + np.uint64(1)) * _POWERS[offset]
+        unigrams = _mix(np.add.reduceat(weighted, np.searchsorted(word_pos, token_starts)))
+        rows = np.searchsorted(text_starts, token_starts, side="right") - 1
+
+        # bigrams pair each token with the next one from the same text
+        same_text = rows[1:] == rows[:-1]
+        bigrams = _mix(unigrams[:-1][same_text] * np.uint64(0x9E3779B97F4A7C15) + unigrams[1:][same_text])
+        return np.concatenate([unigrams, bigrams]), np.concatenate([rows, rows[1:][same_text]])
+
+    def embed_matrix(self, texts: List[str]) -> np.ndarray:
+        """Embed a batch into an (n, dim) float32 matrix of unit rows."""
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for start in range(0, len(texts), _HASH_BATCH):
+            batch = texts[start:start + _HASH_BATCH]
+            features, rows = self._features(batch)
+            if features.size == 0:
+                continue
+            # the top bit picks the sign, which keeps collisions unbiased
+            buckets = (features % np.uint64(self.dim)).astype(np.int64)
+            signs = np.where(features >> np.uint64(63), 1.0, -1.0)
+            counts = np.bincount(rows * self.dim + buckets, weights=signs, minlength=len(batch) * self.dim)
+            matrix[start:start + len(batch)] = counts.reshape(len(batch), self.dim)
+
+        matrix = np.sign(matrix) * np.log1p(np.abs(matrix))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
 
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        return [self._text_to_vector(t) for t in texts]
+        return self.embed_matrix(texts).tolist()
 
     def embed_query(self, text: str) -> List[float]:
-        return self._text_to_vector(text)
+        return self.embed_matrix([text])[0].tolist()
     
     def __call__(self, text: str) -> List[float]:
         """Allow this object to be called like a function for compatibility with FAISS."""
@@ -43,20 +116,28 @@ class BasicEmbeddings:
 
 
 def get_embeddings():
-    """Return an embeddings object. Prefer OpenAI/OpenRouter; fallback to BasicEmbeddings."""
+    """Return an embeddings object. Prefer OpenAI/OpenRouter (unless EMBEDDINGS_PROVIDER=basic); fallback to BasicEmbeddings.
+
+    The OpenAI client is shared process-wide (see reg.clients), so uploads
+    reuse its pooled connections.
+
+    Either model is wrapped with the shared chunk embedding cache, so text
+    seen before (in any document) is not embedded again.
+    """
     key = os.getenv("OPENROUTER_API_KEY") or os.getenv("OPENAI_API_KEY")
-    if key and OpenAIEmbeddings is not None:
+    # "basic" keeps embeddings local even when a key is set for the chat model
+    provider = os.getenv("EMBEDDINGS_PROVIDER", "auto").lower()
+    if provider == "basic":
+        logger.info("EMBEDDINGS_PROVIDER=basic; not using OpenAI/OpenRouter embeddings.")
+    elif key and langchain_openai is not None:
         try:
             logger.info("Attempting to use OpenAI/OpenRouter embeddings.")
-            return OpenAIEmbeddings(
-                openai_api_key=key,
-                openai_api_base="https://openrouter.ai/api/v1",
-                model="text-embedding-3-large",
-            )
+            return with_cache(get_openai_embeddings())
         except Exception as e:
             logger.warning("OpenAIEmbeddings initialization failed: %s", e)
+            FALLBACKS.inc(kind="basic_embeddings")
     else:
         logger.info("No OpenAI/OpenRouter API key found in environment variables.")
 
     logger.info("Using BasicEmbeddings fallback.")
-    return BasicEmbeddings(dim=32)
+    return with_cache(BasicEmbeddings())
@@ -0,0 +1,211 @@
+import os
+import heapq
+import logging
+import threading
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from reg.hybrid import get_bm25, reciprocal_rank_fusion, retriever_mode
+from reg.lazy import optional_module
+from reg.loader import build_index, describe_index, index_vectors, search_params
+
+faiss = optional_module("faiss")
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FEDERATED_WORKERS = 8
+# Source selections whose BM25 row masks are kept per collection version
+MAX_CACHED_SELECTIONS = 64
+
+# One source file's chunks: its own index, and the docstore id of each row
+Shard = namedtuple("Shard", "source index ids")
+
+
+def federated_enabled() -> bool:
+    """Whether chains search per-source shards (FEDERATED_SEARCH, off by default)."""
+    return os.getenv("FEDERATED_SEARCH", "0").lower() in ("1", "true", "yes")
+
+
+def _similarity(distance: float, metric: int) -> float:
+    """Map a FAISS distance to a similarity in (0, 1], higher is better."""
+    if metric == faiss.METRIC_INNER_PRODUCT:
+        return min(1.0, max(0.0, (1.0 + distance) / 2))
+    return 1.0 / (1.0 + max(distance, 0.0))
+
+
+class FederatedIndex:
+    """Per-source FAISS indexes over one collection, searched in parallel.
+
+    Each source file gets its own index, typed and sized by `build_index`
+    for that file alone. A query embeds once, skips the shards of sources
+    it is not filtered to, and searches the rest concurrently on a shared
+    thread pool (FAISS releases the GIL while it searches). Distances are
+    mapped to similarities the same way for every shard, so they stay
+    comparable, and the per-shard top-k lists are merged with a heap.
+    """
+
+    def __init__(self, shards: Dict[str, Shard], docstore: Any, embedding_function: Any, normalize_L2: bool = False, bm25: Any = None):
+        self.shards = shards
+        self.docstore = docstore
+        self.embedding_function = embedding_function
+        self.normalize_L2 = normalize_L2
+        self.bm25 = bm25
+        self._bm25_rows: Dict[frozenset, np.ndarray] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_vectorstore(cls, vectorstore: Any, previous: Optional["FederatedIndex"] = None) -> "FederatedIndex":
+        """Split a collection's vectorstore by the `source` metadata of its chunks.
+
+        Shards of `previous` whose chunk ids are unchanged are reused, so a
+        new version of a collection only builds the shards of the sources
+        that changed.
+        """
+        positions: Dict[str, List[int]] = defaultdict(list)
+        mapping = vectorstore.index_to_docstore_id
+        for pos in sorted(mapping):
+            doc = vectorstore.docstore.search(mapping[pos])
+            positions[(getattr(doc, "metadata", None) or {}).get("source", "")].append(pos)
+
+        shards = {}
+        built = 0
+        for source, rows in positions.items():
+            ids = [mapping[pos] for pos in rows]
+            old = previous.shards.get(source) if previous is not None else None
+            if old is not None and old.ids == ids:
+                shards[source] = old
+                continue
+            vectors = index_vectors(vectorstore.index, rows)
+            index = build_index(vectors)
+            index.add(vectors)
+            shards[source] = Shard(source, index, ids)
+            built += 1
+        if built:
+            logger.info("Built %s of %s source shards", built, len(shards))
+        return cls(
+            shards,
+            vectorstore.docstore,
+            vectorstore.embedding_function,
+            getattr(vectorstore, "_normalize_L2", False),
+            getattr(vectorstore, "_bm25", None),
+        )
+
+    def __len__(self) -> int:
+        return sum(shard.index.ntotal for shard in self.shards.values())
+
+    def describe(self) -> str:
+        kinds = sorted({describe_index(shard.index) for shard in self.shards.values()})
+        return f"federated({len(self.shards)} shards: {', '.join(kinds)})"
+
+    def select(self, sources: Optional[Iterable[str]] = None) -> List[Shard]:
+        """The shards to search: all of them, or those of `sources` (unknown names match nothing)."""
+        if sources is None:
+            return list(self.shards.values())
+        return [self.shards[source] for source in dict.fromkeys(sources) if source in self.shards]
+
+    def _search_shard(self, shard: Shard, query: np.ndarray, k: int, nprobe: Optional[int], ef_search: Optional[int]) -> List[Tuple[float, str]]:
+        k = min(k, shard.index.ntotal)
+        if k <= 0:
+            return []
+        params = search_params(shard.index, nprobe=nprobe, ef_search=ef_search)
+        if params is not None:
+            distances, rows = shard.index.search(query, k, params=params)
+        else:
+            distances, rows = shard.index.search(query, k)
+        metric = shard.index.metric_type
+        return [(_similarity(float(d), metric), shard.ids[i]) for d, i in zip(distances[0], rows[0]) if i != -1]
+
+    def search_vector(
+        self, vector: Any, k: int, sources: Optional[Iterable[str]] = None,
+        nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+    ) -> List[Tuple[str, float]]:
+        """Top-k (docstore id, similarity) for a query vector over the selected shards."""
+        shards = self.select(sources)
+        query = np.array(vector, dtype=np.float32, ndmin=2)
+        if self.normalize_L2:
+            query /= np.maximum(np.linalg.norm(query, axis=1, keepdims=True), 1e-12)
+        if len(shards) > 1:
+            per_shard = get_search_pool().map(lambda shard: self._search_shard(shard, query, k, nprobe, ef_search), shards)
+        else:
+            per_shard = [self._search_shard(shard, query, k, nprobe, ef_search) for shard in shards]
+        merged = heapq.nlargest(k, (hit for hits in per_shard for hit in hits))
+        return [(doc_id, score) for score, doc_id in merged]
+
+    def _allowed_rows(self, sources: Iterable[str]) -> np.ndarray:
+        """BM25 row mask of the selected sources' chunks, cached per selection."""
+        key = frozenset(sources)
+        with self._lock:
+            rows = self._bm25_rows.get(key)
+        if rows is None:
+            rows = self.bm25.rows([doc_id for shard in self.select(key) for doc_id in shard.ids])
+            with self._lock:
+                if len(self._bm25_rows) >= MAX_CACHED_SELECTIONS:
+                    self._bm25_rows.clear()
+                self._bm25_rows[key] = rows
+        return rows
+
+    def search_ids(
+        self, query: str, k: int, sources: Optional[Iterable[str]] = None, mode: Optional[str] = None,
+        nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+    ) -> List[Tuple[str, float]]:
+        """Top-k (docstore id, score) for a query; hybrid mode fuses BM25 hits of the same sources with RRF."""
+        embed = getattr(self.embedding_function, "embed_query", self.embedding_function)
+        if retriever_mode(mode) != "hybrid" or self.bm25 is None:
+            return self.search_vector(embed(query), k, sources, nprobe, ef_search)
+        fetch_k = max(4 * k, 20)
+        vector_ids = [doc_id for doc_id, _ in self.search_vector(embed(query), fetch_k, sources, nprobe, ef_search)]
+        allowed = self._allowed_rows(sources) if sources is not None else None
+        bm25_ids = [doc_id for doc_id, _ in self.bm25.search(query, fetch_k, allowed)]
+        return reciprocal_rank_fusion([vector_ids, bm25_ids])[:k]
+
+
+_split_lock = threading.Lock()
+
+
+def get_federated(vectorstore: Any) -> FederatedIndex:
+    """Return the per-source shards of a vectorstore, splitting it on first use."""
+    federated = getattr(vectorstore, "_federated", None)
+    if federated is None:
+        with _split_lock:
+            federated = getattr(vectorstore, "_federated", None)
+            if federated is None:
+                get_bm25(vectorstore)
+                federated = vectorstore._federated = FederatedIndex.from_vectorstore(vectorstore)
+    return federated
+
+
+def carry_over(previous: Any, vectorstore: Any) -> None:
+    """Give a collection's next vectorstore the unchanged shards of `previous`, if it had any."""
+    federated = getattr(previous, "_federated", None)
+    if federated is not None:
+        get_bm25(vectorstore)
+        vectorstore._federated = FederatedIndex.from_vectorstore(vectorstore, federated)
+
+
+def federated_search(
+    vectorstore: Any, query: str, k: int, sources: Optional[Iterable[str]] = None, mode: Optional[str] = None,
+    nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+) -> List[Tuple[Any, float]]:
+    """Like `FederatedIndex.search_ids`, but returns (Document, score) pairs."""
+    federated = get_federated(vectorstore)
+    return [
+        (federated.docstore.search(doc_id), score)
+        for doc_id, score in federated.search_ids(query, k, sources, mode, nprobe, ef_search)
+    ]
+
+
+_search_pool = None
+_search_pool_lock = threading.Lock()
+
+
+def get_search_pool() -> ThreadPoolExecutor:
+    """Return the process-wide pool shard searches run on (FEDERATED_WORKERS threads)."""
+    global _search_pool
+    with _search_pool_lock:
+        if _search_pool is None:
+            workers = int(os.getenv("FEDERATED_WORKERS", min(DEFAULT_FEDERATED_WORKERS, os.cpu_count() or 1)))
+            _search_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="shard-search")
+        return _search_pool
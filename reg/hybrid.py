@@ -0,0 +1,276 @@
+import os
+import re
+import math
+import logging
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+# Keep identifiers like "AB-1234", "12.3.4" or "v2/api" as one token
+_TOKEN_RE = re.compile(r"\w+(?:[-./]\w+)*")
+_PART_RE = re.compile(r"\w+")
+
+RRF_K = 60
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-case tokens; compound identifiers also contribute their parts."""
+    tokens = []
+    for tok in _TOKEN_RE.findall(text.lower()):
+        tokens.append(tok)
+        if not tok.isalnum():
+            tokens.extend(_PART_RE.findall(tok))
+    return tokens
+
+
+class BM25Index:
+    """Okapi BM25 over an inverted index, keyed by FAISS docstore ids.
+
+    Postings are collected in Python lists while documents are added and
+    frozen into numpy arrays by `freeze`, so a query is a handful of
+    vectorized scatter-adds. Ingestion and collection loads freeze the index
+    before it is served; a search after an unfrozen change freezes it
+    itself. Removed documents are tombstoned rather than re-indexed.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.doc_ids: List[str] = []
+        self.doc_lens: List[int] = []
+        self.postings: Dict[str, Tuple[List[int], List[int]]] = {}
+        self.deleted: set = set()
+        self._frozen = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_frozen"] = None
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.doc_ids) - len(self.deleted)
+
+    def add(self, doc_ids: List[str], texts: List[str]) -> None:
+        with self._lock:
+            for doc_id, text in zip(doc_ids, texts):
+                idx = len(self.doc_ids)
+                tokens = tokenize(text)
+                self.doc_ids.append(doc_id)
+                self.doc_lens.append(len(tokens))
+                for term, tf in Counter(tokens).items():
+                    ids, tfs = self.postings.setdefault(term, ([], []))
+                    ids.append(idx)
+                    tfs.append(tf)
+            self._frozen = None
+
+    def merge(self, other: "BM25Index") -> None:
+        """Append another index's documents (e.g. a newly uploaded file)."""
+        with self._lock:
+            offset = len(self.doc_ids)
+            self.doc_ids.extend(other.doc_ids)
+            self.doc_lens.extend(other.doc_lens)
+            self.deleted.update(offset + i for i in other.deleted)
+            for term, (ids, tfs) in other.postings.items():
+                mine_ids, mine_tfs = self.postings.setdefault(term, ([], []))
+                mine_ids.extend(offset + i for i in ids)
+                mine_tfs.extend(tfs)
+            self._frozen = None
+
+    def remove(self, doc_ids: List[str]) -> None:
+        wanted = set(doc_ids)
+        with self._lock:
+            self.deleted.update(i for i, d in enumerate(self.doc_ids) if d in wanted)
+            if len(self.deleted) * 2 > len(self.doc_ids):
+                self._compact()
+            self._frozen = None
+
+    def _compact(self) -> None:
+        """Drop tombstoned documents once they make up most of the index."""
+        keep = [i for i in range(len(self.doc_ids)) if i not in self.deleted]
+        remap = {old: new for new, old in enumerate(keep)}
+        self.doc_ids = [self.doc_ids[i] for i in keep]
+        self.doc_lens = [self.doc_lens[i] for i in keep]
+        postings = {}
+        for term, (ids, tfs) in self.postings.items():
+            pairs = [(remap[i], tf) for i, tf in zip(ids, tfs) if i in remap]
+            if pairs:
+                postings[term] = ([i for i, _ in pairs], [tf for _, tf in pairs])
+        self.postings = postings
+        self.deleted = set()
+
+    def freeze(self) -> "BM25Index":
+        """Build the numpy postings now rather than on the next search."""
+        self._freeze()
+        return self
+
+    def _freeze(self):
+        with self._lock:
+            if self._frozen is not None:
+                return self._frozen
+            n = len(self.doc_ids)
+            lens = np.asarray(self.doc_lens, dtype=np.float32)
+            alive = np.ones(n, dtype=bool)
+            if self.deleted:
+                alive[list(self.deleted)] = False
+            n_alive = max(int(alive.sum()), 1)
+            avgdl = float(lens[alive].mean()) if alive.any() else 1.0
+            norm = self.k1 * (1 - self.b + self.b * lens / max(avgdl, 1e-9))
+
+            frozen = {}
+            for term, (ids, tfs) in self.postings.items():
+                ids_arr = np.asarray(ids, dtype=np.int64)
+                tf = np.asarray(tfs, dtype=np.float32)
+                df = int(alive[ids_arr].sum())
+                if df == 0:
+                    continue
+                idf = math.log(1 + (n_alive - df + 0.5) / (df + 0.5))
+                frozen[term] = (ids_arr, idf * tf * (self.k1 + 1) / (tf + norm[ids_arr]))
+            self._frozen = (frozen, alive)
+            return self._frozen
+
+    def rows(self, doc_ids: List[str]) -> np.ndarray:
+        """Mask over this index's rows selecting the given docstore ids."""
+        wanted = set(doc_ids)
+        with self._lock:
+            return np.fromiter((doc_id in wanted for doc_id in self.doc_ids), dtype=bool, count=len(self.doc_ids))
+
+    def search(self, query: str, k: int, allowed: Optional[np.ndarray] = None) -> List[Tuple[str, float]]:
+        """Return up to k (docstore id, BM25 score) pairs, best first.
+
+        `allowed` (from `rows`) restricts the search to some documents.
+        """
+        postings, alive = self._freeze()
+        if not len(alive):
+            return []
+        scores = np.zeros(len(alive), dtype=np.float32)
+        for term in set(tokenize(query)):
+            hit = postings.get(term)
+            if hit is not None:
+                np.add.at(scores, hit[0], hit[1])
+        scores[~alive] = 0.0
+        if allowed is not None:
+            scores[~allowed] = 0.0
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.doc_ids[i], float(scores[i])) for i in top if scores[i] > 0]
+
+
+def build_bm25(vectorstore: Any) -> BM25Index:
+    """Index every chunk in a FAISS vectorstore's docstore, frozen and ready to search."""
+    bm25 = BM25Index()
+    ids = [vectorstore.index_to_docstore_id[i] for i in sorted(vectorstore.index_to_docstore_id)]
+    bm25.add(ids, [vectorstore.docstore.search(d).page_content for d in ids])
+    return bm25.freeze()
+
+
+def get_bm25(vectorstore: Any) -> BM25Index:
+    """Return the BM25 index stored alongside a vectorstore, building it if absent."""
+    bm25 = getattr(vectorstore, "_bm25", None)
+    if bm25 is None:
+        bm25 = vectorstore._bm25 = build_bm25(vectorstore)
+    return bm25
+
+
+def _search_vectors(vectorstore: Any, vectors: Any, k: int, params: Any = None) -> List[List[Tuple[str, float]]]:
+    """One FAISS search for a matrix of query vectors; (docstore id, distance) per row."""
+    matrix = np.array(vectors, dtype=np.float32, ndmin=2)
+    if getattr(vectorstore, "_normalize_L2", False):
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    if params is not None:
+        distances, indices = vectorstore.index.search(matrix, k, params=params)
+    else:
+        distances, indices = vectorstore.index.search(matrix, k)
+    return [
+        [(vectorstore.index_to_docstore_id[int(i)], float(d)) for d, i in zip(row_d, row_i) if i != -1]
+        for row_d, row_i in zip(distances, indices)
+    ]
+
+
+def vector_search_ids(vectorstore: Any, query: str, k: int, params: Any = None) -> List[Tuple[str, float]]:
+    """FAISS search returning (docstore id, distance) so results can be fused by id.
+
+    `params` are optional per-query FAISS search parameters (nprobe, efSearch).
+    """
+    embedding_function = vectorstore.embedding_function
+    embed = getattr(embedding_function, "embed_query", embedding_function)
+    return _search_vectors(vectorstore, [embed(query)], k, params)[0]
+
+
+def batch_search_ids(vectorstore: Any, queries: List[str], vectors: Any, k: int, mode: Optional[str] = None) -> List[List[str]]:
+    """Top-k docstore ids for many queries, with one FAISS search over their vectors.
+
+    In hybrid mode each query's vector hits are fused with its BM25 hits,
+    as in `hybrid_search_ids`.
+    """
+    if not queries:
+        return []
+    hybrid = retriever_mode(mode) == "hybrid"
+    fetch_k = max(4 * k, 20) if hybrid else k
+    results = []
+    for query, hits in zip(queries, _search_vectors(vectorstore, vectors, fetch_k)):
+        ids = [doc_id for doc_id, _ in hits]
+        if hybrid:
+            bm25_ids = [doc_id for doc_id, _ in get_bm25(vectorstore).search(query, fetch_k)]
+            ids = [doc_id for doc_id, _ in reciprocal_rank_fusion([ids, bm25_ids])]
+        results.append(ids[:k])
+    return results
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = RRF_K) -> List[Tuple[str, float]]:
+    """Fuse ranked id lists: score(d) = sum over lists of 1 / (k + rank)."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+def hybrid_search_ids(vectorstore: Any, query: str, k: int, fetch_k: Optional[int] = None, params: Any = None) -> List[Tuple[str, float]]:
+    """Top-k (docstore id, fused score) from BM25 and vector results combined with RRF."""
+    fetch_k = fetch_k or max(4 * k, 20)
+    vector_ids = [doc_id for doc_id, _ in vector_search_ids(vectorstore, query, fetch_k, params)]
+    bm25_ids = [doc_id for doc_id, _ in get_bm25(vectorstore).search(query, fetch_k)]
+    return reciprocal_rank_fusion([vector_ids, bm25_ids])[:k]
+
+
+def hybrid_search(vectorstore: Any, query: str, k: int, fetch_k: Optional[int] = None, params: Any = None) -> List[Tuple[Any, float]]:
+    """Like `hybrid_search_ids`, but returns (Document, fused score) pairs."""
+    return [
+        (vectorstore.docstore.search(doc_id), score)
+        for doc_id, score in hybrid_search_ids(vectorstore, query, k, fetch_k, params)
+    ]
+
+
+def retriever_mode(mode: Optional[str] = None) -> str:
+    """Resolve the retrieval mode: "vector" (default) or "hybrid" (RETRIEVER_MODE)."""
+    mode = (mode or os.getenv("RETRIEVER_MODE", "vector")).lower()
+    if mode not in ("vector", "hybrid"):
+        logger.warning("Unknown retriever mode %r, using vector search", mode)
+        mode = "vector"
+    return mode
+
+
+def make_retriever(vectorstore: Any, k: int, mode: Optional[str] = None, federated: bool = False):
+    """Build the retriever for the selected mode, optionally over per-source shards."""
+    if federated:
+        from reg.retrievers import FederatedRetriever
+
+        return FederatedRetriever(vectorstore=vectorstore, k=k, mode=retriever_mode(mode))
+    if retriever_mode(mode) == "hybrid":
+        # a LangChain class, so it lives apart and loads with the first retriever
+        from reg.retrievers import HybridRetriever
+
+        return HybridRetriever(vectorstore=vectorstore, k=k)
+    return vectorstore.as_retriever(search_kwargs={"k": k})
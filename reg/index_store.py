@@ -0,0 +1,249 @@
+import os
+import json
+import time
+import shutil
+import pickle
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, Optional
+
+from reg.lazy import optional_module
+
+faiss = optional_module("faiss")
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.path.join("data", "index_cache")
+DEFAULT_MAX_MB = 2048
+
+INDEX_FILE = "index.faiss"
+DOCSTORE_FILE = "index.pkl"
+META_FILE = "meta.json"
+BM25_FILE = "bm25.pkl"
+
+
+def file_sha256(file_path: str, block_size: int = 1 << 20) -> str:
+    """Hash a file's bytes without reading it into memory at once."""
+    h = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def embeddings_fingerprint(embeddings: Any) -> str:
+    """Describe an embeddings object well enough to tell vector spaces apart."""
+    # look through caching wrappers to the model that produced the vectors
+    embeddings = getattr(embeddings, "inner", embeddings)
+    name = type(embeddings).__name__
+    model = getattr(embeddings, "model", None)
+    dim = getattr(embeddings, "dim", None) or getattr(embeddings, "dimensions", None)
+    return f"{name}:{model or ''}:{dim or ''}"
+
+
+def cache_key(file_path: str, settings: Dict[str, Any]) -> str:
+    """Key an index by the file content plus everything that shapes its vectors."""
+    h = hashlib.sha256()
+    h.update(file_sha256(file_path).encode("ascii"))
+    h.update(json.dumps(settings, sort_keys=True, default=str).encode("utf-8"))
+    return h.hexdigest()
+
+
+def copy_vectorstore(vectorstore: Any) -> Any:
+    """Return an independent, writable copy of a FAISS vectorstore.
+
+    Collections are updated copy-on-write: the copy is modified while
+    readers keep searching the original, then swapped in. Memory-mapped
+    indexes are read-only views (adding to one aborts the process), and a
+    serialized round trip copies mapped flat codes into memory; IVF
+    ones map their inverted lists straight from the file and cannot be
+    serialized, so those are read again from disk without mmap.
+    """
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_community.vectorstores import FAISS
+
+    index = vectorstore.index
+    if getattr(vectorstore, "_mmapped", False) and faiss.try_extract_index_ivf(index) is not None:
+        index = faiss.read_index(vectorstore._index_path)
+    else:
+        index = faiss.deserialize_index(faiss.serialize_index(index))
+    # Documents are never mutated in place, so sharing them is safe
+    docstore = InMemoryDocstore(dict(vectorstore.docstore._dict))
+    copy = FAISS(vectorstore.embedding_function, index, docstore, dict(vectorstore.index_to_docstore_id))
+    copy._mmapped = False
+    bm25 = getattr(vectorstore, "_bm25", None)
+    if bm25 is not None:
+        copy._bm25 = pickle.loads(pickle.dumps(bm25))
+    return copy
+
+
+def save_vectorstore(path: str, vectorstore: Any, meta: Optional[Dict[str, Any]] = None) -> None:
+    """Atomically write a vectorstore's index, docstore, BM25 index and metadata to `path`."""
+    tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    try:
+        os.makedirs(tmp_path, exist_ok=True)
+        faiss.write_index(vectorstore.index, os.path.join(tmp_path, INDEX_FILE))
+        with open(os.path.join(tmp_path, DOCSTORE_FILE), "wb") as f:
+            pickle.dump((vectorstore.docstore, vectorstore.index_to_docstore_id), f)
+        bm25 = getattr(vectorstore, "_bm25", None)
+        if bm25 is not None:
+            with open(os.path.join(tmp_path, BM25_FILE), "wb") as f:
+                pickle.dump(bm25, f)
+        # a re-scoring index carries float32 vectors it only reads a few rows of
+        rescoring = isinstance(faiss.downcast_index(vectorstore.index), faiss.IndexRefine)
+        with open(os.path.join(tmp_path, META_FILE), "w", encoding="utf8") as f:
+            json.dump(dict(meta or {}, created=time.time(), ntotal=vectorstore.index.ntotal, rescoring=rescoring), f)
+        if os.path.exists(path):
+            shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+    except Exception:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+
+def load_vectorstore(path: str, embeddings: Any, mmap: bool = True) -> Any:
+    """Load a vectorstore written by `save_vectorstore`, memory-mapped by default.
+
+    Re-scoring indexes map their flat code arrays instead (IO_FLAG_MMAP_IFC),
+    so the float32 vectors stay in the shared page cache rather than each
+    worker's heap. Other flat indexes are read into memory: FAISS empties
+    the source of a merge, which a mapped array cannot be.
+    """
+    from langchain_community.vectorstores import FAISS
+
+    flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY if mmap else 0
+    if mmap and read_meta(path).get("rescoring") and hasattr(faiss, "IO_FLAG_MMAP_IFC"):
+        # FAISS cannot map inverted lists nested under the re-scoring stage
+        flags = faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY
+    index_path = os.path.join(path, INDEX_FILE)
+    index = faiss.read_index(index_path, flags)
+    with open(os.path.join(path, DOCSTORE_FILE), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    vectorstore = FAISS(embeddings, index, docstore, index_to_docstore_id)
+    vectorstore._mmapped = mmap
+    vectorstore._index_path = index_path
+    bm25_path = os.path.join(path, BM25_FILE)
+    if os.path.exists(bm25_path):
+        with open(bm25_path, "rb") as f:
+            vectorstore._bm25 = pickle.load(f)
+    return vectorstore
+
+
+def read_meta(path: str) -> Dict[str, Any]:
+    """Return the metadata saved next to a vectorstore, or {} if there is none."""
+    try:
+        with open(os.path.join(path, META_FILE), encoding="utf8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+class IndexStore:
+    """Size-bounded on-disk cache of built FAISS vectorstores.
+
+    Each entry is a directory named by its cache key holding the raw FAISS
+    index, the pickled docstore and a small metadata file. Hits are loaded
+    memory-mapped so the OS page cache is shared across workers. The
+    directory mtime is the LRU clock: it is bumped on every hit and the
+    oldest entries are removed once the total size exceeds `max_bytes`.
+    """
+
+    def __init__(self, root: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.root = root or os.getenv("INDEX_CACHE_DIR", DEFAULT_CACHE_DIR)
+        if max_bytes is None:
+            max_bytes = int(os.getenv("INDEX_CACHE_MAX_MB", DEFAULT_MAX_MB)) * 1024 * 1024
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def get(self, key: str, embeddings: Any, mmap: bool = True) -> Optional[Any]:
+        """Return the cached vectorstore for `key`, or None on a miss."""
+        path = self._entry_dir(key)
+        if faiss is None or not os.path.exists(os.path.join(path, INDEX_FILE)):
+            return None
+        try:
+            vectorstore = load_vectorstore(path, embeddings, mmap=mmap)
+        except Exception as e:
+            logger.warning("Discarding unreadable index cache entry %s: %s", key, e)
+            shutil.rmtree(path, ignore_errors=True)
+            return None
+
+        os.utime(path, None)
+        logger.info("Index cache hit: %s", key)
+        return vectorstore
+
+    def put(self, key: str, vectorstore: Any, meta: Optional[Dict[str, Any]] = None) -> None:
+        """Persist a vectorstore under `key` and enforce the size bound."""
+        if faiss is None:
+            return
+        try:
+            with self._lock:
+                save_vectorstore(self._entry_dir(key), vectorstore, meta)
+        except Exception as e:
+            logger.warning("Failed to write index cache entry %s: %s", key, e)
+            return
+        self.evict()
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if not os.path.isdir(path) or ".tmp-" in name:
+                continue
+            size = sum(
+                os.path.getsize(os.path.join(path, f))
+                for f in os.listdir(path)
+                if os.path.isfile(os.path.join(path, f))
+            )
+            entries.append((os.path.getmtime(path), size, path))
+        entries.sort()
+        return entries
+
+    def evict(self) -> int:
+        """Drop least recently used entries until the cache fits `max_bytes`."""
+        removed = 0
+        with self._lock:
+            entries = self._entries()
+            total = sum(size for _, size, _ in entries)
+            # never evict the newest entry, even if it alone exceeds the bound
+            while total > self.max_bytes and len(entries) > 1:
+                _, size, path = entries.pop(0)
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
+                removed += 1
+        if removed:
+            logger.info("Index cache evicted %s entries", removed)
+        return removed
+
+    def warm(self, limit: Optional[int] = None) -> int:
+        """Read the most recently used index files into the OS page cache.
+
+        Called at startup so the first mmap-backed query after a restart
+        does not pay for cold disk reads.
+        """
+        entries = list(reversed(self._entries()))
+        if limit is not None:
+            entries = entries[:limit]
+        for _, _, path in entries:
+            with open(os.path.join(path, INDEX_FILE), "rb") as f:
+                while f.read(1 << 20):
+                    pass
+        logger.info("Index cache warmed %s entries", len(entries))
+        return len(entries)
+
+
+_index_store = None
+_index_store_lock = threading.Lock()
+
+
+def get_index_store() -> IndexStore:
+    """Return the process-wide index store."""
+    global _index_store
+    with _index_store_lock:
+        if _index_store is None:
+            _index_store = IndexStore()
+        return _index_store
@@ -0,0 +1,185 @@
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from reg.latency import StageTimer
+
+logger = logging.getLogger(__name__)
+
+# Finished jobs are kept this long so clients can still poll their result
+JOB_TTL_SECONDS = 3600
+DEFAULT_JOBS_DIR = os.path.join("data", "jobs")
+# Progress is written for other workers at most this often, stage changes always
+PUBLISH_INTERVAL = 0.5
+
+_FIELDS = ("id", "description", "stage", "chunks", "created", "started", "finished", "result", "error", "timings")
+
+
+class Job:
+    """Status of one background ingestion, updated from the worker thread."""
+
+    def __init__(self, description: str = ""):
+        self.id = uuid.uuid4().hex
+        self.description = description
+        self.stage = "queued"
+        self.chunks = 0
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        # seconds per ingest stage (load, split, embed, ...), set when the job ends
+        self.timings: Optional[Dict[str, float]] = None
+        self.on_change: Optional[Callable[["Job"], None]] = None
+        self._published = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Job":
+        job = cls()
+        for field in _FIELDS:
+            setattr(job, field, data.get(field))
+        return job
+
+    def fields(self) -> Dict[str, Any]:
+        with self._lock:
+            return {field: getattr(self, field) for field in _FIELDS}
+
+    def update(self, stage: str, chunks: int = 0) -> None:
+        """Progress callback handed to the ingestion code."""
+        with self._lock:
+            changed = stage != self.stage
+            self.stage = stage
+            self.chunks = max(self.chunks, chunks)
+            now = time.time()
+            publish = self.on_change is not None and (changed or now - self._published >= PUBLISH_INTERVAL)
+            if publish:
+                self._published = now
+        if publish:
+            self.on_change(self)
+
+    @property
+    def done(self) -> bool:
+        return self.stage in ("done", "failed")
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            end = self.finished or time.time()
+            return {
+                "job_id": self.id,
+                "description": self.description,
+                "stage": self.stage,
+                "done": self.done,
+                "chunks": self.chunks,
+                "elapsed": round(end - (self.started or end), 3),
+                "queued_for": round((self.started or end) - self.created, 3),
+                "result": self.result,
+                "error": self.error,
+                "timings": self.timings,
+            }
+
+
+class JobQueue:
+    """Runs ingestion work on a bounded thread pool and tracks its jobs.
+
+    Parsing and embedding mostly wait on pypdf, numpy or the embeddings
+    API, all of which release the GIL, so threads are enough here and keep
+    the resulting indexes in this process's registry. Job status is also
+    written to `root/<job id>.json`, so a poll that lands on another web
+    worker still finds it.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, root: Optional[str] = None):
+        max_workers = max_workers or int(os.getenv("INGEST_WORKERS", "2"))
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self.root = root or os.getenv("JOBS_DIR", DEFAULT_JOBS_DIR)
+        os.makedirs(self.root, exist_ok=True)
+
+    def _job_path(self, job_id: str) -> str:
+        return os.path.join(self.root, f"{job_id}.json")
+
+    def _publish(self, job: Job) -> None:
+        path = self._job_path(job.id)
+        tmp = f"{path}.tmp-{threading.get_ident()}"
+        try:
+            with open(tmp, "w", encoding="utf8") as f:
+                json.dump(job.fields(), f, default=str)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning("Could not publish status of job %s: %s", job.id, e)
+
+    def submit(self, fn: Callable[[Job], Dict[str, Any]], description: str = "") -> Job:
+        """Queue `fn(job)`; its return value becomes the job's result."""
+        job = Job(description)
+        job.on_change = self._publish
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        self._publish(job)
+        self._executor.submit(self._run, job, fn)
+        return job
+
+    def _run(self, job: Job, fn: Callable[[Job], Dict[str, Any]]) -> None:
+        job.started = time.time()
+        timer = StageTimer()
+        try:
+            with timer.activate():
+                result = fn(job)
+            job.result = result
+            job.timings = timer.as_dict()
+            job.update("done")
+        except Exception as e:
+            logger.exception("Ingestion job %s failed", job.id)
+            job.error = str(e)
+            job.timings = timer.as_dict()
+            job.update("failed")
+        finally:
+            job.finished = time.time()
+            self._publish(job)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return job
+        # submitted through another worker process
+        if not job_id.isalnum():
+            return None
+        try:
+            with open(self._job_path(job_id), encoding="utf8") as f:
+                return Job.from_dict(json.load(f))
+        except (OSError, ValueError):
+            return None
+
+    def _prune(self) -> None:
+        cutoff = time.time() - JOB_TTL_SECONDS
+        for job_id, job in list(self._jobs.items()):
+            if job.finished and job.finished < cutoff:
+                del self._jobs[job_id]
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """Return the process-wide ingestion job queue."""
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            _job_queue = JobQueue()
+        return _job_queue
@@ -0,0 +1,217 @@
+import os
+import time
+import logging
+import threading
+import functools
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+from reg.metrics import LLM_HEDGES, SPAN_SECONDS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HEDGE_AFTER = 4.0
+MIN_HEDGE_AFTER = 0.5
+# Observed latencies needed before the p95 replaces the default
+MIN_SAMPLES = 20
+
+
+# Timer of the request or job running in this context, if it is being profiled
+_active_timer: ContextVar[Optional["StageTimer"]] = ContextVar("active_timer", default=None)
+
+
+class StageTimer:
+    """Accumulates wall time per named stage of one request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+
+    def stage(self, name: str):
+        """Span recorded in this timer (as well as the span histogram)."""
+        return span(name, timer=self)
+
+    @contextmanager
+    def activate(self) -> Iterator["StageTimer"]:
+        """Make spans opened in this context without a timer record here too."""
+        token = _active_timer.set(self)
+        try:
+            yield self
+        finally:
+            _active_timer.reset(token)
+
+    def record(self, name: str, seconds: float) -> None:
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def as_dict(self) -> Dict[str, float]:
+        timings = {name: round(seconds, 4) for name, seconds in self.stages.items()}
+        timings["total"] = round(time.perf_counter() - self.started, 4)
+        return timings
+
+    def server_timing(self) -> str:
+        """Value for the Server-Timing response header."""
+        return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.as_dict().items())
+
+
+def active_timer() -> Optional[StageTimer]:
+    return _active_timer.get()
+
+
+@contextmanager
+def span(name: str, timer: Optional[StageTimer] = None) -> Iterator[None]:
+    """Time a stage into the querify_span_seconds histogram and the request's timer."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        SPAN_SECONDS.observe(seconds, span=name)
+        timer = timer or _active_timer.get()
+        if timer is not None:
+            timer.record(name, seconds)
+
+
+def timed(name: str) -> Callable:
+    """Decorator form of `span`."""
+    def decorate(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def timed_iter(items: Iterable, name: str) -> Iterator:
+    """Yield from `items`, timing only the work of producing each item."""
+    iterator = iter(items)
+    while True:
+        with span(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+class LatencyTracker:
+    """Rolling window of call latencies, used to decide when to hedge."""
+
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            if len(self._samples) < MIN_SAMPLES:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def hedge_after(self) -> float:
+        """LLM_HEDGE_AFTER if set, else the observed p95 (with a floor)."""
+        configured = os.getenv("LLM_HEDGE_AFTER")
+        if configured:
+            return float(configured)
+        p95 = self.percentile(0.95)
+        return max(MIN_HEDGE_AFTER, p95) if p95 is not None else DEFAULT_HEDGE_AFTER
+
+
+def hedged_call(
+    fn: Callable[[], Any],
+    timeout: float,
+    hedge_after: float,
+    attempts: int = 2,
+    accept: Optional[Callable[[Any], bool]] = None,
+    tracker: Optional[LatencyTracker] = None,
+) -> Tuple[Any, Dict[str, Any]]:
+    """Call `fn` and return the first acceptable result within `timeout` seconds.
+
+    If no attempt has answered after `hedge_after` seconds, or an attempt
+    fails, another copy is started (up to `attempts` in total) and the first
+    acceptable answer wins. Attempts still running when a winner is found or
+    the time runs out are left to finish in the background. Raises
+    TimeoutError when nothing acceptable arrives in time (at once, without
+    calling `fn`, if `timeout` is not positive), or the last error once every
+    attempt has failed.
+    """
+    pool = _get_llm_pool()
+    started = time.monotonic()
+    deadline = started + timeout
+    futures = {}
+    last_error: Optional[BaseException] = None
+
+    def launch() -> None:
+        futures[pool.submit(_timed, fn)] = len(futures) + 1
+
+    if timeout <= 0:
+        # the budget is already spent; a call now would be paid for and discarded
+        raise TimeoutError(f"No time left for an answer ({timeout:.2f}s)")
+    launch()
+    next_hedge = started + hedge_after
+    while True:
+        now = time.monotonic()
+        if now >= deadline:
+            raise TimeoutError(f"No answer within {timeout:.2f}s after {len(futures)} attempt(s)")
+        pending = [f for f in futures if not f.done()]
+        if not pending and len(futures) >= attempts:
+            raise last_error or RuntimeError("All attempts failed")
+        if len(futures) < attempts and (not pending or now >= next_hedge):
+            LLM_HEDGES.inc()
+            if pending:
+                logger.info("No answer after %.2fs, sending hedged attempt %s", now - started, len(futures) + 1)
+            launch()
+            next_hedge = now + hedge_after
+            continue
+
+        wake = deadline if len(futures) >= attempts else min(deadline, next_hedge)
+        done, _ = wait(pending, timeout=max(0.0, wake - now), return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                result, seconds = future.result()
+            except Exception as e:
+                last_error = e
+                logger.warning("Attempt %s failed: %s", futures[future], e)
+                continue
+            if tracker is not None:
+                tracker.observe(seconds)
+            if accept is not None and not accept(result):
+                last_error = ValueError("Unusable answer")
+                continue
+            return result, {"attempt": futures[future], "attempts": len(futures), "hedge_after": round(hedge_after, 3)}
+
+
+def _timed(fn: Callable[[], Any]) -> Tuple[Any, float]:
+    started = time.monotonic()
+    result = fn()
+    return result, time.monotonic() - started
+
+
+_llm_pool = None
+_llm_latency = None
+_llm_lock = threading.Lock()
+
+
+def _get_llm_pool() -> ThreadPoolExecutor:
+    global _llm_pool
+    with _llm_lock:
+        if _llm_pool is None:
+            workers = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+            _llm_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="llm")
+        return _llm_pool
+
+
+def get_llm_latency() -> LatencyTracker:
+    """Return the process-wide tracker of LLM call latencies."""
+    global _llm_latency
+    with _llm_lock:
+        if _llm_latency is None:
+            _llm_latency = LatencyTracker()
+        return _llm_latency
@@ -0,0 +1,125 @@
+import sys
+import time
+import logging
+import importlib
+import importlib.util
+import importlib.machinery
+import threading
+from types import ModuleType
+from typing import Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+# What a worker needs to answer its first upload or question. `preload`
+# imports these; everything in reg imports them on first use instead.
+HEAVY_MODULES = (
+    "flask",
+    "faiss",
+    "langchain_core.documents",
+    "langchain_core.retrievers",
+    "langchain_core.embeddings",
+    "langchain.prompts",
+    "langchain.text_splitter",
+    "langchain_community.vectorstores.faiss",
+    "langchain_community.docstore.in_memory",
+    "langchain_community.document_loaders.word_document",
+    "langchain_openai",
+    # imported with the first client the OpenAI SDK builds
+    "httpx",
+    "httpcore",
+    "openai.resources",
+    "pypdf",
+    "docx2txt",
+)
+
+_import_times: Dict[str, float] = {}
+_lock = threading.RLock()
+
+
+def load(name: str) -> ModuleType:
+    """Import `name`, logging and recording the time when this call did the work."""
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    with _lock:
+        if name in sys.modules:
+            return sys.modules[name]
+        started = time.perf_counter()
+        module = importlib.import_module(name)
+        _import_times[name] = time.perf_counter() - started
+        logger.info("Imported %s in %.0f ms", name, 1000 * _import_times[name])
+        return module
+
+
+class LazyModule(ModuleType):
+    """Stands in for a module and imports it on first attribute access."""
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__["_lazy_name"] = name
+
+    def __getattr__(self, attr: str):
+        return getattr(load(self._lazy_name), attr)
+
+    def __repr__(self) -> str:
+        return f"<lazy module {self._lazy_name!r}>"
+
+
+def _find_spec(name: str):
+    """Locate `name` without importing it or the packages it is in.
+
+    `importlib.util.find_spec("a.b")` imports package "a" to search its
+    path, so submodules are looked up in their parent's locations instead.
+    """
+    top, _, rest = name.partition(".")
+    spec = importlib.util.find_spec(top)
+    for part in rest.split(".") if rest else ():
+        if spec is None or spec.submodule_search_locations is None:
+            return None
+        spec = importlib.machinery.PathFinder.find_spec(f"{spec.name}.{part}", spec.submodule_search_locations)
+    return spec
+
+
+def optional_module(name: str) -> Optional[LazyModule]:
+    """A lazy stand-in for `name`, or None when it is not installed.
+
+    Only the import system's finders run here, so checking for an optional
+    dependency at module load costs nothing like importing it.
+    """
+    try:
+        if _find_spec(name) is None:
+            return None
+    except (ImportError, ValueError):
+        return None
+    return LazyModule(name)
+
+
+def preload(names: Optional[Iterable[str]] = None) -> Dict[str, float]:
+    """Import the heavy dependencies now; return seconds spent on each.
+
+    gunicorn.conf.py calls this in the master before forking (PRELOAD_IMPORTS),
+    so every worker, including restarted ones, starts with them in memory.
+    Modules that fail to import are logged and skipped; the code that needs
+    them handles their absence as before.
+    """
+    timings = {}
+    for name in names or HEAVY_MODULES:
+        try:
+            load(name)
+        except Exception as e:
+            logger.warning("Preloading %s failed: %s", name, e)
+            continue
+        timings[name] = _import_times.get(name, 0.0)
+    logger.info("Preloaded %d modules in %.0f ms", len(timings), 1000 * sum(timings.values()))
+    return timings
+
+
+def import_report() -> Dict[str, object]:
+    """Recorded import times, and which heavy modules this process has loaded."""
+    with _lock:
+        times = dict(_import_times)
+    return {
+        "import_ms": {name: round(1000 * s, 1) for name, s in sorted(times.items(), key=lambda i: -i[1])},
+        "loaded": [name for name in HEAVY_MODULES if name in sys.modules],
+        "not_loaded": [name for name in HEAVY_MODULES if name not in sys.modules],
+    }
@@ -1,63 +1,537 @@
-from langchain_community.document_loaders import PyPDFLoader, TextLoader, Docx2txtLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import FAISS
 from reg.embeddings import get_embeddings, BasicEmbeddings
+from reg.index_store import get_index_store, cache_key, embeddings_fingerprint
+from reg.embed_executor import EmbeddingExecutor, EmbeddingError
+from reg.embedding_cache import get_embedding_cache, with_cache
+from reg.hybrid import BM25Index
+from reg.lazy import optional_module
+from reg.latency import span, timed, timed_iter
+from reg.metrics import FALLBACKS
+from reg.pages import iter_pdf_pages, iter_text_segments
+import os
+import math
 import logging
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+
+# LangChain, FAISS and the parsers are imported on first use (reg.lazy)
+faiss = optional_module("faiss")
 
 logger = logging.getLogger(__name__)
 
+# Use larger chunks to preserve context and meaning
+CHUNK_SIZE = 1200
+CHUNK_OVERLAP = 200
+SEPARATORS = ["\n\n", "\n", ". ", " ", ""]
+# Chunks embedded and inserted per step of the streaming ingest pipeline
+DEFAULT_INGEST_BATCH_CHUNKS = 512
+
+# ---------------- INDEX FACTORY ----------------
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+
+# "auto" stays exact below FLAT_MAX chunks, switches to IVF-Flat, and
+# compresses with IVF-PQ from PQ_MIN chunks on. HNSW has the best latency
+# but cannot drop vectors in place, so it is only used when asked for.
+DEFAULT_FLAT_MAX = 50_000
+DEFAULT_PQ_MIN = 1_000_000
+DEFAULT_NPROBE = 16
+DEFAULT_EF_SEARCH = 64
+DEFAULT_HNSW_M = 32
+DEFAULT_TRAIN_SAMPLE = 100_000
+
+
+# How vectors are stored: INDEX_QUANT "fp16" or "int8" scalar-quantizes
+# them (2 or 1 bytes per dimension instead of 4) and INDEX_DIM keeps only
+# the leading dimensions, renormalized, for models trained to allow that
+# (Matryoshka embeddings such as text-embedding-3-*). A compressed index
+# also keeps the float32 vectors and re-scores the best INDEX_RESCORE x k
+# candidates with them (0 turns this off); indexes loaded from disk leave
+# those vectors memory-mapped, so only the re-scored rows are ever read.
+QUANTIZATIONS = ("none", "fp16", "int8")
+DEFAULT_RESCORE = 4
+
+
+def _index_settings() -> dict:
+    return {
+        "type": os.getenv("INDEX_TYPE", "auto").lower(),
+        "flat_max": int(os.getenv("INDEX_FLAT_MAX", DEFAULT_FLAT_MAX)),
+        "pq_min": int(os.getenv("INDEX_PQ_MIN", DEFAULT_PQ_MIN)),
+        "hnsw_m": int(os.getenv("INDEX_HNSW_M", DEFAULT_HNSW_M)),
+    }
+
+
+def storage_settings() -> dict:
+    """INDEX_QUANT / INDEX_DIM / INDEX_RESCORE, with unknown quantizations treated as "none"."""
+    quant = os.getenv("INDEX_QUANT", "none").lower()
+    if quant not in QUANTIZATIONS:
+        logger.warning("Unknown INDEX_QUANT %r, storing float32 vectors", quant)
+        quant = "none"
+    return {
+        "quant": quant,
+        "dim": max(0, int(os.getenv("INDEX_DIM", 0))),
+        "rescore": max(0, int(os.getenv("INDEX_RESCORE", DEFAULT_RESCORE))),
+    }
+
+
+def _compressed(storage: dict) -> bool:
+    return storage["quant"] != "none" or storage["dim"] > 0
+
+
+def choose_index_type(n: int, index_type: Optional[str] = None) -> str:
+    """Resolve INDEX_TYPE ("auto" by default) to a concrete type for `n` vectors."""
+    settings = _index_settings()
+    index_type = (index_type or settings["type"]).lower()
+    if index_type in INDEX_TYPES:
+        return index_type
+    if index_type != "auto":
+        logger.warning("Unknown INDEX_TYPE %r, choosing by corpus size", index_type)
+    if n < settings["flat_max"]:
+        return "flat"
+    return "ivf_pq" if n >= settings["pq_min"] else "ivf_flat"
+
+
+def _pq_subquantizers(dim: int) -> int:
+    """Largest divisor of `dim` giving at least 8 dimensions per sub-quantizer."""
+    for m in range(max(1, dim // 8), 0, -1):
+        if dim % m == 0:
+            return m
+    return 1
+
+
+def _scalar_quantizer(quant: str) -> Optional[int]:
+    return {"fp16": faiss.ScalarQuantizer.QT_fp16, "int8": faiss.ScalarQuantizer.QT_8bit}.get(quant)
+
+
+def _search_index(index_type: str, n: int, dim: int, quant: str) -> Any:
+    """The untrained FAISS index that is searched, storing `dim`-dimensional codes."""
+    qtype = _scalar_quantizer(quant)
+    if index_type == "hnsw":
+        m = _index_settings()["hnsw_m"]
+        index = faiss.IndexHNSWSQ(dim, qtype, m) if qtype is not None else faiss.IndexHNSWFlat(dim, m)
+        index.hnsw.efConstruction = 4 * m
+        return index
+    if index_type == "flat":
+        return faiss.IndexScalarQuantizer(dim, qtype) if qtype is not None else faiss.IndexFlatL2(dim)
+
+    # ~4*sqrt(n) lists, keeping the 39 points per centroid k-means wants
+    nlist = max(1, min(int(4 * math.sqrt(n)), n // 39))
+    nbits = 8 if n >= 39 * 256 else 4
+    if nlist < 4 or (index_type == "ivf_pq" and n < 39 * 2 ** nbits):
+        logger.info("Only %s vectors, too few to train %s; using a flat index", n, index_type)
+        return _search_index("flat", n, dim, quant)
+
+    quantizer = faiss.IndexFlatL2(dim)
+    if index_type == "ivf_pq":
+        # already compressed further than scalar quantization would
+        return faiss.IndexIVFPQ(quantizer, dim, nlist, _pq_subquantizers(dim), nbits)
+    if qtype is not None:
+        return faiss.IndexIVFScalarQuantizer(quantizer, dim, nlist, qtype)
+    return faiss.IndexIVFFlat(quantizer, dim, nlist)
+
+
+def build_index(vectors: np.ndarray, index_type: Optional[str] = None) -> Any:
+    """Create an empty, trained FAISS index suited to `vectors`.
+
+    IVF variants are trained on a random sample of at most 64 vectors per
+    list and INDEX_TRAIN_SAMPLE overall. Corpora too small to train a quantizer get
+    an exact flat index instead. The storage settings wrap the result in a
+    dimension-truncating transform and a float32 re-scoring stage.
+    """
+    n, dim = vectors.shape
+    index_type = choose_index_type(n, index_type)
+    storage = storage_settings()
+    out_dim = storage["dim"] if 0 < storage["dim"] < dim else dim
+    index = _search_index(index_type, n, out_dim, storage["quant"])
+    nlist = getattr(index, "nlist", 0)
+    if out_dim < dim:
+        index = faiss.IndexPreTransform(index)
+        index.prepend_transform(faiss.NormalizationTransform(out_dim, 2.0))
+        index.prepend_transform(faiss.RemapDimensionsTransform(dim, out_dim, False))
+    if _compressed(storage) and storage["rescore"]:
+        index = faiss.IndexRefineFlat(index)
+        index.k_factor = storage["rescore"]
+    if not index.is_trained:
+        # k-means needs ~39 points per list; more mostly adds training time
+        sample_size = min(n, 64 * nlist or n, int(os.getenv("INDEX_TRAIN_SAMPLE", DEFAULT_TRAIN_SAMPLE)))
+        sample = vectors
+        if sample_size < n:
+            sample = vectors[np.random.default_rng(0).choice(n, sample_size, replace=False)]
+        index.train(np.ascontiguousarray(sample, dtype=np.float32))
+    return tune_index(index)
+
+
+def _search_core(index: Any) -> Any:
+    """The index under any re-scoring and truncation wrappers."""
+    index = faiss.downcast_index(index)
+    while isinstance(index, (faiss.IndexRefine, faiss.IndexPreTransform)):
+        inner = index.base_index if isinstance(index, faiss.IndexRefine) else index.index
+        index = faiss.downcast_index(inner)
+    return index
+
+
+def has_rescoring(index: Any) -> bool:
+    """Whether the index keeps float32 vectors to re-score its candidates."""
+    return faiss is not None and isinstance(faiss.downcast_index(index), faiss.IndexRefine)
+
+
+def tune_index(index: Any, nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> Any:
+    """Set the default search breadth (INDEX_NPROBE / INDEX_EF_SEARCH) of an ANN index."""
+    if faiss is None:
+        return index
+    ivf = faiss.try_extract_index_ivf(index)
+    core = _search_core(index)
+    if ivf is not None:
+        ivf.nprobe = min(ivf.nlist, nprobe or int(os.getenv("INDEX_NPROBE", DEFAULT_NPROBE)))
+    elif hasattr(core, "hnsw"):
+        core.hnsw.efSearch = ef_search or int(os.getenv("INDEX_EF_SEARCH", DEFAULT_EF_SEARCH))
+    return index
+
+
+def search_params(index: Any, nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> Any:
+    """Per-query FAISS search parameters, or None to use the index defaults."""
+    if faiss is None:
+        return None
+    params = None
+    if nprobe and faiss.try_extract_index_ivf(index) is not None:
+        params = faiss.SearchParametersIVF(nprobe=nprobe)
+    elif ef_search and hasattr(_search_core(index), "hnsw"):
+        params = faiss.SearchParametersHNSW(efSearch=ef_search)
+    if params is not None and has_rescoring(index):
+        # the re-scoring stage passes its base index's parameters through
+        refine = faiss.IndexRefineSearchParameters(
+            k_factor=faiss.downcast_index(index).k_factor, base_index_params=params
+        )
+        refine.referenced_objects = [params]
+        return refine
+    return params
+
+
+def describe_index(index: Any) -> str:
+    if faiss is None:
+        return "flat"
+    core = _search_core(index)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        kind = "ivf_pq" if isinstance(faiss.downcast_index(ivf), faiss.IndexIVFPQ) else "ivf_flat"
+        text = f"{kind}(nlist={ivf.nlist}, nprobe={ivf.nprobe})"
+    elif hasattr(core, "hnsw"):
+        text = f"hnsw(M={core.hnsw.nb_neighbors(1)}, efSearch={core.hnsw.efSearch})"
+    else:
+        text = "flat"
+    # HNSW keeps its codes in a separate storage index
+    codes = faiss.downcast_index(core.storage) if hasattr(core, "storage") else core
+    sq = getattr(codes, "sq", None)
+    if sq is not None:
+        text += "+fp16" if sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "+int8"
+    if core.d < index.d:
+        text += f"+dim{core.d}"
+    if has_rescoring(index):
+        text += f"+rescore(x{faiss.downcast_index(index).k_factor:g})"
+    return text
+
+
+def index_vectors(index: Any, positions: Optional[List[int]] = None) -> np.ndarray:
+    """All vectors stored in an index in id order, or those at `positions`.
+
+    Approximate for IVF-PQ and for quantized or truncated indexes without
+    a re-scoring stage (truncated dimensions come back as zeros).
+    """
+    if index.ntotal == 0 or (positions is not None and not len(positions)):
+        return np.zeros((0, index.d), dtype=np.float32)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.make_direct_map(True)
+    try:
+        if positions is not None:
+            return index.reconstruct_batch(np.asarray(positions, dtype=np.int64))
+        return index.reconstruct_n(0, index.ntotal)
+    finally:
+        if ivf is not None:
+            ivf.make_direct_map(False)
+
+
+def _is_flat(index: Any) -> bool:
+    return isinstance(index, faiss.IndexFlat)
+
+
+def _is_exhaustive(index: Any) -> bool:
+    """Flat search, exact or over quantized codes, with nothing trained to keep."""
+    return isinstance(_search_core(index), faiss.IndexFlatCodes)
+
+
+def _refill(vectorstore: Any, vectors: np.ndarray, doc_ids: List[str], index: Any) -> None:
+    index.add(np.ascontiguousarray(vectors, dtype=np.float32))
+    vectorstore.index = index
+    vectorstore.index_to_docstore_id = dict(enumerate(doc_ids))
+
+
+def merge_vectorstores(vectorstore: Any, other: Any) -> None:
+    """Merge `other` into `vectorstore`, upgrading the index as the corpus grows.
+
+    Flat indexes of a corpus that still fits the flat size are merged
+    directly. A trained ANN target just takes the new vectors; a flat one
+    (quantized or not) that outgrows INDEX_FLAT_MAX is rebuilt as the type
+    the factory picks.
+    """
+    total = vectorstore.index.ntotal + other.index.ntotal
+    if _is_flat(vectorstore.index) and _is_flat(other.index) and choose_index_type(total) == "flat":
+        vectorstore.merge_from(other)
+        return
 
-def load_file_to_vectorstore(file_path: str):
+    ids = [vectorstore.index_to_docstore_id[i] for i in sorted(vectorstore.index_to_docstore_id)]
+    new_ids = [other.index_to_docstore_id[i] for i in sorted(other.index_to_docstore_id)]
+    vectorstore.docstore.add({doc_id: other.docstore.search(doc_id) for doc_id in new_ids})
+    new_vectors = index_vectors(other.index)
+    if not _is_exhaustive(vectorstore.index) or choose_index_type(total) == "flat":
+        vectorstore.index.add(new_vectors)
+        vectorstore.index_to_docstore_id.update(
+            (len(ids) + i, doc_id) for i, doc_id in enumerate(new_ids)
+        )
+        return
+    vectors = np.vstack([index_vectors(vectorstore.index), new_vectors])
+    _refill(vectorstore, vectors, ids + new_ids, build_index(vectors))
+    logger.info("Rebuilt index for %s vectors as %s", total, describe_index(vectorstore.index))
+
+
+def delete_from_vectorstore(vectorstore: Any, doc_ids: List[str]) -> None:
+    """Remove chunks by docstore id.
+
+    FAISS renumbers flat indexes on removal, which is what the id mapping
+    assumes; IVF, HNSW and the wrapped (quantized, truncated or
+    re-scoring) indexes do not, so those are emptied (keeping their
+    training) and refilled with the remaining vectors.
+    """
+    if _is_flat(vectorstore.index):
+        vectorstore.delete(doc_ids)
+        return
+    drop = set(doc_ids)
+    order = sorted(vectorstore.index_to_docstore_id)
+    keep = [i for i in order if vectorstore.index_to_docstore_id[i] not in drop]
+    vectors = index_vectors(vectorstore.index)[keep]
+    remaining = [vectorstore.index_to_docstore_id[i] for i in keep]
+    # clone_index cannot copy the truncating transform; a round trip can
+    index = faiss.deserialize_index(faiss.serialize_index(vectorstore.index))
+    index.reset()
+    _refill(vectorstore, vectors, remaining, tune_index(index))
+    vectorstore.docstore.delete(list(drop))
+
+
+def _ingest_settings(embeddings) -> dict:
+    """Everything besides the file bytes that changes the built index."""
+    storage = storage_settings()
+    return {
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "separators": SEPARATORS,
+        "embeddings": embeddings_fingerprint(embeddings),
+        "index": _index_settings(),
+        # only when set, so float32 indexes keep their existing cache keys
+        **({"storage": storage} if _compressed(storage) else {}),
+    }
+
+
+# ---------------- LOADER REGISTRY ----------------
+
+# File extension -> function(file_path, source_filename) yielding Documents.
+# Each loader imports its parser when called, so only formats actually
+# uploaded are ever imported.
+_LOADERS: Dict[str, Callable[[str, str], Iterator["Document"]]] = {}
+
+
+def register_loader(*extensions: str):
+    """Register the decorated function as the loader for these extensions."""
+    def decorate(fn):
+        for ext in extensions:
+            _LOADERS["." + ext.lower().lstrip(".")] = fn
+        return fn
+    return decorate
+
+
+def loader_for(file_path: str) -> Callable[[str, str], Iterator["Document"]]:
+    """The loader registered for the file's extension, or the text loader."""
+    return _LOADERS.get(os.path.splitext(file_path)[1].lower(), _load_text)
+
+
+@register_loader("pdf")
+def _load_pdf(file_path: str, source_filename: str) -> Iterator["Document"]:
+    from langchain_core.documents import Document
+
+    for page, text in iter_pdf_pages(file_path):
+        yield Document(page_content=text, metadata={"source": source_filename, "page": page})
+
+
+@register_loader("docx", "doc")
+def _load_docx(file_path: str, source_filename: str) -> Iterator["Document"]:
+    from langchain_community.document_loaders import Docx2txtLoader
+
+    # docx2txt reads the whole archive at once; there are no pages to stream
+    for doc in Docx2txtLoader(file_path).load():
+        doc.metadata = dict(doc.metadata or {}, source=source_filename)
+        yield doc
+
+
+@register_loader("txt")
+def _load_text(file_path: str, source_filename: str) -> Iterator["Document"]:
+    """.txt, and the last resort for unknown extensions."""
+    from langchain_core.documents import Document
+
+    for text in iter_text_segments(file_path):
+        yield Document(page_content=text, metadata={"source": source_filename})
+
+
+def _iter_documents(file_path: str, source_filename: str) -> Iterator["Document"]:
+    """Yield a file's text a page (PDF) or segment (text) at a time."""
+    yield from loader_for(file_path)(file_path, source_filename)
+
+
+def _iter_chunk_batches(docs: Iterator["Document"], batch_size: int) -> Iterator[List["Document"]]:
+    """Split documents as they arrive and group the chunks into batches."""
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP,
+        separators=SEPARATORS
+    )
+    batch: List["Document"] = []
+    for doc in docs:
+        with span("ingest.split"):
+            batch.extend(splitter.split_documents([doc]))
+        while len(batch) >= batch_size:
+            yield batch[:batch_size]
+            batch = batch[batch_size:]
+    if batch:
+        yield batch
+
+
+def chunk_file(file_path: str, source_filename: Optional[str] = None, batch_size: Optional[int] = None) -> Iterator[List["Document"]]:
+    """Parse and split a file as it streams in, yielding batches of chunks."""
+    source_filename = source_filename or os.path.basename(file_path)
+    batch_size = batch_size or int(os.getenv("INGEST_BATCH_CHUNKS", DEFAULT_INGEST_BATCH_CHUNKS))
+    # time spent producing pages/segments, excluding splitting and embedding
+    docs = timed_iter(_iter_documents(file_path, source_filename), "ingest.load")
+    return _iter_chunk_batches(docs, batch_size)
+
+
+def _build_vectorstore(batches: Iterator[List["Document"]], embeddings, progress: Optional[Callable] = None, fallback: bool = True):
+    """Embed chunk batches as they arrive and insert them into FAISS and BM25.
+
+    Chunks go into a flat index while streaming; once the final size is
+    known, `build_index` decides whether to rebuild it as an ANN index,
+    and compresses it if the storage settings ask for that.
+    Falls back to BasicEmbeddings only if the first batch cannot be
+    embedded at all (and `fallback` allows it), so a file is never indexed
+    with two models. Returns (vectorstore, embeddings actually used).
+    """
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_community.vectorstores import FAISS
+
+    vectorstore = None
+    bm25 = BM25Index()
+    total = 0
+    for batch in batches:
+        texts = [c.page_content for c in batch]
+        if progress:
+            # the batch has just been split; `total` chunks are embedded so far
+            progress("splitting", total)
+
+        def batch_progress(stage, done, _offset=total):
+            if progress:
+                progress(stage, _offset + done)
+
+        try:
+            with span("ingest.embed"):
+                vectors = EmbeddingExecutor(embeddings).embed(texts, batch_progress)
+        except EmbeddingError as e:
+            if total or e.completed or not fallback:
+                # never mix models within a file; the finished batches are
+                # cached and checkpointed, so uploading again resumes here
+                raise
+            logger.warning("Embeddings API failed: %s. Falling back to BasicEmbeddings.", e)
+            FALLBACKS.inc(kind="basic_embeddings")
+            embeddings = with_cache(BasicEmbeddings())
+            with span("ingest.embed"):
+                vectors = EmbeddingExecutor(embeddings).embed(texts, batch_progress)
+
+        with span("ingest.index"):
+            if vectorstore is None:
+                vectorstore = FAISS(embeddings, faiss.IndexFlatL2(len(vectors[0])), InMemoryDocstore(), {})
+            ids = vectorstore.add_embeddings(list(zip(texts, vectors)), metadatas=[c.metadata for c in batch])
+            # keyword index over the same chunks, saved next to the FAISS index
+            bm25.add(ids, texts)
+        total += len(texts)
+
+    if vectorstore is None:
+        raise ValueError("No text could be extracted from the document.")
+
+    cache = get_embedding_cache()
+    if cache is not None:
+        logger.info("Embedding cache: %s", cache.stats())
+    if progress:
+        progress("indexing", total)
+    if choose_index_type(total) != "flat" or _compressed(storage_settings()):
+        with span("ingest.build_index"):
+            vectors = index_vectors(vectorstore.index)
+            ids = [vectorstore.index_to_docstore_id[i] for i in range(total)]
+            _refill(vectorstore, vectors, ids, build_index(vectors))
+    logger.info("Indexed %s chunks with %s", total, describe_index(vectorstore.index))
+    vectorstore._bm25 = bm25
+    return vectorstore, embeddings
+
+
+def vectorstore_from_chunks(chunks: List["Document"], embeddings, progress: Optional[Callable] = None):
+    """Embed already split chunks into a new store, with `embeddings` only (no fallback)."""
+    batch_size = int(os.getenv("INGEST_BATCH_CHUNKS", DEFAULT_INGEST_BATCH_CHUNKS))
+    batches = (chunks[i:i + batch_size] for i in range(0, len(chunks), batch_size))
+    return _build_vectorstore(batches, embeddings, progress, fallback=False)[0]
+
+
+@timed("ingest")
+def load_file_to_vectorstore(file_path: str, use_cache: bool = True, progress: Optional[Callable] = None):
     """Load a file (pdf, txt, docx) and create a FAISS vectorstore.
 
     The function auto-detects the loader based on file extension and
     falls back to a text loader when unsure. Adds source filename metadata.
+    Pages are parsed in a process pool, split as they arrive and embedded
+    in batches of INGEST_BATCH_CHUNKS chunks, so memory is bounded by the
+    batch rather than the document. Built indexes are kept in the on-disk
+    index cache, so uploading the same bytes again with the same settings
+    skips parsing and embedding. `progress(stage, chunks)` is called as the
+    file moves through the loading, splitting, embedding and indexing
+    stages.
     """
     try:
-        import os
-        fname = file_path.lower()
         source_filename = os.path.basename(file_path)
-        
-        if fname.endswith(".pdf"):
-            loader = PyPDFLoader(file_path)
-            docs = loader.load()
-        elif fname.endswith(".txt"):
-            loader = TextLoader(file_path, encoding="utf8")
-            docs = loader.load()
-        elif fname.endswith(".docx") or fname.endswith(".doc"):
-            loader = Docx2txtLoader(file_path)
-            docs = loader.load()
-        else:
-            # Last resort: try text loader
-            try:
-                loader = TextLoader(file_path, encoding="utf8")
-                docs = loader.load()
-            except Exception as e:
-                logger.error("Unsupported file type or failed to load: %s", e)
-                raise
-        
-        # Add source filename metadata to all documents
-        for doc in docs:
-            if doc.metadata is None:
-                doc.metadata = {}
-            doc.metadata["source"] = source_filename
-
-        # Use larger chunks to preserve context and meaning
-        splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1200,
-            chunk_overlap=200,
-            separators=["\n\n", "\n", ". ", " ", ""]
-        )
-        chunks = splitter.split_documents(docs)
 
-        embeddings = get_embeddings()
+        with span("ingest.embeddings_init"):
+            embeddings = get_embeddings()
+        store = get_index_store() if use_cache else None
+        if store is not None:
+            key = cache_key(file_path, _ingest_settings(embeddings))
+            with span("ingest.cache_lookup"):
+                cached = store.get(key, embeddings)
+            if cached is not None:
+                if progress:
+                    progress("indexing", cached.index.ntotal)
+                return cached
 
-        try:
-            return FAISS.from_documents(chunks, embeddings)
-        except Exception as e:
-            logger.warning("Embeddings API failed: %s. Falling back to BasicEmbeddings.", e)
-            fallback_embeddings = BasicEmbeddings(dim=32)
-            return FAISS.from_documents(chunks, fallback_embeddings)
+        if progress:
+            progress("loading", 0)
+        batches = chunk_file(file_path, source_filename)
+        vectorstore, embeddings = _build_vectorstore(batches, embeddings, progress)
+
+        if store is not None:
+            # key by the embeddings actually used, so a fallback index is
+            # never served for the primary model's key
+            key = cache_key(file_path, _ingest_settings(embeddings))
+            with span("ingest.cache_store"):
+                store.put(key, vectorstore, meta={"source": source_filename})
+
+        return vectorstore
 
     except Exception as e:
         logger.error("Error loading file to vectorstore: %s", e)
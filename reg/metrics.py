@@ -0,0 +1,236 @@
+import os
+import json
+import bisect
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Seconds; spans range from sub-millisecond lookups to multi-minute ingests
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+# A worker's samples are written for /metrics in other workers at most this often
+PUBLISH_INTERVAL = 1.0
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, registry: "MetricsRegistry", name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> Dict[Tuple[str, ...], object]:
+        with self._lock:
+            return {key: _copy(value) for key, value in self._values.items()}
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+        self.registry.changed()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, registry, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # per-bucket (not cumulative) counts, then sum and count
+                state = self._values[key] = {"buckets": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+            state["buckets"][bisect.bisect_left(self.buckets, value)] += 1
+            state["sum"] += value
+            state["count"] += 1
+        self.registry.changed()
+
+
+def _copy(value):
+    if isinstance(value, dict):
+        return {"buckets": list(value["buckets"]), "sum": value["sum"], "count": value["count"]}
+    return value
+
+
+class MetricsRegistry:
+    """Counters and histograms, rendered in the Prometheus text format.
+
+    With METRICS_DIR set (gunicorn.conf.py sets it), each process mirrors
+    its samples to `<dir>/<pid>.json` and `render` sums every file, so a
+    scrape that lands on any worker sees the totals of all of them.
+    """
+
+    def __init__(self, root: Optional[str] = None):
+        self.root = root if root is not None else os.getenv("METRICS_DIR")
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+        self._flush_pending = False
+        if self.root:
+            os.makedirs(self.root, exist_ok=True)
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(self, name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(self, name, help, labelnames, buckets))
+
+    def snapshot(self) -> Dict[str, dict]:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {
+            m.name: {
+                "kind": m.kind,
+                "help": m.help,
+                "labels": list(m.labelnames),
+                "buckets": list(getattr(m, "buckets", ())),
+                "samples": [[list(key), value] for key, value in m.samples().items()],
+            }
+            for m in metrics
+        }
+
+    def changed(self) -> None:
+        """Schedule a publish, so samples reach other workers within the interval."""
+        if not self.root:
+            return
+        with self._lock:
+            if self._flush_pending:
+                return
+            self._flush_pending = True
+        timer = threading.Timer(PUBLISH_INTERVAL, self._flush)
+        timer.daemon = True
+        timer.start()
+
+    def _flush(self) -> None:
+        with self._lock:
+            self._flush_pending = False
+        self.publish()
+
+    def publish(self) -> None:
+        """Write this process's samples for the other workers."""
+        path = os.path.join(self.root, f"{os.getpid()}.json")
+        tmp = f"{path}.tmp-{threading.get_ident()}"
+        try:
+            with open(tmp, "w", encoding="utf8") as f:
+                json.dump(self.snapshot(), f)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning("Could not publish metrics: %s", e)
+
+    def _collect(self) -> Dict[str, dict]:
+        if not self.root:
+            return self.snapshot()
+        self.publish()
+        merged: Dict[str, dict] = {}
+        for name in sorted(os.listdir(self.root)):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.root, name), encoding="utf8") as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for metric_name, metric in snapshot.items():
+                target = merged.setdefault(metric_name, dict(metric, samples={}))
+                for key, value in metric["samples"]:
+                    key = tuple(key)
+                    target["samples"][key] = _add(target["samples"].get(key), value)
+        for metric in merged.values():
+            metric["samples"] = list(metric["samples"].items())
+        return merged
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for name, metric in sorted(self._collect().items()):
+            lines.append(f"# HELP {name} {metric['help']}")
+            lines.append(f"# TYPE {name} {metric['kind']}")
+            labelnames = metric["labels"]
+            for key, value in sorted(metric["samples"], key=lambda s: list(s[0])):
+                labels = dict(zip(labelnames, key))
+                if metric["kind"] == "counter":
+                    lines.append(f"{name}{_labels(labels)} {value}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(list(metric["buckets"]) + ["+Inf"], value["buckets"]):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(dict(labels, le=str(bound)))} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {value['sum']}")
+                lines.append(f"{name}_count{_labels(labels)} {value['count']}")
+        return "\n".join(lines) + "\n"
+
+
+def _add(total, value):
+    if total is None:
+        return _copy(value)
+    if isinstance(value, dict):
+        return {
+            "buckets": [a + b for a, b in zip(total["buckets"], value["buckets"])],
+            "sum": total["sum"] + value["sum"],
+            "count": total["count"] + value["count"],
+        }
+    return total + value
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics() -> MetricsRegistry:
+    """Return the process-wide metrics registry."""
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = MetricsRegistry()
+        return _metrics
+
+
+SPAN_SECONDS = get_metrics().histogram(
+    "querify_span_seconds", "Time spent in each instrumented stage.", ("span",))
+REQUEST_SECONDS = get_metrics().histogram(
+    "querify_http_request_seconds", "HTTP request latency until the response starts.", ("endpoint", "method", "status"))
+FALLBACKS = get_metrics().counter(
+    "querify_fallbacks_total", "Degradations to a local fallback.", ("kind",))
+INTENT_ROUTES = get_metrics().counter(
+    "querify_intent_routes_total", "Messages answered by the intent router, before retrieval.", ("intent",))
+LLM_CALLS_AVOIDED = get_metrics().counter(
+    "querify_llm_calls_avoided_total", "LLM calls saved because the intent router answered the message.", ("intent",))
+QUERY_EMBEDDINGS = get_metrics().counter(
+    "querify_query_embeddings_total",
+    "Query embeddings by how they were served: LRU hit, shared with an identical query in flight, or embedded.",
+    ("result",))
+QUERY_EMBED_BATCH_SIZE = get_metrics().histogram(
+    "querify_query_embed_batch_size", "Queries per embedding call made for search queries.",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+LLM_HEDGES = get_metrics().counter(
+    "querify_llm_hedges_total", "Extra LLM attempts started because the first was slow or failed.")
@@ -0,0 +1,120 @@
+import os
+import logging
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGES_PER_TASK = 16
+# Plain text is cut at paragraph breaks into segments of about this size
+TEXT_SEGMENT_CHARS = 64 * 1024
+
+
+# One open reader per process: opening re-parses the whole page tree,
+# which would otherwise be repeated for every page range
+_reader = None
+_reader_key = None
+
+
+def _open_pdf(file_path: str):
+    global _reader, _reader_key
+    from pypdf import PdfReader
+
+    stat = os.stat(file_path)
+    key = (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+    if _reader_key != key:
+        _reader, _reader_key = PdfReader(file_path), key
+    return _reader
+
+
+# Pool workers import this module, so it stays free of the langchain stack
+def _extract_pdf_pages(file_path: str, start: int, stop: int) -> List[str]:
+    """Extract the text of pages [start, stop) of a PDF; runs in a worker process."""
+    reader = _open_pdf(file_path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+_page_pool = None
+_page_pool_workers = 0
+_page_pool_lock = threading.Lock()
+
+
+def get_page_pool() -> Optional[ProcessPoolExecutor]:
+    """Return the process-wide PDF parsing pool, or None when PDF_WORKERS <= 1.
+
+    Workers come from a forkserver where available, so they are never
+    forked from a multi-threaded web worker.
+    """
+    global _page_pool, _page_pool_workers
+    workers = int(os.getenv("PDF_WORKERS", min(4, os.cpu_count() or 1)))
+    if workers <= 1:
+        return None
+    with _page_pool_lock:
+        if _page_pool is None:
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+            _page_pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+            _page_pool_workers = workers
+        return _page_pool
+
+
+def iter_pdf_pages(file_path: str, pages_per_task: Optional[int] = None) -> Iterator[Tuple[int, str]]:
+    """Yield (page number, text) for each page, in order, parsing ahead in parallel.
+
+    Page ranges are handed to the process pool with at most two ranges per
+    worker in flight, so memory holds a bounded window of pages no matter
+    how long the document is.
+    """
+    from pypdf import PdfReader
+
+    per_task = pages_per_task or int(os.getenv("PDF_PAGES_PER_TASK", DEFAULT_PAGES_PER_TASK))
+    reader = PdfReader(file_path)
+    total = len(reader.pages)
+    ranges = [(start, min(start + per_task, total)) for start in range(0, total, per_task)]
+    pool = get_page_pool() if len(ranges) > 1 else None
+    if pool is None:
+        for page in range(total):
+            yield page, reader.pages[page].extract_text() or ""
+        return
+    # workers open their own copy
+    del reader
+
+    pending = iter(ranges)
+    window = deque()
+    max_in_flight = 2 * _page_pool_workers
+
+    def submit_next() -> None:
+        task = next(pending, None)
+        if task is not None:
+            window.append((task[0], pool.submit(_extract_pdf_pages, file_path, *task)))
+
+    try:
+        for _ in range(max_in_flight):
+            submit_next()
+        while window:
+            start, future = window.popleft()
+            submit_next()
+            for offset, text in enumerate(future.result()):
+                yield start + offset, text
+    finally:
+        # the consumer may stop early; drop ranges nobody will read
+        for _, future in window:
+            future.cancel()
+
+
+def iter_text_segments(file_path: str, segment_chars: int = TEXT_SEGMENT_CHARS) -> Iterator[str]:
+    """Yield a UTF-8 text file in segments that end at blank lines."""
+    lines: List[str] = []
+    size = 0
+    with open(file_path, encoding="utf8") as f:
+        for line in f:
+            lines.append(line)
+            size += len(line)
+            if size >= segment_chars and not line.strip():
+                yield "".join(lines)
+                lines, size = [], 0
+    if lines:
+        yield "".join(lines)
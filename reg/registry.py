@@ -0,0 +1,559 @@
+import os
+import re
+import time
+import uuid
+import shutil
+import logging
+import threading
+from collections import OrderedDict, defaultdict, namedtuple
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:
+    # no cross-process locking on Windows; run a single worker there
+    fcntl = None
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+
+from reg.loader import (
+    chunk_file,
+    delete_from_vectorstore,
+    has_rescoring,
+    load_file_to_vectorstore,
+    merge_vectorstores,
+    tune_index,
+    vectorstore_from_chunks,
+)
+from reg.chain import build_qa_chain
+from reg.embeddings import get_embeddings, BasicEmbeddings
+from reg.embedding_cache import text_hash, with_cache
+from reg.federated import carry_over
+from reg.answer_cache import get_answer_cache
+from reg.hybrid import build_bm25, get_bm25
+from reg.latency import span, timed
+from reg.index_store import (
+    embeddings_fingerprint,
+    load_vectorstore,
+    copy_vectorstore,
+    read_meta,
+    save_vectorstore,
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_COLLECTIONS_DIR = os.path.join("data", "collections")
+VERSION_FILE = "VERSION"
+# Older versions stay on disk briefly so workers mid-reload can finish
+KEEP_VERSIONS = 2
+
+_COLLECTION_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def valid_collection_id(collection_id: Optional[str]) -> bool:
+    return bool(collection_id) and bool(_COLLECTION_ID_RE.match(collection_id))
+
+
+def _embeddings_for(fingerprint: str):
+    """Rebuild the embeddings object a persisted collection was indexed with."""
+    name, _, rest = fingerprint.partition(":")
+    if name == BasicEmbeddings.__name__:
+        dim = rest.rpartition(":")[2]
+        return with_cache(BasicEmbeddings(dim=int(dim)) if dim else BasicEmbeddings())
+    return get_embeddings()
+
+
+# What a request works with: everything here belongs to one collection version
+CollectionState = namedtuple("CollectionState", "id vectorstore qa_chain sources version")
+
+# A new revision of a source against its stored chunks: `kept` maps the id
+# of each unchanged chunk to its new Document (pages may have moved),
+# `removed` lists ids of chunks no longer present, `added` the new chunks
+ChunkDiff = namedtuple("ChunkDiff", "kept removed added")
+
+
+class Collection:
+    """A named corpus: one FAISS index over one or more uploaded files.
+
+    Updates are copy-on-write. A writer builds the next vectorstore and
+    chain from a copy and installs them in a single assignment of `state`,
+    so readers never see a half-merged index and never wait for a writer.
+    Once federated search has split a version into per-source shards
+    (reg.federated), the next version reuses those of unchanged sources.
+    """
+
+    def __init__(self, collection_id: str, vectorstore: Any, sources: Optional[List[str]] = None, version: int = 0):
+        self.id = collection_id
+        self.last_used = time.time()
+        # serializes writers only; readers just take `state`
+        self.lock = threading.RLock()
+        self._install(vectorstore, sources or [], version)
+
+    def _install(self, vectorstore: Any, sources: List[str], version: int) -> None:
+        # freeze BM25 here so the first query after a load or update doesn't pay for it
+        get_bm25(vectorstore).freeze()
+        self.state = CollectionState(self.id, vectorstore, build_qa_chain(vectorstore), tuple(sources), version)
+
+    def snapshot(self) -> CollectionState:
+        return self.state
+
+    @property
+    def vectorstore(self) -> Any:
+        return self.state.vectorstore
+
+    @property
+    def qa_chain(self) -> Any:
+        return self.state.qa_chain
+
+    @property
+    def sources(self) -> List[str]:
+        return list(self.state.sources)
+
+    @property
+    def version(self) -> int:
+        return self.state.version
+
+    @property
+    def fingerprint(self) -> str:
+        return embeddings_fingerprint(self.vectorstore.embedding_function)
+
+    def touch(self) -> None:
+        self.last_used = time.time()
+
+    def add(self, vectorstore: Any, source: str) -> int:
+        """Merge a per-file index into this collection without re-embedding.
+
+        A previous copy of `source` is replaced; returns how many of its
+        chunks were removed.
+        """
+        if embeddings_fingerprint(vectorstore.embedding_function) != self.fingerprint:
+            raise ValueError(
+                f"Cannot add '{source}' to collection '{self.id}': it was embedded "
+                "with a different model than the rest of the collection."
+            )
+        with self.lock:
+            current = self.state
+            vectorstore = _relabel(vectorstore, source, current.vectorstore)
+            merged = copy_vectorstore(current.vectorstore)
+            sources = list(current.sources)
+            bm25 = get_bm25(merged)
+            removed = 0
+            if source in sources:
+                removed = _remove_source(merged, source)
+                sources.remove(source)
+            merge_vectorstores(merged, vectorstore)
+            bm25.merge(get_bm25(vectorstore))
+            sources.append(source)
+            carry_over(current.vectorstore, merged)
+            self._install(merged, sources, current.version + 1)
+            return removed
+
+    def update_source(self, source: str, diff: ChunkDiff, added: Optional[Any]) -> bool:
+        """Apply a new revision of `source`: drop removed chunks, merge `added`, keep the rest.
+
+        Kept chunks keep their vectors and ids; only their docstore entries
+        are refreshed. Returns False (and installs nothing) if the revision
+        changes nothing.
+        """
+        with self.lock:
+            current = self.state
+            docstore = current.vectorstore.docstore
+            refreshed = {
+                doc_id: chunk for doc_id, chunk in diff.kept.items()
+                if docstore.search(doc_id) != chunk
+            }
+            if not (diff.removed or refreshed or added is not None):
+                return False
+            merged = copy_vectorstore(current.vectorstore)
+            bm25 = get_bm25(merged)
+            if diff.removed:
+                delete_from_vectorstore(merged, diff.removed)
+                bm25.remove(diff.removed)
+            # same text up to whitespace, so vectors and BM25 terms stay valid
+            merged.docstore._dict.update(refreshed)
+            if added is not None:
+                added = _relabel(added, source, merged)
+                merge_vectorstores(merged, added)
+                bm25.merge(get_bm25(added))
+            carry_over(current.vectorstore, merged)
+            self._install(merged, list(current.sources), current.version + 1)
+            return True
+
+    def to_dict(self) -> Dict[str, Any]:
+        state = self.state
+        return {
+            "collection": self.id,
+            "sources": list(state.sources),
+            "chunks": state.vectorstore.index.ntotal,
+            "version": state.version,
+        }
+
+
+def _relabel(vectorstore: Any, source: str, target: Optional[Any] = None) -> Any:
+    """Give an incoming per-file store fresh ids and this upload's source name if needed.
+
+    A per-file index served from the index cache carries the ids and file
+    name of the first upload of those bytes, which would collide with (or
+    misattribute) chunks already in the collection.
+    """
+    ids = [vectorstore.index_to_docstore_id[i] for i in sorted(vectorstore.index_to_docstore_id)]
+    docs = [vectorstore.docstore.search(doc_id) for doc_id in ids]
+    existing = set(target.index_to_docstore_id.values()) if target is not None else set()
+    if not any(doc_id in existing for doc_id in ids) and all((d.metadata or {}).get("source") == source for d in docs):
+        return vectorstore
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.documents import Document
+
+    new_ids = [str(uuid.uuid4()) for _ in ids]
+    docstore = InMemoryDocstore({
+        new_id: Document(page_content=d.page_content, metadata=dict(d.metadata or {}, source=source))
+        for new_id, d in zip(new_ids, docs)
+    })
+    relabeled = FAISS(vectorstore.embedding_function, vectorstore.index, docstore, dict(enumerate(new_ids)))
+    relabeled._bm25 = build_bm25(relabeled)
+    return relabeled
+
+
+def _source_ids(vectorstore: Any, source: str) -> List[str]:
+    """Docstore ids of the chunks of `source`, in index order."""
+    docstore = vectorstore.docstore
+    return [
+        vectorstore.index_to_docstore_id[i]
+        for i in sorted(vectorstore.index_to_docstore_id)
+        if (docstore.search(vectorstore.index_to_docstore_id[i]).metadata or {}).get("source") == source
+    ]
+
+
+def _remove_source(vectorstore: Any, source: str) -> int:
+    ids = _source_ids(vectorstore, source)
+    if ids:
+        delete_from_vectorstore(vectorstore, ids)
+        get_bm25(vectorstore).remove(ids)
+    return len(ids)
+
+
+def _diff_source(vectorstore: Any, source: str, chunks: List["Document"]) -> ChunkDiff:
+    """Match a revision's chunks to the stored chunks of `source` by content hash.
+
+    Hashes ignore whitespace (the embedding cache's normalization), and
+    repeated chunks are matched one for one.
+    """
+    stored = defaultdict(list)
+    for doc_id in _source_ids(vectorstore, source):
+        stored[text_hash(vectorstore.docstore.search(doc_id).page_content)].append(doc_id)
+    kept: Dict[str, "Document"] = {}
+    added: List["Document"] = []
+    for chunk in chunks:
+        ids = stored.get(text_hash(chunk.page_content))
+        if ids:
+            kept[ids.pop(0)] = chunk
+        else:
+            added.append(chunk)
+    removed = [doc_id for ids in stored.values() for doc_id in ids]
+    return ChunkDiff(kept, removed, added)
+
+
+class CollectionRegistry:
+    """Holds resident collections and spills idle ones to disk.
+
+    Every change is written through to `root/<collection id>/v<version>`,
+    after which the collection's VERSION file is replaced. Any worker
+    process sharing `root` notices the new version on its next access and
+    reloads the index memory-mapped and read-only. Writers hold an
+    exclusive file lock per collection and merge into the latest version,
+    so concurrent uploads to different workers are never lost. At most
+    `max_resident` collections stay in memory; the least recently used,
+    and any idle for longer than `idle_seconds`, are dropped and reloaded
+    from disk on next use.
+    """
+
+    def __init__(self, root: Optional[str] = None, max_resident: Optional[int] = None, idle_seconds: Optional[float] = None):
+        self.root = root or os.getenv("COLLECTIONS_DIR", DEFAULT_COLLECTIONS_DIR)
+        self.max_resident = max_resident or int(os.getenv("COLLECTIONS_MAX_RESIDENT", "8"))
+        if idle_seconds is None:
+            idle_seconds = float(os.getenv("COLLECTION_IDLE_SECONDS", "1800"))
+        self.idle_seconds = idle_seconds
+        self._collections: "OrderedDict[str, Collection]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._write_locks: Dict[str, threading.Lock] = {}
+        # (collection id, version) -> the load in progress
+        self._loading: Dict[Tuple[str, Optional[int]], Future] = {}
+        os.makedirs(os.path.join(self.root, ".locks"), exist_ok=True)
+
+    def _path(self, collection_id: str) -> str:
+        return os.path.join(self.root, collection_id)
+
+    def _disk_version(self, collection_id: str) -> Optional[int]:
+        """The latest persisted version, or None if there is no VERSION file."""
+        try:
+            with open(os.path.join(self._path(collection_id), VERSION_FILE), encoding="utf8") as f:
+                return int(f.read().strip())
+        except (OSError, ValueError):
+            return None
+
+    def _version_path(self, collection_id: str, version: Optional[int]) -> str:
+        path = self._path(collection_id)
+        # collections written before versioned directories keep their files at the top level
+        return path if version is None else os.path.join(path, f"v{version}")
+
+    def get(self, collection_id: str) -> Optional[Collection]:
+        """Return a collection, reloading it if it was evicted or changed on disk.
+
+        The registry lock only guards the in-memory lookup and install. A
+        load from disk runs outside it, once per collection version however
+        many requests want it, so a cold collection never stalls the others.
+        """
+        disk_version = self._disk_version(collection_id)
+        with self._lock:
+            collection = self._collections.get(collection_id)
+        stale = None
+        if collection is not None:
+            if disk_version is not None and disk_version > collection.version:
+                logger.info("Collection %s is at version %s on disk, reloading", collection_id, disk_version)
+                stale, collection = collection, None
+            elif disk_version is None and not read_meta(self._path(collection_id)):
+                # dropped by another worker
+                self._forget(collection_id, collection)
+                return None
+        if collection is None:
+            collection = self._load_once(collection_id, disk_version)
+            if collection is None:
+                self._forget(collection_id, stale)
+                return None
+        with self._lock:
+            resident = self._collections.get(collection_id)
+            if resident is not None and resident.version >= collection.version:
+                # installed meanwhile by a writer or another reload
+                collection = resident
+            self._collections[collection_id] = collection
+            self._collections.move_to_end(collection_id)
+            collection.touch()
+            self._evict()
+            return collection
+
+    def _forget(self, collection_id: str, collection: Optional[Collection]) -> None:
+        """Drop `collection` from memory unless another one replaced it meanwhile."""
+        with self._lock:
+            if self._collections.get(collection_id) is collection:
+                self._collections.pop(collection_id, None)
+
+    def _load_once(self, collection_id: str, version: Optional[int]) -> Optional[Collection]:
+        """`_load`, shared by every caller asking for the same version at once."""
+        key = (collection_id, version)
+        with self._lock:
+            flight = self._loading.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._loading[key] = Future()
+        if not leader:
+            return flight.result()
+        try:
+            collection = self._load(collection_id, version)
+        except BaseException as e:
+            flight.set_exception(e)
+            raise
+        else:
+            flight.set_result(collection)
+        finally:
+            with self._lock:
+                self._loading.pop(key, None)
+        return collection
+
+    def snapshot(self, collection_id: str) -> Optional[CollectionState]:
+        """The current state of a collection, consistent for the whole request."""
+        collection = self.get(collection_id)
+        return collection.snapshot() if collection is not None else None
+
+    def _load(self, collection_id: str, version: Optional[int]) -> Optional[Collection]:
+        path = self._version_path(collection_id, version)
+        meta = read_meta(path)
+        if not meta:
+            return None
+        try:
+            vectorstore = load_vectorstore(path, _embeddings_for(meta.get("embeddings", "")))
+            tune_index(vectorstore.index)
+        except Exception as e:
+            logger.warning("Failed to reload collection %s: %s", collection_id, e)
+            return None
+        logger.info("Reloaded collection %s from disk", collection_id)
+        return Collection(collection_id, vectorstore, meta.get("sources"), meta.get("version", 0))
+
+    @contextmanager
+    def _write_lock(self, collection_id: str) -> Iterator[None]:
+        """Exclusive writer access to one collection, across threads and processes."""
+        with self._lock:
+            lock = self._write_locks.setdefault(collection_id, threading.Lock())
+        with lock:
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(self.root, ".locks", f"{collection_id}.lock"), "a") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def add_file(self, collection_id: str, file_path: str, progress=None) -> Tuple[Collection, Dict[str, int]]:
+        """Index a file into the collection, creating it if needed; return (collection, changes).
+
+        A file whose name is already in the collection is treated as a new
+        revision: only chunks whose text is new are embedded, chunks that
+        disappeared are deleted and the rest stay as they are. `changes`
+        counts the added, removed and kept chunks.
+        """
+        source = os.path.basename(file_path)
+        current = self.get(collection_id)
+        if current is not None and source in current.sources:
+            result = self._update_file(collection_id, file_path, source, current.snapshot(), progress)
+            if result is not None:
+                return result
+            # the source was dropped while the revision was embedding; index it whole
+
+        vectorstore = load_file_to_vectorstore(file_path, progress=progress)
+        # counted now: merging into an existing collection empties the index
+        added = vectorstore.index.ntotal
+        if progress:
+            progress("indexing", added)
+        with self._write_lock(collection_id):
+            # picks up versions other workers wrote while this file was embedding
+            collection = self.get(collection_id)
+            removed = 0
+            if collection is None:
+                collection = Collection(collection_id, _relabel(vectorstore, source), [source], version=1)
+            else:
+                removed = collection.add(vectorstore, source)
+            self._store(collection)
+        self._invalidate_answers(collection_id)
+        return collection, {"added": added, "removed": removed, "kept": 0}
+
+    def _update_file(
+        self, collection_id: str, file_path: str, source: str, snapshot: CollectionState, progress=None
+    ) -> Optional[Tuple[Collection, Dict[str, int]]]:
+        """Re-ingest a new revision of `source` by chunk diff; None if the source is gone."""
+        if progress:
+            progress("loading", 0)
+        chunks = [chunk for batch in chunk_file(file_path, source) for chunk in batch]
+        if not chunks:
+            raise ValueError("No text could be extracted from the document.")
+        # the new chunks must share the collection's model, so no fallback here
+        embeddings = snapshot.vectorstore.embedding_function
+        with span("ingest.diff"):
+            diff = _diff_source(snapshot.vectorstore, source, chunks)
+        added = vectorstore_from_chunks(diff.added, embeddings, progress) if diff.added else None
+        if progress:
+            progress("indexing", len(chunks))
+
+        with self._write_lock(collection_id):
+            collection = self.get(collection_id)
+            if collection is None or source not in collection.sources:
+                return None
+            if collection.version != snapshot.version:
+                # another writer got in first; diff again, and the embedding
+                # cache serves the vectors computed above
+                diff = _diff_source(collection.vectorstore, source, chunks)
+                added = vectorstore_from_chunks(diff.added, embeddings) if diff.added else None
+            changed = collection.update_source(source, diff, added)
+            if changed:
+                self._store(collection)
+        if changed:
+            self._invalidate_answers(collection_id)
+        logger.info(
+            "Re-ingested %s into %s: %s added, %s removed, %s kept",
+            source, collection_id, len(diff.added), len(diff.removed), len(diff.kept),
+        )
+        return collection, {"added": len(diff.added), "removed": len(diff.removed), "kept": len(diff.kept)}
+
+    def _store(self, collection: Collection) -> None:
+        """Persist a collection's new version and make it the resident one; needs the write lock."""
+        self._persist(collection)
+        state = collection.snapshot()
+        if has_rescoring(state.vectorstore.index):
+            # serve the version just written memory-mapped, as the other
+            # workers do, so its float32 re-scoring vectors leave this heap
+            vectorstore = load_vectorstore(
+                self._version_path(collection.id, state.version), state.vectorstore.embedding_function
+            )
+            tune_index(vectorstore.index)
+            carry_over(state.vectorstore, vectorstore)
+            collection._install(vectorstore, list(state.sources), state.version)
+        with self._lock:
+            self._collections[collection.id] = collection
+            self._collections.move_to_end(collection.id)
+            self._evict()
+
+    def _invalidate_answers(self, collection_id: str) -> None:
+        answer_cache = get_answer_cache()
+        if answer_cache is not None:
+            answer_cache.invalidate(collection_id)
+
+    @timed("ingest.persist")
+    def _persist(self, collection: Collection) -> None:
+        """Write the collection's current version, then publish it via VERSION."""
+        state = collection.snapshot()
+        path = self._path(collection.id)
+        save_vectorstore(self._version_path(collection.id, state.version), state.vectorstore, {
+            "embeddings": collection.fingerprint,
+            "sources": list(state.sources),
+            "version": state.version,
+        })
+        tmp = os.path.join(path, f"{VERSION_FILE}.tmp-{os.getpid()}-{threading.get_ident()}")
+        with open(tmp, "w", encoding="utf8") as f:
+            f.write(str(state.version))
+        os.replace(tmp, os.path.join(path, VERSION_FILE))
+        self._prune_versions(collection.id, state.version)
+
+    def _prune_versions(self, collection_id: str, current: int) -> None:
+        path = self._path(collection_id)
+        for name in os.listdir(path):
+            full = os.path.join(path, name)
+            if name.startswith("v") and name[1:].isdigit() and int(name[1:]) <= current - KEEP_VERSIONS:
+                shutil.rmtree(full, ignore_errors=True)
+            elif os.path.isfile(full) and name != VERSION_FILE and ".tmp-" not in name:
+                # files of the pre-versioning layout
+                os.remove(full)
+
+    def drop(self, collection_id: str) -> bool:
+        """Forget a collection both in memory and on disk."""
+        self._invalidate_answers(collection_id)
+        with self._write_lock(collection_id):
+            with self._lock:
+                self._collections.pop(collection_id, None)
+            path = self._path(collection_id)
+            if not os.path.isdir(path):
+                return False
+            shutil.rmtree(path, ignore_errors=True)
+            return True
+
+    def _evict(self) -> None:
+        now = time.time()
+        for collection_id, collection in list(self._collections.items()):
+            too_many = len(self._collections) > self.max_resident
+            idle = now - collection.last_used > self.idle_seconds
+            if not (too_many or idle):
+                # ordered by last use, so everything after this is fresher
+                break
+            # already on disk via write-through, so dropping it is enough
+            del self._collections[collection_id]
+            logger.info("Evicted idle collection %s", collection_id)
+
+    def resident(self) -> List[str]:
+        with self._lock:
+            return list(self._collections)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> CollectionRegistry:
+    """Return the process-wide collection registry."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = CollectionRegistry()
+        return _registry
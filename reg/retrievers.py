@@ -0,0 +1,29 @@
+from typing import Any, List, Optional
+
+from langchain_core.retrievers import BaseRetriever
+
+from reg.federated import federated_search
+from reg.hybrid import hybrid_search
+
+
+class HybridRetriever(BaseRetriever):
+    """LangChain retriever over BM25 + FAISS with reciprocal rank fusion."""
+
+    vectorstore: Any
+    k: int = 5
+    fetch_k: Optional[int] = None
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None) -> List[Any]:
+        return [doc for doc, _ in hybrid_search(self.vectorstore, query, self.k, self.fetch_k)]
+
+
+class FederatedRetriever(BaseRetriever):
+    """LangChain retriever over a collection's per-source shards, optionally filtered by source."""
+
+    vectorstore: Any
+    k: int = 5
+    mode: str = "vector"
+    sources: Optional[List[str]] = None
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None) -> List[Any]:
+        return [doc for doc, _ in federated_search(self.vectorstore, query, self.k, self.sources, self.mode)]
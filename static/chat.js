@@ -145,22 +145,29 @@ function uploadFile(file) {
   progressDiv.style.display = "block";
   progressFill.style.width = "0%";
 
-  // Simulate progress
-  let progress = 0;
-  const progressInterval = setInterval(() => {
-    progress += Math.random() * 40;
-    if (progress > 90) progress = 90;
-    progressFill.style.width = progress + "%";
-  }, 200);
+  // Stage-based progress reported by the ingestion job
+  const stageProgress = {
+    queued: 5,
+    loading: 15,
+    splitting: 30,
+    embedding: 45,
+    indexing: 90,
+    done: 100,
+  };
 
   fetch("/upload", { method: "POST", body: formData })
     .then((res) => {
-      clearInterval(progressInterval);
-      progressFill.style.width = "100%";
-
       if (!res.ok) throw new Error(`HTTP ${res.status}`);
       return res.json();
     })
+    .then((job) => {
+      // Large files alternate splitting and embedding per batch; never move back
+      let shown = 0;
+      return pollJob(job.job_id, (status) => {
+        shown = Math.max(shown, stageProgress[status.stage] || 0);
+        progressFill.style.width = shown + "%";
+      });
+    })
     .then((data) => {
       setTimeout(() => {
         progressDiv.style.display = "none";
@@ -192,7 +199,6 @@ function uploadFile(file) {
       fileInput.value = "";
     })
     .catch((err) => {
-      clearInterval(progressInterval);
       progressDiv.style.display = "none";
       addChatMessage("Error", err.message, "bot", true);
       showToast("Upload failed: " + err.message, "error");
@@ -200,6 +206,23 @@ function uploadFile(file) {
     });
 }
 
+// Poll an ingestion job until it finishes; resolves with the job result
+async function pollJob(jobId, onStatus, interval = 500) {
+  while (true) {
+    const res = await fetch(`/jobs/${jobId}`);
+    const status = await res.json().catch(() => ({}));
+    if (!res.ok) throw new Error(status.error || `HTTP ${res.status}`);
+
+    onStatus(status);
+    if (status.stage === "failed") {
+      throw new Error(status.error || "Processing failed");
+    }
+    if (status.done) return status.result;
+
+    await new Promise((r) => setTimeout(r, interval));
+  }
+}
+
 // ==================== MARKDOWN TO HTML CONVERSION ====================
 function markdownToHtml(text) {
   // Escape HTML special characters first (except for formatting we'll add)
@@ -341,6 +364,13 @@ async function sendMsg() {
   // Show typing indicator
   const typingId = showTyping();
 
+  // Prefer streaming; fall back to the blocking endpoint if it is unavailable
+  try {
+    if (await streamChat(msg, typingId)) return;
+  } catch (err) {
+    console.warn("Streaming failed, falling back to /chat:", err);
+  }
+
   // Retry logic with exponential backoff
   const maxRetries = 3;
   let attempt = 0;
@@ -394,6 +424,69 @@ async function sendMsg() {
   );
 }
 
+// Stream an answer from /chat/stream, rendering tokens as they arrive.
+// Resolves false (without rendering anything) when streaming is unavailable.
+async function streamChat(msg, typingId) {
+  const res = await fetch("/chat/stream", {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ message: msg }),
+  });
+  if (!res.ok || !res.body) return false;
+
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  let answer = "";
+  let bubble = null;
+
+  const render = () => {
+    if (!bubble) {
+      removeTyping(typingId);
+      addChatMessage("AI", "", "bot");
+      const chat = document.getElementById("chat");
+      bubble = chat.lastElementChild.querySelector(".msg-bubble");
+    }
+    bubble.innerHTML =
+      '<strong class="msg-sender">AI</strong>' + markdownToHtml(answer);
+    const chat = document.getElementById("chat");
+    chat.scrollTop = chat.scrollHeight;
+  };
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    // SSE events are separated by a blank line
+    let sep;
+    while ((sep = buffer.indexOf("\n\n")) !== -1) {
+      const raw = buffer.slice(0, sep);
+      buffer = buffer.slice(sep + 2);
+
+      let event = "message";
+      let data = "";
+      raw.split("\n").forEach((line) => {
+        if (line.startsWith("event: ")) event = line.slice(7);
+        else if (line.startsWith("data: ")) data += line.slice(6);
+      });
+      const payload = data ? JSON.parse(data) : null;
+
+      if (event === "token") {
+        answer += payload;
+        render();
+      } else if (event === "error") {
+        if (!answer) return false;
+        // keep the partial answer rather than asking again
+        showToast("Response interrupted: " + (payload.detail || payload.error), "error");
+        return true;
+      }
+    }
+  }
+
+  return answer.length > 0;
+}
+
 function showTyping() {
   const chat = document.getElementById("chat");
   const id = `typing-${Date.now()}`;
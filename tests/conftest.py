@@ -0,0 +1,16 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(autouse=True, scope="session")
+def workdir(tmp_path_factory):
+    """Run in a scratch directory with local embeddings, so nothing under data/ is touched."""
+    patch = pytest.MonkeyPatch()
+    patch.chdir(tmp_path_factory.mktemp("work"))
+    patch.setenv("EMBEDDINGS_PROVIDER", "basic")
+    yield
+    patch.undo()
@@ -0,0 +1,72 @@
+import types
+
+import reg.answer_cache
+from reg.answer_cache import AnswerCache
+
+# Questions as unit vectors: the first two are near-duplicates, the third is not
+VECTORS = {
+    "what is the warranty period": [1.0, 0.0, 0.0],
+    "how long is the warranty": [0.99, 0.14, 0.0],
+    "who makes the pump": [0.0, 0.0, 1.0],
+}
+
+
+def embed(query):
+    return VECTORS[query]
+
+
+def test_exact_hits_ignore_case_and_trailing_punctuation():
+    cache = AnswerCache(max_entries=8, ttl=0, threshold=1.1)
+    cache.put("docs", 1, "What is the warranty period?", "24 months")
+
+    assert cache.lookup("docs", 1, "what is the  warranty period")[0] == "24 months"
+    assert cache.lookup("other", 1, "what is the warranty period")[0] is None
+
+
+def test_a_new_collection_version_never_serves_older_answers():
+    cache = AnswerCache(max_entries=8, ttl=0)
+    _, vector = cache.lookup("docs", 1, "what is the warranty period", embed)
+    cache.put("docs", 1, "what is the warranty period", "24 months", vector)
+
+    assert cache.lookup("docs", 2, "what is the warranty period", embed)[0] is None
+    assert cache.invalidate("docs") == 1
+    assert cache.lookup("docs", 1, "what is the warranty period", embed)[0] is None
+
+
+def test_entries_expire_after_the_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(reg.answer_cache, "time", types.SimpleNamespace(time=lambda: now[0]))
+    cache = AnswerCache(max_entries=8, ttl=60)
+    cache.put("docs", 1, "what is the warranty period", "24 months")
+
+    now[0] += 59
+    assert cache.lookup("docs", 1, "what is the warranty period")[0] == "24 months"
+    now[0] += 2
+    assert cache.lookup("docs", 1, "what is the warranty period")[0] is None
+
+
+def test_similar_questions_hit_only_above_the_threshold():
+    cache = AnswerCache(max_entries=8, ttl=0, threshold=0.95)
+    _, vector = cache.lookup("docs", 1, "what is the warranty period", embed)
+    cache.put("docs", 1, "what is the warranty period", "24 months", vector)
+
+    assert cache.lookup("docs", 1, "how long is the warranty", embed)[0] == "24 months"
+    assert cache.lookup("docs", 1, "who makes the pump", embed)[0] is None
+    assert (cache.counts["semantic_hits"], cache.counts["misses"]) == (1, 2)
+
+    strict = AnswerCache(max_entries=8, ttl=0, threshold=0.999)
+    strict.put("docs", 1, "what is the warranty period", "24 months", vector)
+    assert strict.lookup("docs", 1, "how long is the warranty", embed)[0] is None
+
+
+def test_the_least_recently_used_answer_is_evicted():
+    cache = AnswerCache(max_entries=2, ttl=0, threshold=1.1)
+    cache.put("docs", 1, "first", "1")
+    cache.put("docs", 1, "second", "2")
+    assert cache.lookup("docs", 1, "first")[0] == "1"
+    cache.put("docs", 1, "third", "3")
+
+    assert cache.lookup("docs", 1, "second")[0] is None
+    assert cache.lookup("docs", 1, "first")[0] == "1"
+    assert cache.lookup("docs", 1, "third")[0] == "3"
+    assert cache.counts["evictions"] == 1
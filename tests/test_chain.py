@@ -0,0 +1,121 @@
+import types
+import threading
+
+import pytest
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from reg.chain import ASSISTANT_REPLY, GREETING_REPLY, OWNER_REPLY, QAWithSources, SimpleQAChain, route_query
+from reg.embeddings import BasicEmbeddings
+from reg.hybrid import build_bm25
+from reg.latency import hedged_call
+
+
+@pytest.fixture(scope="module")
+def vectorstore():
+    texts = [
+        "To change the name on your account, open Settings and edit the profile.",
+        "My friend name is Sudip. He keeps the spare keys.",
+        "The warranty period is 24 months from delivery.",
+    ]
+    store = FAISS.from_texts(texts, BasicEmbeddings(), metadatas=[{"source": "notes.txt"}] * len(texts))
+    store._bm25 = build_bm25(store)
+    return store
+
+
+@pytest.mark.parametrize("query, intent, reply", [
+    ("What is my name?", "personal", OWNER_REPLY),
+    ("who are you", "assistant", ASSISTANT_REPLY),
+    ("hello", "casual", GREETING_REPLY),
+])
+def test_whole_message_trivial_questions_are_routed(query, intent, reply):
+    chain = types.SimpleNamespace(vectorstore=None, llm=object())
+    assert route_query(chain, query) == (reply, {"degraded": False, "intent": intent})
+
+
+def test_friend_name_is_found_in_the_documents(vectorstore):
+    chain = types.SimpleNamespace(vectorstore=vectorstore, llm=object())
+    assert route_query(chain, "What's my friend's name?")[0] == "Your friend's name is Sudip."
+
+
+@pytest.mark.parametrize("query", [
+    "How do I change my name on the account?",
+    "What is your name and what does the warranty cover?",
+    "Does my friend get the warranty too?",
+    "Tell me about Krish's warranty claim",
+])
+def test_questions_that_mention_an_identity_go_to_the_chain(vectorstore, query):
+    chain = types.SimpleNamespace(vectorstore=vectorstore, llm=object())
+    assert route_query(chain, query) is None
+
+
+def test_simple_chain_answers_a_mentioned_name_from_the_documents(vectorstore):
+    answer = SimpleQAChain(vectorstore).run("How do I change my name on the account?")
+    assert "Settings" in answer
+
+
+class FailingLLM:
+    def __init__(self):
+        self.calls = 0
+
+    def invoke(self, prompt):
+        self.calls += 1
+        raise RuntimeError("LLM unavailable")
+
+    def stream(self, prompt):
+        self.calls += 1
+        raise RuntimeError("LLM unavailable")
+
+
+class CountingRetriever:
+    def __init__(self, docs):
+        self.docs = docs
+        self.calls = 0
+
+    def get_relevant_documents(self, query):
+        self.calls += 1
+        return list(self.docs)
+
+
+class NoSearch:
+    """A vectorstore the fallback must not search."""
+
+    def __getattr__(self, name):
+        raise AssertionError(f"fallback searched the vectorstore ({name})")
+
+
+@pytest.fixture
+def degrading_chain():
+    docs = [Document(page_content="The warranty period is 24 months.", metadata={"source": "terms.pdf"})]
+    return QAWithSources(FailingLLM(), CountingRetriever(docs), SimpleQAChain(NoSearch()))
+
+
+def test_a_failed_llm_degrades_to_the_chunks_already_retrieved(degrading_chain):
+    text, info = degrading_chain.answer("how long is the warranty?")
+
+    assert info["degraded"] is True
+    assert text.startswith("The warranty period is 24 months.") and "[Source: terms.pdf]" in text
+    assert degrading_chain.retriever.calls == 1
+
+
+def test_a_spent_budget_degrades_without_calling_the_llm(degrading_chain):
+    text, info = degrading_chain.answer_from_docs("how long is the warranty?", degrading_chain.retriever.docs, budget=0)
+
+    assert info["degraded"] is True
+    assert degrading_chain.llm.calls == 0
+    assert text.startswith("The warranty period is 24 months.")
+
+
+def test_a_failed_stream_falls_back_to_the_same_chunks(degrading_chain):
+    events = list(degrading_chain.stream("how long is the warranty?"))
+
+    assert [kind for kind, _ in events] == ["retrieval", "fallback", "token"]
+    assert events[-1][1].startswith("The warranty period is 24 months.")
+    assert degrading_chain.retriever.calls == 1
+
+
+def test_hedged_call_with_no_time_left_never_calls():
+    called = threading.Event()
+    with pytest.raises(TimeoutError):
+        hedged_call(called.set, timeout=0.0, hedge_after=1.0)
+    assert not called.wait(0.2)
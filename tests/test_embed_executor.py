@@ -0,0 +1,98 @@
+import time
+import types
+import threading
+
+import pytest
+
+from reg.embed_executor import EmbeddingError, EmbeddingExecutor
+
+
+class APIError(Exception):
+    """Looks like an OpenAI SDK status error to the executor."""
+
+    def __init__(self, status_code, retry_after=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        headers = {} if retry_after is None else {"retry-after": str(retry_after)}
+        self.response = types.SimpleNamespace(status_code=status_code, headers=headers)
+
+
+class FlakyEmbeddings:
+    """Fails calls with `errors` in order (None lets one through), then embeds text as [len, index]."""
+
+    model = "flaky-test"
+
+    def __init__(self, errors=(), latency=0.0):
+        self.errors = list(errors)
+        self.latency = latency
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        with self._lock:
+            self.calls.append((time.monotonic(), list(texts)))
+            error = self.errors.pop(0) if self.errors else None
+        if error is not None:
+            raise error
+        time.sleep(self.latency)
+        return [[float(len(t)), float(t.split()[-1])] for t in texts]
+
+
+def texts(prefix, n):
+    return [f"{prefix} {i}" for i in range(n)]
+
+
+def expected(items):
+    return [[float(len(t)), float(t.split()[-1])] for t in items]
+
+
+def test_rate_limits_and_server_errors_are_retried():
+    items = texts("retried", 5)
+    remote = FlakyEmbeddings([APIError(429), APIError(503)])
+    executor = EmbeddingExecutor(remote, batch_size=2, max_concurrency=1, max_retries=3, base_delay=0.001)
+
+    assert executor.embed(items) == expected(items)
+    assert executor.stats["retries"] == 2
+    # three batches, the first sent three times
+    assert len(remote.calls) == 5
+
+
+def test_client_errors_are_not_retried():
+    remote = FlakyEmbeddings([APIError(400)])
+    executor = EmbeddingExecutor(remote, batch_size=8, max_concurrency=1, max_retries=3, base_delay=0.001)
+
+    with pytest.raises(EmbeddingError) as raised:
+        executor.embed(texts("rejected", 3))
+    assert raised.value.completed == 0
+    assert len(remote.calls) == 1
+
+
+def test_a_rate_limit_pauses_every_worker():
+    items = texts("paused", 6)
+    remote = FlakyEmbeddings([APIError(429, retry_after=0.3)], latency=0.05)
+    executor = EmbeddingExecutor(remote, batch_size=2, max_concurrency=2, max_retries=2)
+
+    assert executor.embed(items) == expected(items)
+    limited_at = remote.calls[0][0]
+    # the other worker's first batch may already be in flight; nothing after
+    # it is sent before Retry-After has passed
+    assert len(remote.calls) == 4
+    assert all(at - limited_at >= 0.29 for at, _ in remote.calls[2:])
+
+
+def test_a_failed_embedding_resumes_from_its_checkpoint():
+    items = texts("resumed", 6)
+    # the first batch succeeds, the second fails for good
+    remote = FlakyEmbeddings([None, APIError(500)])
+    executor = EmbeddingExecutor(remote, batch_size=2, max_concurrency=1, max_retries=0)
+
+    with pytest.raises(EmbeddingError) as raised:
+        executor.embed(items)
+    completed = raised.value.completed
+    assert completed >= 2
+    sent_before = len(remote.calls)
+
+    assert executor.embed(items) == expected(items)
+    resent = [t for _, batch in remote.calls[sent_before:] for t in batch]
+    assert not set(items[:2]) & set(resent)
+    assert len(resent) == len(items) - completed
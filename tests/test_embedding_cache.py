@@ -0,0 +1,136 @@
+import time
+import types
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from reg.batch import embed_queries
+from reg.embedding_cache import CachedEmbeddings, EmbeddingCache, QueryEmbedder, text_hash
+from reg.metrics import QUERY_EMBEDDINGS
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+def shared_count():
+    return QUERY_EMBEDDINGS.samples().get(("shared",), 0.0)
+
+
+class RemoteEmbeddings:
+    """Records each embed_documents call; the first one blocks until `release` is set."""
+
+    def __init__(self, error=None):
+        self.calls = []
+        self.error = error
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        if len(self.calls) == 1:
+            self.started.set()
+            assert self.release.wait(5)
+        if self.error is not None:
+            raise self.error
+        return [[float(len(t)), 1.0] for t in texts]
+
+
+def test_concurrent_queries_share_one_call_while_another_is_in_flight():
+    remote = RemoteEmbeddings()
+    embedder = QueryEmbedder(remote, window=5.0, max_batch=4, cache_size=16)
+    queries = ["a", "bb", "ccc", "dddd", "bb "]
+    with ThreadPoolExecutor(len(queries)) as pool:
+        first = pool.submit(embedder.embed, "first")
+        assert remote.started.wait(5)
+        # "bb " normalizes to "bb", so the two share one slot and the
+        # batch of four distinct queries is sent without waiting out the window
+        rest = [pool.submit(embedder.embed, q) for q in queries]
+        wait_for(lambda: len(remote.calls) == 2)
+        remote.release.set()
+        assert first.result() == [5.0, 1.0]
+        assert [f.result() for f in rest] == [[1.0, 1.0], [2.0, 1.0], [3.0, 1.0], [4.0, 1.0], [2.0, 1.0]]
+
+    assert remote.calls[0] == ["first"]
+    assert sorted(remote.calls[1]) == ["a", "bb", "ccc", "dddd"]
+    assert len(remote.calls) == 2
+    # recent queries are answered from memory
+    assert embedder.embed("ccc") == [3.0, 1.0]
+    assert len(remote.calls) == 2
+
+
+def test_a_failed_call_reaches_every_waiter_and_is_not_cached():
+    remote = RemoteEmbeddings(error=RuntimeError("rate limited"))
+    embedder = QueryEmbedder(remote, window=0.0, max_batch=8, cache_size=16)
+    with ThreadPoolExecutor(2) as pool:
+        first = pool.submit(embedder.embed, "warranty")
+        assert remote.started.wait(5)
+        before = shared_count()
+        shared = pool.submit(embedder.embed, "warranty")
+        wait_for(lambda: shared_count() > before)
+        remote.release.set()
+        for future in (first, shared):
+            with pytest.raises(RuntimeError, match="rate limited"):
+                future.result()
+
+    assert remote.calls == [["warranty"]]
+    remote.error = None
+    assert embedder.embed("warranty") == [8.0, 1.0]
+    assert remote.calls == [["warranty"], ["warranty"]]
+
+
+class CountingEmbeddings:
+    model = "counting-test"
+
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(t)), 1.0] for t in texts]
+
+
+def test_batch_questions_stay_out_of_the_chunk_cache(tmp_path):
+    remote = CountingEmbeddings()
+    chunks = EmbeddingCache(str(tmp_path / "chunks.sqlite3"))
+    vectorstore = types.SimpleNamespace(embedding_function=CachedEmbeddings(remote, chunks))
+    questions = ["how long is the warranty", "who makes the pump", "how long is the  warranty"]
+
+    assert embed_queries(vectorstore, questions) == [[24.0, 1.0], [18.0, 1.0], [24.0, 1.0]]
+    assert remote.calls == [questions[:2]]
+    assert chunks.get_many(remote.model, 0, [text_hash(q) for q in questions]) == {}
+    # answered from the query embedder's memory
+    assert embed_queries(vectorstore, questions[:2]) == [[24.0, 1.0], [18.0, 1.0]]
+    assert len(remote.calls) == 1
+
+
+class Secret(str):
+    def get_secret_value(self):
+        return str(self)
+
+
+class EndpointEmbeddings(CountingEmbeddings):
+    model = "endpoint-test"
+
+    def __init__(self, base, key):
+        super().__init__()
+        self.openai_api_base = base
+        self.openai_api_key = Secret(key)
+
+
+def test_clients_with_other_credentials_or_base_urls_get_their_own_query_embedder():
+    first = EndpointEmbeddings("https://one.example/v1", "key-1")
+    other_key = EndpointEmbeddings("https://one.example/v1", "key-2")
+    other_base = EndpointEmbeddings("https://two.example/v1", "key-1")
+    same = EndpointEmbeddings("https://one.example/v1", "key-1")
+
+    for embeddings in (first, other_key, other_base, same):
+        assert CachedEmbeddings(embeddings, None).embed_query("who makes the pump") == [18.0, 1.0]
+
+    assert first.calls == other_key.calls == other_base.calls == [["who makes the pump"]]
+    # the same endpoint and key share the first client's embedder and its memory
+    assert same.calls == []
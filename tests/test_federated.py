@@ -0,0 +1,107 @@
+import faiss
+import numpy as np
+import pytest
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from reg.embeddings import BasicEmbeddings
+from reg.federated import FederatedIndex, federated_search, get_federated
+from reg.hybrid import build_bm25
+from reg.registry import CollectionRegistry
+
+DIM = 32
+K = 8
+# uneven shards; the smallest holds fewer chunks than K
+SOURCES = {"pumps.txt": ("impeller", 40), "valves.txt": ("spindle", 25), "seals.txt": ("gasket", 5)}
+
+
+@pytest.fixture
+def vectorstore(monkeypatch):
+    monkeypatch.setenv("INDEX_QUANT", "none")
+    monkeypatch.setenv("INDEX_DIM", "0")
+    rng = np.random.default_rng(0)
+    docs = [
+        Document(page_content=f"{word} part {i}", metadata={"source": source})
+        for source, (word, n) in SOURCES.items() for i in range(n)
+    ]
+    order = rng.permutation(len(docs))
+    ids = [f"chunk-{i}" for i in range(len(docs))]
+    index = faiss.IndexFlatL2(DIM)
+    index.add(rng.standard_normal((len(docs), DIM)).astype(np.float32))
+    store = FAISS(BasicEmbeddings(dim=DIM), index, InMemoryDocstore({ids[i]: docs[j] for i, j in enumerate(order)}), dict(enumerate(ids)))
+    store._bm25 = build_bm25(store)
+    return store
+
+
+@pytest.fixture
+def queries():
+    return np.random.default_rng(1).standard_normal((20, DIM)).astype(np.float32)
+
+
+def source_of(vectorstore, doc_id):
+    return vectorstore.docstore.search(doc_id).metadata["source"]
+
+
+def test_merged_shards_rank_like_a_single_index(vectorstore, queries):
+    federated = FederatedIndex.from_vectorstore(vectorstore)
+    assert sorted(federated.shards) == sorted(SOURCES)
+    assert len(federated) == vectorstore.index.ntotal
+
+    distances, rows = vectorstore.index.search(queries, K)
+    for query, row_d, row_i in zip(queries, distances, rows):
+        hits = federated.search_vector(query, K)
+        assert [doc_id for doc_id, _ in hits] == [vectorstore.index_to_docstore_id[i] for i in row_i]
+        np.testing.assert_allclose([score for _, score in hits], 1.0 / (1.0 + row_d), rtol=1e-5)
+
+
+def test_a_source_filter_searches_only_those_shards(vectorstore, queries):
+    federated = FederatedIndex.from_vectorstore(vectorstore)
+    valves = [i for i, doc_id in vectorstore.index_to_docstore_id.items() if source_of(vectorstore, doc_id) == "valves.txt"]
+    exact = faiss.IndexFlatL2(DIM)
+    exact.add(vectorstore.index.reconstruct_batch(np.array(valves)))
+
+    _, rows = exact.search(queries, K)
+    for query, row in zip(queries, rows):
+        hits = federated.search_vector(query, K, sources=["valves.txt"])
+        assert [doc_id for doc_id, _ in hits] == [vectorstore.index_to_docstore_id[valves[i]] for i in row]
+    assert federated.search_vector(queries[0], K, sources=["missing.txt"]) == []
+
+    # hybrid mode keeps BM25 to the same sources: the pump keyword finds no pumps
+    hits = federated.search_ids("impeller part", K, sources=["valves.txt", "seals.txt"], mode="hybrid")
+    assert len(hits) == K
+    assert {source_of(vectorstore, doc_id) for doc_id, _ in hits} <= {"valves.txt", "seals.txt"}
+    unfiltered = federated.search_ids("impeller part", K, mode="hybrid")
+    assert {source_of(vectorstore, doc_id) for doc_id, _ in unfiltered} == {"pumps.txt"}
+
+
+def write_sections(path, names):
+    path.write_text("\n\n".join(f"Section {name}. " + f"{name} notes " * 70 for name in names))
+    return str(path)
+
+
+def section_names(docs):
+    return {doc.page_content.split(".")[0] for doc in docs}
+
+
+def test_an_update_reuses_unchanged_shards_and_rebuilds_the_edited_source(tmp_path):
+    registry = CollectionRegistry(root=str(tmp_path / "collections"))
+    registry.add_file("docs", write_sections(tmp_path / "pumps.txt", ["impeller", "casing", "gasket"]))
+    collection, _ = registry.add_file("docs", write_sections(tmp_path / "valves.txt", ["spindle", "bonnet"]))
+    before = get_federated(collection.snapshot().vectorstore)
+
+    _, changes = registry.add_file("docs", write_sections(tmp_path / "pumps.txt", ["impeller", "casing", "seal"]))
+    vectorstore = collection.snapshot().vectorstore
+    # carried over by the update, not split again on the next search
+    after = vectorstore._federated
+
+    assert changes == {"added": 1, "removed": 1, "kept": 2}
+    assert after.shards["valves.txt"] is before.shards["valves.txt"]
+    assert after.shards["pumps.txt"] is not before.shards["pumps.txt"]
+    pumps = [vectorstore.docstore.search(doc_id) for doc_id in after.shards["pumps.txt"].ids]
+    assert section_names(pumps) == {"Section impeller", "Section casing", "Section seal"}
+
+    doc, _ = federated_search(vectorstore, "seal notes", 1, sources=["pumps.txt"], mode="vector")[0]
+    assert doc.page_content.startswith("Section seal")
+    hits = federated_search(vectorstore, "gasket notes", 5, mode="hybrid")
+    assert "Section gasket" not in section_names(doc for doc, _ in hits)
@@ -0,0 +1,131 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from reg.hybrid import get_bm25
+from reg.registry import CollectionRegistry
+
+
+def write_doc(path, topic):
+    path.write_text("\n\n".join(f"{topic} paragraph {i}. " + f"{topic} notes " * 40 for i in range(6)))
+    return str(path)
+
+
+def test_add_file_counts_chunks_merged_into_existing_collection(tmp_path):
+    registry = CollectionRegistry(root=str(tmp_path / "collections"))
+    _, first = registry.add_file("docs", write_doc(tmp_path / "pumps.txt", "pump"))
+    collection, second = registry.add_file("docs", write_doc(tmp_path / "valves.txt", "valve"))
+
+    assert first["added"] > 0
+    assert second["added"] > 0
+    assert (second["removed"], second["kept"]) == (0, 0)
+    assert collection.snapshot().vectorstore.index.ntotal == first["added"] + second["added"]
+
+
+def test_add_file_counts_cached_index_merged_into_another_collection(tmp_path):
+    registry = CollectionRegistry(root=str(tmp_path / "collections"))
+    seals = write_doc(tmp_path / "seals.txt", "seal")
+    _, first = registry.add_file("one", seals)
+    registry.add_file("two", write_doc(tmp_path / "rotors.txt", "rotor"))
+    # the index built for "one" is served from the index cache here
+    _, again = registry.add_file("two", seals)
+
+    assert again["added"] == first["added"] > 0
+
+
+def test_a_cold_load_does_not_block_other_collections(tmp_path, monkeypatch):
+    root = str(tmp_path / "collections")
+    writer = CollectionRegistry(root=root)
+    writer.add_file("cold", write_doc(tmp_path / "cold.txt", "cold"))
+    writer.add_file("warm", write_doc(tmp_path / "warm.txt", "warm"))
+
+    registry = CollectionRegistry(root=root)
+    assert registry.get("warm") is not None
+    loading, release = threading.Event(), threading.Event()
+    load = registry._load
+    calls = []
+
+    def slow_load(collection_id, version):
+        calls.append(collection_id)
+        loading.set()
+        assert release.wait(5)
+        return load(collection_id, version)
+
+    monkeypatch.setattr(registry, "_load", slow_load)
+    with ThreadPoolExecutor(2) as pool:
+        cold = [pool.submit(registry.get, "cold") for _ in range(2)]
+        assert loading.wait(5)
+        # served while "cold" is still being read from disk
+        assert registry.get("warm").id == "warm"
+        release.set()
+        first, second = (f.result(5) for f in cold)
+
+    assert first is second
+    assert calls == ["cold"]
+
+
+def write_sections(path, names):
+    """One ~900 character section per name, so each becomes its own chunk."""
+    path.write_text("\n\n".join(f"Section {name}. " + "filler words " * 70 for name in names))
+    return str(path)
+
+
+def source_texts(vectorstore, source):
+    docs = [vectorstore.docstore.search(d) for d in vectorstore.index_to_docstore_id.values()]
+    return sorted(d.page_content.split(".")[0] for d in docs if d.metadata["source"] == source)
+
+
+def test_an_edited_file_is_reingested_by_chunk_diff(tmp_path):
+    registry = CollectionRegistry(root=str(tmp_path / "collections"))
+    registry.add_file("docs", write_doc(tmp_path / "valves.txt", "valve"))
+    manual = tmp_path / "manual.txt"
+    registry.add_file("docs", write_sections(manual, ["alpha", "bravo", "charlie", "delta", "echo"]))
+    before = registry.get("docs").snapshot()
+    valve_ids = [i for i, d in before.vectorstore.docstore._dict.items() if d.metadata["source"] == "valves.txt"]
+
+    # "charlie" is rewritten, "echo" dropped and "foxtrot" added
+    collection, changes = registry.add_file("docs", write_sections(manual, ["alpha", "bravo", "chorus", "delta", "foxtrot"]))
+    after = collection.snapshot()
+
+    assert changes == {"added": 2, "removed": 2, "kept": 3}
+    assert after.version == before.version + 1
+    assert source_texts(after.vectorstore, "manual.txt") == [
+        "Section alpha", "Section bravo", "Section chorus", "Section delta", "Section foxtrot",
+    ]
+    assert after.vectorstore.index.ntotal == before.vectorstore.index.ntotal
+    assert sorted(after.vectorstore.index_to_docstore_id.values()) == sorted(after.vectorstore.docstore._dict)
+
+    bm25 = get_bm25(after.vectorstore)
+    assert len(bm25) == after.vectorstore.index.ntotal
+    assert bm25.search("charlie echo", 5) == []
+    assert {doc_id for doc_id, _ in bm25.search("chorus foxtrot", 5)} == {
+        i for i, d in after.vectorstore.docstore._dict.items() if d.page_content.startswith(("Section chorus", "Section foxtrot"))
+    }
+    # the other file is untouched
+    assert all(after.vectorstore.docstore.search(i).metadata["source"] == "valves.txt" for i in valve_ids)
+    assert source_texts(after.vectorstore, "valves.txt") == source_texts(before.vectorstore, "valves.txt")
+
+
+def test_an_identical_reupload_changes_nothing(tmp_path):
+    registry = CollectionRegistry(root=str(tmp_path / "collections"))
+    manual = write_sections(tmp_path / "manual.txt", ["alpha", "bravo", "charlie"])
+    _, first = registry.add_file("docs", manual)
+    version = registry.get("docs").version
+
+    collection, again = registry.add_file("docs", manual)
+
+    assert again == {"added": 0, "removed": 0, "kept": first["added"]}
+    assert collection.version == version
+
+
+def test_keyword_index_is_frozen_before_it_is_served(tmp_path):
+    root = str(tmp_path / "collections")
+    writer = CollectionRegistry(root=root)
+    writer.add_file("docs", write_doc(tmp_path / "pumps.txt", "pump"))
+    collection, _ = writer.add_file("docs", write_doc(tmp_path / "valves.txt", "valve"))
+    assert get_bm25(collection.snapshot().vectorstore)._frozen is not None
+
+    # pickled without its arrays; loading the collection rebuilds them
+    loaded = CollectionRegistry(root=root).get("docs")
+    bm25 = get_bm25(loaded.snapshot().vectorstore)
+    assert bm25._frozen is not None
+    assert bm25.search("valve notes", 1)
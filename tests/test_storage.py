@@ -0,0 +1,92 @@
+import faiss
+import numpy as np
+import pytest
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from reg.embeddings import BasicEmbeddings
+from reg.index_store import load_vectorstore, read_meta, save_vectorstore
+from reg.loader import build_index, has_rescoring
+from reg.registry import CollectionRegistry
+
+DIM = 64
+K = 10
+
+# (INDEX_QUANT, INDEX_DIM, lowest recall@10 against exact search); the
+# re-scoring stage only sees candidates the truncated vectors ranked
+STORAGE_MODES = [("fp16", "0", 0.99), ("int8", "0", 0.99), ("none", "32", 0.85), ("int8", "32", 0.85)]
+
+
+def clustered_vectors(n, rng):
+    """Unit vectors with low intrinsic dimension, whose leading dimensions carry most of the signal."""
+    latent = rng.standard_normal((n, 8)).astype(np.float32)
+    scale = np.linspace(2.0, 0.2, DIM, dtype=np.float32)
+    vectors = latent @ rng.standard_normal((8, DIM)).astype(np.float32) * scale
+    vectors += 0.05 * rng.standard_normal((n, DIM)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    rng = np.random.default_rng(0)
+    vectors = clustered_vectors(3000, rng)
+    queries = clustered_vectors(50, rng)
+    _, truth = _exact(vectors).search(queries, K)
+    return vectors, queries, truth
+
+
+def _exact(vectors):
+    index = faiss.IndexFlatL2(DIM)
+    index.add(vectors)
+    return index
+
+
+def recall(found, truth):
+    return np.mean([len(set(f) & set(t)) / K for f, t in zip(found, truth)])
+
+
+@pytest.mark.parametrize("quant, dim, min_recall", STORAGE_MODES)
+def test_compressed_index_survives_save_and_memory_mapped_load(tmp_path, monkeypatch, corpus, quant, dim, min_recall):
+    monkeypatch.setenv("INDEX_QUANT", quant)
+    monkeypatch.setenv("INDEX_DIM", dim)
+    vectors, queries, truth = corpus
+    index = build_index(vectors)
+    index.add(vectors)
+    ids = [f"chunk-{i}" for i in range(len(vectors))]
+    docstore = InMemoryDocstore({doc_id: Document(page_content=doc_id) for doc_id in ids})
+    vectorstore = FAISS(BasicEmbeddings(dim=DIM), index, docstore, dict(enumerate(ids)))
+    assert has_rescoring(index)
+
+    path = str(tmp_path / "index")
+    save_vectorstore(path, vectorstore)
+    loaded = load_vectorstore(path, BasicEmbeddings(dim=DIM))
+
+    assert read_meta(path)["rescoring"] is True
+    assert loaded._mmapped and has_rescoring(loaded.index)
+    assert loaded.index.ntotal == len(vectors)
+    _, before = index.search(queries, K)
+    _, after = loaded.index.search(queries, K)
+    np.testing.assert_array_equal(before, after)
+    assert recall(after, truth) >= min_recall
+
+
+def write_sections(path, names):
+    path.write_text("\n\n".join(f"Section {name}. " + f"{name} notes " * 70 for name in names))
+    return str(path)
+
+
+@pytest.mark.parametrize("quant", ["fp16", "int8"])
+def test_registry_serves_compressed_collections_memory_mapped(tmp_path, monkeypatch, quant):
+    monkeypatch.setenv("INDEX_QUANT", quant)
+    registry = CollectionRegistry(root=str(tmp_path / "collections"))
+    registry.add_file("docs", write_sections(tmp_path / "pumps.txt", ["impeller", "casing", "gasket"]))
+    collection, changes = registry.add_file("docs", write_sections(tmp_path / "valves.txt", ["spindle", "bonnet"]))
+    vectorstore = collection.snapshot().vectorstore
+
+    # _store reloads the version it wrote, so the float32 vectors are mapped
+    assert changes["added"] == 2
+    assert vectorstore._mmapped and has_rescoring(vectorstore.index)
+    assert vectorstore.index.ntotal == 5
+    doc, _ = vectorstore.similarity_search_with_score("spindle notes", k=1)[0]
+    assert doc.page_content.startswith("Section spindle")